@@ -12,9 +12,19 @@ class Settings(BaseSettings):
         Path(__file__).resolve().parent.parent / "dashboard.db"
     )
 
+    # How list changes are applied: cli (the pihole command), gravity
+    # (direct gravity.db writes, then a signal to FTL) or api (Pi-hole v6
+    # REST API; needs httpx)
+    pihole_backend: str = "cli"
+    ftl_pid_file: str = "/run/pihole-FTL.pid"
+    pihole_api_url: str = "http://localhost"
+    pihole_api_password: str = ""
+
     # Pi-hole CLI
     pihole_command: str = "pihole"
     use_sudo: bool = True
+    # List reloads requested within this window are coalesced into one
+    reload_debounce_ms: int = 300
 
     # Server
     host: str = "0.0.0.0"
@@ -28,6 +38,60 @@ class Settings(BaseSettings):
     # Cache TTLs (seconds)
     stats_cache_ttl: int = 10
     heavy_cache_ttl: int = 60
+    log_count_cache_ttl: int = 30
+
+    # Stats cache bounds; entries past their TTL are served for up to
+    # cache_stale_ttl more seconds while one background refresh runs
+    cache_max_entries: int = 512
+    cache_max_bytes: int = 32 * 1024 * 1024
+    cache_stale_ttl: int = 120
+
+    # SQLite connection pools
+    db_pool_size: int = 4
+    dashboard_pool_size: int = 4
+    db_pool_timeout: float = 10.0
+    db_pool_max_lifetime: int = 3600
+    db_pool_health_check_interval: int = 30
+    db_busy_timeout_ms: int = 5000
+    db_mmap_size: int = 64 * 1024 * 1024
+    db_cache_size_kb: int = 8192
+
+    # Worker pool for heavy FTL queries; processes keep aggregation off the
+    # event loop, threads use less memory
+    worker_pool_size: int = 2
+    worker_processes: bool = True
+
+    # Id -> string lookups (domains, clients, upstreams) kept in memory
+    ftl_id_cache_size: int = 200000
+
+    # Rollup ingester (pre-aggregated stats in dashboard.db)
+    rollups_enabled: bool = True
+    rollup_poll_interval: int = 2
+    rollup_batch_size: int = 50000
+    rollup_retention_days: int = 31
+    # Items kept per hourly top-K summary for approximate (approx=true) stats
+    sketch_top_k: int = 200
+
+    # Day-partitioned query archive, kept after FTL prunes its database so
+    # stats can reach back archive_retention_days
+    archive_enabled: bool = True
+    archive_dir: str = str(Path(__file__).resolve().parent.parent / "archive")
+    archive_retention_days: int = 366
+    archive_interval: int = 3600
+
+    # Trigram index over FTL domains for substring search
+    domain_index_enabled: bool = True
+    domain_index_interval: int = 60
+    domain_index_max_ids: int = 5000
+
+    # MAC <-> IP device index
+    device_registry_ttl: int = 30
+    device_registry_full_refresh: int = 600
+
+    # Live stats stream (/api/stream)
+    stream_keepalive: int = 15
+    stream_queue_size: int = 100
+    stream_recent_rows: int = 50
 
     model_config = {"env_prefix": "PIHOLE_DASH_"}
 
@@ -6,22 +6,38 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 from app.config import settings
-from app.services import device_db, scheduler
-from app.routers import dashboard, devices, domains, logs, blocking
+from app.middleware import CancelOnDisconnectMiddleware
+from app.services import (
+    archive, db_pool, device_db, domain_index, ftl_schema, live, pihole_backends, rollups, scheduler, workers,
+)
+from app.routers import dashboard, devices, domains, logs, blocking, stream, system
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await device_db.init_db()
+    await ftl_schema.detect()
+    workers.start()
     await scheduler.init()
+    live.init()
+    await rollups.start()
+    await domain_index.start()
+    await archive.start()
     yield
     # Shutdown
+    await archive.stop()
+    await domain_index.stop()
+    await rollups.stop()
     await scheduler.shutdown()
+    await pihole_backends.close()
+    await workers.stop()
+    await db_pool.close_all()
 
 
 app = FastAPI(title="Pi-hole Dashboard", lifespan=lifespan)
 
+app.add_middleware(CancelOnDisconnectMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,6 +51,8 @@ app.include_router(devices.router)
 app.include_router(domains.router)
 app.include_router(logs.router)
 app.include_router(blocking.router)
+app.include_router(stream.router)
+app.include_router(system.router)
 
 # Mount frontend static files if the dist directory exists
 if os.path.isdir(settings.static_dir):
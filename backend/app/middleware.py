@@ -0,0 +1,48 @@
+import asyncio
+
+
+class CancelOnDisconnectMiddleware:
+    """Cancel GET API handlers whose client has disconnected.
+
+    Uvicorn only reports a disconnect through `receive()`, which nothing
+    reads once a GET request has started. Watching it here lets an
+    abandoned dashboard or log request cancel its pending FTL work. The
+    /api/stream endpoint watches for disconnects itself, so it is skipped.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not scope["path"].startswith("/api/")
+            or scope["path"].startswith("/api/stream")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        messages: asyncio.Queue = asyncio.Queue()
+
+        async def watch():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        handler = asyncio.create_task(self.app(scope, messages.get, send))
+        watcher = asyncio.create_task(watch())
+        try:
+            await asyncio.wait({handler, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not handler.done():
+                handler.cancel()
+            watcher.cancel()
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not watcher.cancelled() and watcher.done():
+                return
+            raise
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class AddDomainRequest(BaseModel):
@@ -9,6 +9,28 @@ class AddDomainRequest(BaseModel):
     comment: str | None = None
 
 
+class BatchDomainOperation(BaseModel):
+    action: str = "add"  # add, remove
+    domain: str
+    type: str = "blacklist"
+    comment: str | None = None
+
+
+class BatchDomainRequest(BaseModel):
+    operations: list[BatchDomainOperation]
+
+
+class DomainEntry(BaseModel):
+    domain: str
+    type: str = "blacklist"
+
+
+class EvaluateDomainsRequest(BaseModel):
+    entries: list[DomainEntry]
+    days: int = Field(7, ge=1, le=90)
+    samples: int = Field(10, ge=0, le=100)
+
+
 class ToggleDomainRequest(BaseModel):
     enabled: bool
 
@@ -12,11 +12,7 @@ async def list_timed_blocks():
 
 @router.post("")
 async def create_timed_block(req: TimedBlockRequest):
-    results = []
-    for domain in req.domains:
-        block = await scheduler.create_timed_block(domain, req.duration_minutes)
-        results.append(block)
-    return results
+    return await scheduler.create_timed_blocks(req.domains, req.duration_minutes)
 
 
 @router.delete("/{block_id}")
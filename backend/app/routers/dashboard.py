@@ -1,40 +1,69 @@
-from fastapi import APIRouter, Query
-from app.services import ftl_db
+from fastapi import APIRouter, HTTPException, Query
+from app.services import columnar, ftl_db
 
 router = APIRouter(prefix="/api/stats", tags=["dashboard"])
 
 
 @router.get("/summary")
-async def summary(hours: int = Query(24, ge=1, le=720)):
-    return await ftl_db.get_summary(hours)
+async def summary(hours: int = Query(24, ge=1, le=8784), approx: bool = Query(False)):
+    return await ftl_db.get_summary(hours, approx)
 
 
 @router.get("/top-domains")
 async def top_domains(
     limit: int = Query(10, ge=1, le=100),
-    hours: int = Query(24, ge=1, le=720),
+    hours: int = Query(24, ge=1, le=8784),
+    approx: bool = Query(False),
 ):
-    return await ftl_db.get_top_domains(hours, limit)
+    return await ftl_db.get_top_domains(hours, limit, approx)
 
 
 @router.get("/top-blocked")
 async def top_blocked(
     limit: int = Query(10, ge=1, le=100),
-    hours: int = Query(24, ge=1, le=720),
+    hours: int = Query(24, ge=1, le=8784),
+    approx: bool = Query(False),
 ):
-    return await ftl_db.get_top_blocked(hours, limit)
+    return await ftl_db.get_top_blocked(hours, limit, approx)
 
 
 @router.get("/over-time")
-async def over_time(hours: int = Query(24, ge=1, le=720)):
-    return await ftl_db.get_over_time(hours)
+async def over_time(
+    hours: int = Query(24, ge=1, le=8784),
+    resolution: str | None = Query(None, pattern="^(1m|10m|1h|1d)$"),
+    buckets: int = Query(ftl_db.DEFAULT_BUCKETS, ge=10, le=1000),
+    format: str = Query("rows", pattern="^(rows|columns)$"),
+):
+    try:
+        result = await ftl_db.get_over_time(hours, resolution, buckets, columns=format == "columns")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return columnar.response(result) if format == "columns" else result
 
 
 @router.get("/hourly-pattern")
-async def hourly_pattern(days: int = Query(7, ge=1, le=30)):
+async def hourly_pattern(days: int = Query(7, ge=1, le=366)):
     return await ftl_db.get_hourly_pattern(days)
 
 
 @router.get("/blocklist-effectiveness")
 async def blocklist_effectiveness():
     return await ftl_db.get_blocklist_effectiveness()
+
+
+@router.get("/dashboard")
+async def dashboard(
+    hours: int = Query(24, ge=1, le=8784),
+    limit: int = Query(10, ge=1, le=100),
+    resolution: str | None = Query(None, pattern="^(1m|10m|1h|1d)$"),
+    buckets: int = Query(ftl_db.DEFAULT_BUCKETS, ge=10, le=1000),
+    format: str = Query("rows", pattern="^(rows|columns)$"),
+    approx: bool = Query(False),
+):
+    try:
+        result = await ftl_db.get_dashboard(
+            hours, limit, resolution, buckets, columns=format == "columns", approx=approx
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return columnar.response(result) if format == "columns" else result
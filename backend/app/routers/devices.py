@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 from app.models import UpdateDeviceRequest
-from app.services import ftl_db, device_db
+from app.services import columnar, ftl_db, device_db, device_registry
 
 router = APIRouter(prefix="/api/devices", tags=["devices"])
 
 
 @router.get("")
-async def list_devices():
+async def list_devices(
+    include_stats: bool = Query(False),
+    hours: int = Query(24, ge=1, le=168),
+):
     devices = await ftl_db.get_network_devices()
     nicknames = await device_db.get_nicknames()
 
+    if include_stats:
+        summaries = await ftl_db.get_device_summaries(
+            await device_registry.get_macs_by_ip(), hours
+        )
+        for d in devices:
+            d["stats"] = summaries.get(d.get("mac"))
+
     # Merge nickname data into device records
     for d in devices:
         mac = d.get("mac", "")
@@ -31,60 +41,56 @@ async def update_device(mac: str, req: UpdateDeviceRequest):
 
 @router.get("/{mac:path}/stats")
 async def device_stats(mac: str, hours: int = Query(24, ge=1, le=720)):
-    # We need to find the IP for this MAC first
-    devices = await ftl_db.get_network_devices()
-    ip = None
-    for d in devices:
-        if d["mac"] == mac:
-            ip = d.get("ip")
-            break
-
-    if not ip:
+    ips = await device_registry.get_ips(mac)
+    if not ips:
         return {"error": "Device not found", "total_queries": 0, "blocked_queries": 0, "blocked_percentage": 0}
 
-    return await ftl_db.get_device_stats(ip, hours)
+    return await ftl_db.get_device_stats(ips, hours)
 
 
 @router.get("/{mac:path}/activity")
-async def device_activity(mac: str, hours: int = Query(24, ge=1, le=168)):
-    devices = await ftl_db.get_network_devices()
-    ip = None
-    for d in devices:
-        if d["mac"] == mac:
-            ip = d.get("ip")
-            break
-
-    if not ip:
+async def device_activity(
+    mac: str,
+    hours: int = Query(24, ge=1, le=168),
+    resolution: str | None = Query(None, pattern="^(1m|10m|1h|1d)$"),
+    buckets: int = Query(ftl_db.DEFAULT_BUCKETS, ge=10, le=1000),
+    format: str = Query("rows", pattern="^(rows|columns)$"),
+):
+    ips = await device_registry.get_ips(mac)
+    if not ips:
+        return {"bucket": [], "blocked": [], "allowed": []} if format == "columns" else []
+
+    try:
+        result = await ftl_db.get_device_activity(
+            ips, hours, resolution, buckets, columns=format == "columns"
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return columnar.response(result) if format == "columns" else result
+
+
+@router.get("/{mac:path}/hourly-pattern")
+async def device_hourly_pattern(mac: str, days: int = Query(7, ge=1, le=30)):
+    ips = await device_registry.get_ips(mac)
+    if not ips:
         return []
 
-    return await ftl_db.get_device_activity(ip, hours)
+    return await ftl_db.get_device_hourly_pattern(ips, days)
 
 
 @router.get("/{mac:path}/top-domains")
 async def device_top_domains(mac: str, limit: int = Query(10, ge=1, le=100)):
-    devices = await ftl_db.get_network_devices()
-    ip = None
-    for d in devices:
-        if d["mac"] == mac:
-            ip = d.get("ip")
-            break
-
-    if not ip:
+    ips = await device_registry.get_ips(mac)
+    if not ips:
         return []
 
-    return await ftl_db.get_device_top_domains(ip, limit)
+    return await ftl_db.get_device_top_domains(ips, limit)
 
 
 @router.get("/{mac:path}/top-blocked")
 async def device_top_blocked(mac: str, limit: int = Query(10, ge=1, le=100)):
-    devices = await ftl_db.get_network_devices()
-    ip = None
-    for d in devices:
-        if d["mac"] == mac:
-            ip = d.get("ip")
-            break
-
-    if not ip:
+    ips = await device_registry.get_ips(mac)
+    if not ips:
         return []
 
-    return await ftl_db.get_device_top_blocked(ip, limit)
+    return await ftl_db.get_device_top_blocked(ips, limit)
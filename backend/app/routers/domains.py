@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Query, HTTPException
-from app.models import AddDomainRequest, ToggleDomainRequest, DOMAIN_PRESETS
-from app.services import gravity_db, pihole
+from app.models import (
+    AddDomainRequest, BatchDomainRequest, EvaluateDomainsRequest, ToggleDomainRequest, DOMAIN_PRESETS,
+)
+from app.services import ftl_db, gravity_db, gravity_match, pihole, pihole_backends
 
 router = APIRouter(prefix="/api/domains", tags=["domains"])
 
@@ -12,53 +14,70 @@ async def list_domains(type: str | None = Query(None)):
     return await gravity_db.get_domains(type)
 
 
+_TYPE_NAMES = {code: name for name, code in gravity_db.DOMAIN_TYPES.items()}
+
+
+async def _apply_one(action: str, domain: str, domain_type: str, comment: str | None = None) -> dict:
+    if domain_type not in pihole_backends.TYPES:
+        raise HTTPException(400, f"Unknown domain type: {domain_type}")
+    result = await pihole.apply_domain_batch(
+        [{"action": action, "domain": domain, "type": domain_type, "comment": comment}]
+    )
+    error = result["results"][0]["error"]
+    if error:
+        raise HTTPException(500, error)
+    return result
+
+
+@router.get("/explain")
+async def explain_domain(domain: str = Query(..., min_length=1)):
+    """Which exact entries, regexes and adlists match `domain`, and whether
+    Pi-hole would block it."""
+    return await gravity_match.explain(domain)
+
+
+@router.post("/evaluate")
+async def evaluate_domains(req: EvaluateDomainsRequest):
+    """Dry run: what candidate entries would have matched in recent traffic,
+    without adding them."""
+    for entry in req.entries:
+        if entry.type not in pihole_backends.TYPES:
+            raise HTTPException(400, f"Unknown domain type: {entry.type}")
+    return await ftl_db.evaluate_entries(
+        [entry.model_dump() for entry in req.entries], req.days, req.samples
+    )
+
+
 @router.post("")
 async def add_domain(req: AddDomainRequest):
-    if req.type == "blacklist":
-        code, out, err = await pihole.add_blacklist(req.domain, req.comment)
-    elif req.type == "whitelist":
-        code, out, err = await pihole.add_whitelist(req.domain)
-    elif req.type == "regex_black":
-        code, out, err = await pihole.add_regex_black(req.domain, req.comment)
-    elif req.type == "wildcard":
-        code, out, err = await pihole.add_wildcard(req.domain, req.comment)
+    result = await _apply_one("add", req.domain, req.type, req.comment)
+    return {"status": "ok", "reloaded": result["reloaded"]}
+
+
+@router.post("/batch")
+async def batch_domains(req: BatchDomainRequest):
+    """Add and remove several domains with one backend call per type and a
+    single list reload. Results are per operation, in request order."""
+    result = await pihole.apply_domain_batch([op.model_dump() for op in req.operations])
+    succeeded = sum(r["ok"] for r in result["results"])
+    if succeeded == len(result["results"]):
+        status = "ok"
     else:
-        raise HTTPException(400, f"Unknown domain type: {req.type}")
-
-    if code != 0:
-        raise HTTPException(500, f"pihole command failed: {err or out}")
-
-    return {"status": "ok", "output": out}
+        status = "partial" if succeeded else "error"
+    return {"status": status, **result}
 
 
 @router.delete("/{domain_id}")
 async def delete_domain(domain_id: int):
     # Look up the domain to determine its type
-    domains = await gravity_db.get_domains()
-    target = None
-    for d in domains:
-        if d["id"] == domain_id:
-            target = d
-            break
-
+    target = await gravity_db.get_domain(domain_id)
     if not target:
         raise HTTPException(404, "Domain not found")
 
-    type_code = target["type"]
-    domain = target["domain"]
-
-    if type_code == 1:  # blacklist
-        code, out, err = await pihole.remove_blacklist(domain)
-    elif type_code == 0:  # whitelist
-        code, out, err = await pihole.remove_whitelist(domain)
-    elif type_code == 3:  # regex black
-        code, out, err = await pihole.remove_regex_black(domain)
-    else:
-        raise HTTPException(400, f"Unsupported domain type code: {type_code}")
-
-    if code != 0:
-        raise HTTPException(500, f"pihole command failed: {err or out}")
-
+    domain_type = _TYPE_NAMES.get(target["type"])
+    if domain_type is None:
+        raise HTTPException(400, f"Unsupported domain type code: {target['type']}")
+    await _apply_one("remove", target["domain"], domain_type)
     return {"status": "ok"}
 
 
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Query
-from app.services import ftl_db
+import csv
+import io
+from typing import AsyncIterator
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.services import columnar, ftl_db
 
 router = APIRouter(prefix="/api/logs", tags=["logs"])
 
@@ -15,16 +20,26 @@ async def get_logs(
     status: str | None = Query(None),
     from_ts: int | None = Query(None, alias="from"),
     to_ts: int | None = Query(None, alias="to"),
+    cursor: str | None = Query(None),
+    paging: str = Query("offset", pattern="^(offset|cursor)$"),
+    format: str = Query("rows", pattern="^(rows|columns)$"),
 ):
-    return await ftl_db.get_queries(
-        page=page,
-        per_page=per_page,
-        domain=domain,
-        client=client,
-        status=status,
-        from_ts=from_ts,
-        to_ts=to_ts,
-    )
+    try:
+        result = await ftl_db.get_queries(
+            page=page,
+            per_page=per_page,
+            domain=domain,
+            client=client,
+            status=status,
+            from_ts=from_ts,
+            to_ts=to_ts,
+            cursor=cursor,
+            paging=paging,
+            columns=format == "columns",
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return columnar.response(result) if format == "columns" else result
 
 
 @router.get("/search")
@@ -33,3 +48,45 @@ async def search_logs(
     hours: int = Query(24, ge=1, le=168),
 ):
     return await ftl_db.search_queries(q, hours)
+
+
+async def _csv(chunks: AsyncIterator[list[tuple]]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ftl_db.EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+async def _ndjson(chunks: AsyncIterator[list[tuple]]):
+    columns = ftl_db.EXPORT_COLUMNS
+    async for rows in chunks:
+        yield b"".join(columnar.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+@router.get("/export")
+async def export_logs(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    domain: str | None = Query(None),
+    client: str | None = Query(None),
+    status: str | None = Query(None),
+    from_ts: int | None = Query(None, alias="from"),
+    to_ts: int | None = Query(None, alias="to"),
+):
+    """Stream every matching query, oldest first, as CSV or NDJSON."""
+    chunks = ftl_db.export_queries(
+        domain=domain, client=client, status=status, from_ts=from_ts, to_ts=to_ts
+    )
+    if format == "csv":
+        body, media_type = _csv(chunks), "text/csv"
+    else:
+        body, media_type = _ndjson(chunks), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="pihole-queries.{format}"'},
+    )
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from app.services import (
+    archive, db_pool, ftl_db, ftl_schema, gravity_db, gravity_match, live, pihole, rollups, workers,
+)
+
+router = APIRouter(prefix="/api/system", tags=["system"])
+
+
+@router.get("/metrics")
+async def metrics():
+    return {
+        "db_pools": db_pool.get_metrics(),
+        "stream_subscribers": live.subscriber_count(),
+        "cache": ftl_db.get_cache_stats(),
+        "rollups": rollups.status(),
+        "archive": archive.stats(),
+        "ftl_schema": ftl_schema.stats(),
+        "gravity": gravity_db.stats(),
+        "matcher": gravity_match.stats(),
+        "workers": workers.get_metrics(),
+        "reloads": pihole.get_reload_stats(),
+    }
@@ -0,0 +1,633 @@
+"""Job functions that run inside the worker pool (see workers.py).
+
+Everything here is synchronous, uses the stdlib sqlite3 module and imports
+nothing from the app, so it is cheap to load in a spawned process. Each
+worker keeps its own read-only connections. A running statement is
+interrupted as soon as the parent raises the cancel flag of the job's slot.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import accumulate, compress
+from operator import itemgetter
+
+_flags = None
+_pragmas: dict = {}
+_local = threading.local()
+
+# Low bits of a gravity key that name the adlist
+ADLIST_BITS = 16
+
+
+def init(flags, pragmas: dict):
+    """Worker initializer: shared cancel flags (one per slot) and pragmas."""
+    global _flags, _pragmas
+    _flags = flags
+    _pragmas = pragmas
+
+
+def _file_id(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """This thread's connection to `path`, reopened when the file is replaced."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    file_id = _file_id(path)
+    cached = conns.get(path)
+    if cached is not None:
+        conn, cached_id = cached
+        if cached_id == file_id:
+            return conn
+        conn.close()
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {int(_pragmas.get('busy_timeout', 5000))}")
+    conn.execute(f"PRAGMA mmap_size = {int(_pragmas.get('mmap_size', 0))}")
+    conn.execute(f"PRAGMA cache_size = -{int(_pragmas.get('cache_size_kb', 2000))}")
+    conn.execute("PRAGMA query_only = ON")
+    conns[path] = (conn, file_id)
+    return conn
+
+
+def run(slot: int, path: str, fn, *args):
+    """Run `fn(conn, *args)` on a connection to `path`, interruptible via slot's flag."""
+    conn = _connect(path)
+    conn.set_progress_handler(lambda: _flags[slot], 10000)
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def fetch_all(conn: sqlite3.Connection, query: str, params: tuple) -> list[dict]:
+    cursor = conn.execute(query, params)
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def fetch_one(conn: sqlite3.Connection, query: str, params: tuple) -> dict | None:
+    cursor = conn.execute(query, params)
+    row = cursor.fetchone()
+    return dict(zip([c[0] for c in cursor.description], row)) if row else None
+
+
+def fetch_columns(conn: sqlite3.Connection, query: str, params: tuple) -> dict[str, list]:
+    """Result as one list per column, transposed from the cursor tuples."""
+    cursor = conn.execute(query, params)
+    rows = cursor.fetchall()
+    names = [c[0] for c in cursor.description]
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, map(list, zip(*rows))))
+
+
+def dashboard_pass(
+    conn: sqlite3.Connection,
+    table: str,
+    now: int,
+    since: int,
+    pattern_since: int,
+    limit: int,
+    blocked_statuses: frozenset,
+    resolution: int,
+    offset: int,
+) -> dict:
+    """All Dashboard widgets from one scan of the FTL window, with over_time
+    as columns of `resolution`-second buckets shifted by `offset`.
+
+    Domain, client and source values are returned as stored (ids on current
+    FTL databases); the caller resolves them to names."""
+    interval = 600
+    first_bucket = since - since % interval
+    pattern_bucket = pattern_since - pattern_since % interval
+    blocked_since = now - 86400
+    scan_since = min(first_bucket, pattern_bucket, blocked_since)
+    # Minute series start at since's minute, coarser ones at its 10-minute bucket
+    series_since = since - since % min(resolution, interval)
+
+    totals: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+    domain_counts: Counter = Counter()
+    blocked_counts: Counter = Counter()
+    blocked_day: Counter = Counter()
+    clients: set = set()
+    series: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+
+    cursor = conn.execute(
+        f"""
+        SELECT timestamp, status, domain, client, additional_info
+        FROM {table}
+        WHERE timestamp > ?
+        """,
+        (scan_since,),
+    )
+    while True:
+        chunk = cursor.fetchmany(5000)
+        if not chunk:
+            break
+        for ts, status, domain, client, info in chunk:
+            bucket = ts - ts % interval
+            blocked = status in blocked_statuses
+            if blocked and ts > blocked_since:
+                blocked_day[(status, domain, info)] += 1
+            if bucket < first_bucket:
+                if bucket >= pattern_bucket:
+                    totals[bucket][0] += 1
+                continue
+            t = totals[bucket]
+            t[0] += 1
+            if ts >= series_since:
+                s = series[(ts + offset) // resolution * resolution - offset]
+                s[0] += 1
+                s[1] += blocked
+            domain_counts[domain] += 1
+            clients.add(client)
+            if blocked:
+                t[1] += 1
+                blocked_counts[domain] += 1
+
+    window = [(b, t) for b, t in sorted(totals.items()) if b >= first_bucket]
+    order = sorted(series)
+    hourly: Counter = Counter()
+    for bucket, t in totals.items():
+        if bucket >= pattern_bucket:
+            lt = time.localtime(bucket)
+            hourly[((lt.tm_wday + 1) % 7, lt.tm_hour)] += t[0]
+
+    return {
+        "total_queries": sum(t[0] for _, t in window),
+        "blocked_queries": sum(t[1] for _, t in window),
+        "unique_domains": len(domain_counts),
+        "clients": list(clients),
+        "top_domains": domain_counts.most_common(limit),
+        "top_blocked": blocked_counts.most_common(limit),
+        "over_time": {
+            "bucket": order,
+            "blocked": [series[b][1] for b in order],
+            "allowed": [series[b][0] - series[b][1] for b in order],
+        },
+        "hourly_pattern": [
+            {"day_of_week": dow, "hour": hour, "count": c}
+            for (dow, hour), c in sorted(hourly.items())
+        ],
+        "blocked_day": [(*key, c) for key, c in blocked_day.items()],
+    }
+
+
+def domain_key(domain: str) -> int:
+    """Stable 64-bit hash of `domain` with the low ADLIST_BITS cleared."""
+    h = int.from_bytes(hashlib.blake2b(domain.encode(), digest_size=8).digest(), "big")
+    return h >> ADLIST_BITS << ADLIST_BITS
+
+
+def gravity_keys(conn: sqlite3.Connection) -> tuple[list[int], array]:
+    """gravity.db's gravity table as a sorted array of
+    `domain_key(domain) | i`, where i is the position of the row's adlist id
+    in the returned list."""
+    adlist_ids: dict[int, int] = {}
+    keys = []
+    cursor = conn.execute("SELECT domain, adlist_id FROM gravity")
+    while True:
+        chunk = cursor.fetchmany(5000)
+        if not chunk:
+            break
+        for domain, adlist_id in chunk:
+            i = adlist_ids.get(adlist_id)
+            if i is None:
+                if len(adlist_ids) >> ADLIST_BITS:
+                    raise ValueError(f"more than {1 << ADLIST_BITS} adlists in gravity")
+                i = adlist_ids[adlist_id] = len(adlist_ids)
+            keys.append(domain_key(domain) | i)
+    keys.sort()
+    return list(adlist_ids), array("Q", keys)
+
+
+def evaluate_entries(
+    conn: sqlite3.Connection,
+    table: str,
+    has_ids: bool,
+    since: int,
+    entries: list[tuple[str, str]],
+    samples: int,
+) -> dict:
+    """Match candidate list entries against the domains queried since `since`.
+
+    `entries` are ("exact", domain), ("suffix", domain) for wildcards or
+    ("regex", expression) pairs. Each entry is matched once per distinct
+    domain rather than per query, and per-client counts are only gathered
+    for the domains that matched something."""
+    started = time.perf_counter()
+    queries = dict(
+        conn.execute(
+            f"SELECT domain, COUNT(*) FROM {table} WHERE timestamp > ? GROUP BY domain", (since,)
+        ).fetchall()
+    )
+    if has_ids:
+        names = dict(
+            conn.execute(
+                "SELECT id, domain FROM domain_by_id WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(queries)),),
+            ).fetchall()
+        )
+    else:
+        names = {d: d for d in queries}
+    # Names as matched, lowercased, with the stored keys they stand for
+    by_name: dict[str, list] = defaultdict(list)
+    for key in queries:
+        if names.get(key) is not None:
+            by_name[names[key].lower()].append(key)
+
+    matches: list[set | None] = []
+    errors: dict[int, str] = {}
+    for kind, value in entries:
+        if kind == "exact":
+            matched = {value} & by_name.keys()
+        elif kind == "suffix":
+            tail = "." + value
+            matched = {n for n in by_name if n == value or n.endswith(tail)}
+        else:
+            try:
+                search = re.compile(value, re.IGNORECASE).search
+            except re.error as e:
+                errors[len(matches)] = f"invalid regex: {e}"
+                matches.append(None)
+                continue
+            matched = {n for n in by_name if search(n)}
+        matches.append(matched)
+
+    matched_any = set().union(*(m for m in matches if m is not None))
+    clients: dict[str, Counter] = defaultdict(Counter)
+    if matched_any:
+        keys = [key for name in matched_any for key in by_name[name]]
+        cursor = conn.execute(
+            f"""
+            SELECT domain, client, COUNT(*) FROM {table}
+            WHERE timestamp > ? AND domain IN (SELECT value FROM json_each(?))
+            GROUP BY domain, client
+            """,
+            (since, json.dumps(keys)),
+        )
+        for key, client, count in cursor:
+            clients[names[key].lower()][client] += count
+
+    def summarize(matched: set) -> dict:
+        counts = {name: sum(queries[key] for key in by_name[name]) for name in matched}
+        client_counts: Counter = Counter()
+        for name in matched:
+            client_counts.update(clients[name])
+        return {
+            "domains": len(matched),
+            "queries": sum(counts.values()),
+            "clients": len(client_counts),
+            "top_clients": client_counts.most_common(samples),
+            "sample_domains": heapq.nlargest(samples, counts.items(), key=itemgetter(1)),
+        }
+
+    return {
+        "scanned_domains": len(by_name),
+        "entries": [
+            summarize(m) if m is not None else {"error": errors[i]} for i, m in enumerate(matches)
+        ],
+        "total": summarize(matched_any),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# Query archive partitions (see archive.py): one SQLite file per local day,
+# holding each column as a zlib-compressed little-endian array. Domains and
+# clients are ids into per-partition dictionaries of names.
+ARCHIVE_FORMAT = 1
+ARCHIVE_BUCKET = 600
+_ARCHIVE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE columns (name TEXT PRIMARY KEY, data BLOB NOT NULL);
+"""
+# Array typecode per column; *_names columns are JSON lists
+_ARCHIVE_COLUMNS = {
+    # Seconds after the previous row; the first row's are after day_start
+    "timestamp": "I",
+    "type": "H",
+    "status": "H",
+    "domain": "I",
+    "client": "I",
+    # Whole-day totals per domain id and per 10-minute bucket, counted from
+    # the bucket day_start falls in
+    "domain_total": "I",
+    "domain_blocked": "I",
+    "bucket_total": "I",
+    "bucket_blocked": "I",
+}
+
+
+def _pack(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return zlib.compress(values.tobytes())
+
+
+def _read_columns(part: sqlite3.Connection, *names: str) -> dict:
+    stored = dict(
+        part.execute(
+            "SELECT name, data FROM columns WHERE name IN (SELECT value FROM json_each(?))",
+            (json.dumps(names),),
+        )
+    )
+    columns = {}
+    for name in names:
+        data = zlib.decompress(stored[name])
+        if name.endswith("_names"):
+            columns[name] = json.loads(data)
+            continue
+        values = array(_ARCHIVE_COLUMNS[name])
+        values.frombytes(data)
+        if sys.byteorder != "little":
+            values.byteswap()
+        columns[name] = values
+    return columns
+
+
+def archive_day(
+    conn: sqlite3.Connection,
+    table: str,
+    has_ids: bool,
+    day_start: int,
+    day_end: int,
+    path: str,
+    blocked_statuses: frozenset,
+) -> dict:
+    """Write the queries from `day_start` up to `day_end` to a new partition
+    at `path`, replacing any file already there, and return its meta."""
+    started = time.perf_counter()
+    columns = {name: array(_ARCHIVE_COLUMNS[name]) for name in ("timestamp", "type", "status", "domain", "client")}
+    timestamps, types, statuses = columns["timestamp"], columns["type"], columns["status"]
+    domains, clients = columns["domain"], columns["client"]
+    domain_ids: dict = {}
+    client_ids: dict = {}
+    client_ips = dict(conn.execute("SELECT id, ip FROM client_by_id")) if has_ids else {}
+    base = day_start - day_start % ARCHIVE_BUCKET
+    bucket_total = array("I", [0]) * ((day_end - 1 - base) // ARCHIVE_BUCKET + 1)
+    bucket_blocked = array("I", bucket_total)
+
+    previous = day_start
+    cursor = conn.execute(
+        f"""
+        SELECT timestamp, type, status, domain, client
+        FROM {table}
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp, id
+        """,
+        (day_start, day_end),
+    )
+    while True:
+        chunk = cursor.fetchmany(5000)
+        if not chunk:
+            break
+        for ts, qtype, status, domain, client in chunk:
+            ts = int(ts)
+            timestamps.append(ts - previous)
+            previous = ts
+            types.append(qtype or 0)
+            statuses.append(status or 0)
+            domains.append(domain_ids.setdefault(domain, len(domain_ids)))
+            if has_ids:
+                client = client_ips.get(client)
+            clients.append(client_ids.setdefault(client or "", len(client_ids)))
+            bucket = (ts - base) // ARCHIVE_BUCKET
+            bucket_total[bucket] += 1
+            if status in blocked_statuses:
+                bucket_blocked[bucket] += 1
+
+    if has_ids:
+        names = dict(
+            conn.execute(
+                "SELECT id, domain FROM domain_by_id WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(domain_ids)),),
+            )
+        )
+        domain_names = [names.get(key) or "" for key in domain_ids]
+    else:
+        domain_names = [key or "" for key in domain_ids]
+    domain_total = array("I", [0]) * len(domain_ids)
+    domain_blocked = array("I", domain_total)
+    for i, count in Counter(domains).items():
+        domain_total[i] = count
+    blocked = bytes(map(blocked_statuses.__contains__, statuses))
+    for i, count in Counter(compress(domains, blocked)).items():
+        domain_blocked[i] = count
+    columns.update(
+        domain_total=domain_total,
+        domain_blocked=domain_blocked,
+        bucket_total=bucket_total,
+        bucket_blocked=bucket_blocked,
+    )
+
+    meta = {
+        "format": ARCHIVE_FORMAT,
+        "day_start": day_start,
+        "day_end": day_end,
+        "rows": len(timestamps),
+        "first_ts": day_start + timestamps[0] if timestamps else None,
+        "last_ts": previous if timestamps else None,
+        "domains": len(domain_ids),
+        "clients": len(client_ids),
+        "archived_at": int(time.time()),
+    }
+    stored = [(name, _pack(values)) for name, values in columns.items()]
+    stored.append(("domain_names", zlib.compress(json.dumps(domain_names).encode())))
+    stored.append(("client_names", zlib.compress(json.dumps(list(client_ids)).encode())))
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    out = sqlite3.connect(tmp)
+    try:
+        out.executescript(_ARCHIVE_SCHEMA)
+        out.executemany("INSERT INTO columns (name, data) VALUES (?, ?)", stored)
+        out.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+        out.commit()
+    finally:
+        out.close()
+    # Readers only ever see a complete partition
+    os.replace(tmp, path)
+    return {
+        **meta,
+        "bytes": os.path.getsize(path),
+        "build_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def archive_pass(
+    conn: sqlite3.Connection,
+    table: str,
+    has_ids: bool,
+    partitions: list[tuple[str, int, int]],
+    tail_start: int,
+    since: int,
+    pattern_since: int,
+    limit: int,
+    blocked_statuses: frozenset,
+    resolution: int,
+    offset: int,
+    detail: bool,
+) -> dict:
+    """Dashboard stats from archive partitions, given as (path, day_start,
+    day_end), and the FTL rows from `tail_start` on, in the shape of
+    dashboard_pass() but with names for domains and clients.
+
+    Windows start at the 10-minute bucket of `since` (of `pattern_since`
+    for the hourly pattern). Partitions inside the window are answered from
+    their stored totals; only the one the window starts in has its rows
+    read. Without `detail` only bucket totals are read: over_time and the
+    hourly pattern come back, top lists and distinct counts are empty."""
+    interval = ARCHIVE_BUCKET
+    first_bucket = since - since % interval
+    pattern_bucket = pattern_since - pattern_since % interval
+    totals: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+    domain_counts: Counter = Counter()
+    blocked_counts: Counter = Counter()
+    clients: set = set()
+    read = scanned = 0
+
+    for path, day_start, day_end in partitions:
+        if day_end <= min(first_bucket, pattern_bucket):
+            continue
+        try:
+            part = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        except sqlite3.Error:
+            # Pruned after the plan was made
+            continue
+        try:
+            base = day_start - day_start % interval
+            columns = _read_columns(part, "bucket_total", "bucket_blocked")
+            for i, total in enumerate(columns["bucket_total"]):
+                if total:
+                    t = totals[base + i * interval]
+                    t[0] += total
+                    t[1] += columns["bucket_blocked"][i]
+            read += 1
+            if not detail or day_end <= first_bucket:
+                continue
+            if day_start >= first_bucket:
+                columns = _read_columns(part, "domain_names", "client_names", "domain_total", "domain_blocked")
+                for name, total, blocked in zip(
+                    columns["domain_names"], columns["domain_total"], columns["domain_blocked"]
+                ):
+                    domain_counts[name] += total
+                    if blocked:
+                        blocked_counts[name] += blocked
+                clients.update(columns["client_names"])
+                continue
+            columns = _read_columns(part, "domain_names", "client_names", "timestamp", "status", "domain", "client")
+            start = bisect_left(array("I", accumulate(columns["timestamp"])), first_bucket - day_start)
+            names, ids = columns["domain_names"], columns["domain"][start:]
+            for i, count in Counter(ids).items():
+                domain_counts[names[i]] += count
+            blocked = bytes(map(blocked_statuses.__contains__, columns["status"][start:]))
+            for i, count in Counter(compress(ids, blocked)).items():
+                blocked_counts[names[i]] += count
+            clients.update(columns["client_names"][i] for i in set(columns["client"][start:]))
+            scanned += 1
+        except (sqlite3.Error, KeyError, zlib.error):
+            continue
+        finally:
+            part.close()
+
+    # FTL rows after the last partition, grouped by bucket and domain there
+    statuses = ",".join(map(str, sorted(blocked_statuses)))
+    cursor = conn.execute(
+        f"""
+        SELECT timestamp - timestamp % {interval}, COUNT(*), SUM(status IN ({statuses}))
+        FROM {table}
+        WHERE timestamp >= ?
+        GROUP BY 1
+        """,
+        (max(tail_start, min(first_bucket, pattern_bucket)),),
+    )
+    for bucket, total, blocked in cursor:
+        t = totals[int(bucket)]
+        t[0] += total
+        t[1] += blocked
+    if detail:
+        detail_since = max(tail_start, first_bucket)
+        rows = conn.execute(
+            f"""
+            SELECT domain, COUNT(*), SUM(status IN ({statuses}))
+            FROM {table}
+            WHERE timestamp >= ?
+            GROUP BY domain
+            """,
+            (detail_since,),
+        ).fetchall()
+        client_keys = [
+            c for (c,) in conn.execute(f"SELECT DISTINCT client FROM {table} WHERE timestamp >= ?", (detail_since,))
+        ]
+        names, ips = {}, {}
+        if has_ids:
+            names = dict(
+                conn.execute(
+                    "SELECT id, domain FROM domain_by_id WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps([r[0] for r in rows]),),
+                )
+            )
+            ips = dict(
+                conn.execute(
+                    "SELECT id, ip FROM client_by_id WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(client_keys),),
+                )
+            )
+        for key, total, blocked in rows:
+            name = names.get(key, key) or ""
+            domain_counts[name] += total
+            if blocked:
+                blocked_counts[name] += blocked
+        clients.update(ips.get(c, c) or "" for c in client_keys)
+
+    window = sorted((b, t) for b, t in totals.items() if b >= first_bucket)
+    series: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+    for bucket, t in window:
+        s = series[(bucket + offset) // resolution * resolution - offset]
+        s[0] += t[0]
+        s[1] += t[1]
+    order = sorted(series)
+    hourly: Counter = Counter()
+    for bucket, t in totals.items():
+        if bucket >= pattern_bucket:
+            lt = time.localtime(bucket)
+            hourly[((lt.tm_wday + 1) % 7, lt.tm_hour)] += t[0]
+
+    return {
+        "total_queries": sum(t[0] for _, t in window),
+        "blocked_queries": sum(t[1] for _, t in window),
+        "unique_domains": len(domain_counts),
+        "unique_clients": len(clients),
+        "top_domains": domain_counts.most_common(limit),
+        "top_blocked": blocked_counts.most_common(limit),
+        "over_time": {
+            "bucket": order,
+            "blocked": [series[b][1] for b in order],
+            "allowed": [series[b][0] - series[b][1] for b in order],
+        },
+        "hourly_pattern": [
+            {"day_of_week": dow, "hour": hour, "count": c}
+            for (dow, hour), c in sorted(hourly.items())
+        ],
+        "partitions": read,
+        "scanned_partitions": scanned,
+    }
@@ -0,0 +1,183 @@
+"""Day-partitioned archive of FTL query data, kept after FTL prunes it.
+
+Once FTL has rows past the end of a local day, the day is written to its own
+file in archive_dir (analytics.archive_day): timestamps, types, statuses and
+dictionary-encoded domains and clients as zlib-compressed arrays, plus
+per-domain and per-10-minute totals for the whole day. Partitions never
+change once written. Days are archived newest first, so the archive is a
+run of consecutive days ending yesterday that grows back to the oldest day
+FTL still has in full, and files older than archive_retention_days are deleted.
+
+ftl_db plans long windows over coverage(): the partitions overlapping the
+window plus FTL after the last one.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import os
+import re
+import sqlite3
+import time
+
+import aiosqlite
+from app.config import settings
+from app.services import analytics, db_pool, ftl_schema, rollups, workers
+
+logger = logging.getLogger(__name__)
+
+_FILE_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2})\.db$")
+
+# Partition meta by ISO date
+_partitions: dict[str, dict] = {}
+_task: asyncio.Task | None = None
+_stats = {"archived": 0, "pruned": 0, "last_pass_ms": 0.0, "last_pass_at": None}
+
+
+def _day_bounds(day: datetime.date) -> tuple[int, int]:
+    """Start of `day` and of the next day, at local midnight."""
+    def midnight(d: datetime.date) -> int:
+        return int(time.mktime((d.year, d.month, d.day, 0, 0, 0, 0, 0, -1)))
+
+    return midnight(day), midnight(day + datetime.timedelta(days=1))
+
+
+def _path(day: str) -> str:
+    return os.path.join(settings.archive_dir, f"{day}.db")
+
+
+async def _load_index():
+    """Read the meta of every partition in archive_dir."""
+    _partitions.clear()
+    for name in sorted(os.listdir(settings.archive_dir)):
+        if name.endswith(".tmp"):
+            # Left by a pass that was interrupted
+            os.remove(os.path.join(settings.archive_dir, name))
+            continue
+        match = _FILE_NAME.match(name)
+        if not match:
+            continue
+        path = os.path.join(settings.archive_dir, name)
+        try:
+            async with aiosqlite.connect(f"file:{path}?mode=ro", uri=True) as db:
+                async with db.execute("SELECT key, value FROM meta") as c:
+                    meta = dict(await c.fetchall())
+        except sqlite3.Error:
+            logger.warning("Skipping unreadable archive partition %s", path)
+            continue
+        if meta.get("format") != analytics.ARCHIVE_FORMAT:
+            logger.warning("Skipping archive partition %s in format %s", path, meta.get("format"))
+            continue
+        _partitions[match.group(1)] = {**meta, "bytes": os.path.getsize(path)}
+
+
+async def _archive_pending():
+    """Archive every day FTL has in full that isn't archived yet, newest
+    first, then drop partitions past the retention."""
+    started = time.perf_counter()
+    bounds = await db_pool.get_pool("ftl").fetch_one(
+        f"SELECT MIN(timestamp) as first, MAX(timestamp) as last FROM {ftl_schema.table}"
+    )
+    today = datetime.date.today()
+    oldest = today - datetime.timedelta(days=settings.archive_retention_days)
+    if bounds and bounds["first"] is not None:
+        day = today - datetime.timedelta(days=1)
+        # FTL prunes by age, so its oldest day usually lost its first hours
+        # already; partitions never change, so start from the first full day
+        first = datetime.date.fromtimestamp(bounds["first"])
+        if _day_bounds(first)[0] < bounds["first"]:
+            first += datetime.timedelta(days=1)
+        first = max(first, oldest)
+        while day >= first:
+            key = day.isoformat()
+            day_start, day_end = _day_bounds(day)
+            day -= datetime.timedelta(days=1)
+            # FTL writes in time order, so rows past the day's end mean it's complete
+            if key in _partitions or bounds["last"] < day_end:
+                continue
+            meta = await workers.run(
+                analytics.archive_day,
+                ftl_schema.table, ftl_schema.has_ids, day_start, day_end, _path(key),
+                rollups.BLOCKED_STATUSES,
+                label=f"archive {key}",
+            )
+            _partitions[key] = meta
+            _stats["archived"] += 1
+            logger.info(
+                "Archived %s: %d queries, %d bytes in %.0f ms",
+                key, meta["rows"], meta["bytes"], meta["build_ms"],
+            )
+
+    for key in [k for k in _partitions if k < oldest.isoformat()]:
+        try:
+            os.remove(_path(key))
+        except FileNotFoundError:
+            pass
+        del _partitions[key]
+        _stats["pruned"] += 1
+    _stats["last_pass_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _stats["last_pass_at"] = int(time.time())
+
+
+async def _archive_loop():
+    while True:
+        try:
+            await _archive_pending()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Query archive pass failed")
+        await asyncio.sleep(settings.archive_interval)
+
+
+async def start():
+    global _task
+    if not settings.archive_enabled:
+        return
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    await _load_index()
+    _task = asyncio.create_task(_archive_loop())
+
+
+async def stop():
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+def coverage() -> list[dict]:
+    """The run of consecutive archived days ending at the newest one, oldest
+    first, each with its `path`. Empty when the archive is off or empty."""
+    if not settings.archive_enabled:
+        return []
+    run = []
+    expected = None
+    for key in sorted(_partitions, reverse=True):
+        day = datetime.date.fromisoformat(key)
+        if expected is not None and day != expected:
+            break
+        run.append({**_partitions[key], "day": key, "path": _path(key)})
+        expected = day - datetime.timedelta(days=1)
+    run.reverse()
+    return run
+
+
+def stats() -> dict:
+    run = coverage()
+    return {
+        **_stats,
+        "enabled": settings.archive_enabled,
+        "running": _task is not None and not _task.done(),
+        "partitions": len(_partitions),
+        "rows": sum(p["rows"] for p in _partitions.values()),
+        "bytes": sum(p["bytes"] for p in _partitions.values()),
+        "first_day": run[0]["day"] if run else None,
+        "last_day": run[-1]["day"] if run else None,
+        "contiguous_days": len(run),
+    }
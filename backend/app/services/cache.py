@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+
+# Items measured per container when estimating a value's size
+_SAMPLE = 8
+
+
+def _sizeof(obj) -> int:
+    """Rough deep size of a cached value (dicts, lists, scalars). Containers
+    are measured on their first few items and scaled to their length, so
+    sizing a large result stays cheap on the event loop."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict) and obj:
+        sample = list(islice(obj.items(), _SAMPLE))
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in sample) * len(obj) // len(sample)
+    elif isinstance(obj, (list, tuple, set)) and obj:
+        sample = list(islice(obj, _SAMPLE))
+        size += sum(_sizeof(v) for v in sample) * len(obj) // len(sample)
+    return size
+
+
+class AsyncCache:
+    """Bounded LRU cache for coroutine results.
+
+    Concurrent misses on the same key share a single load, which is cancelled
+    if every caller waiting on it goes away. Entries past their TTL but within
+    `stale_ttl` are served immediately while one background refresh runs.
+    Size is bounded both by entry count and by an approximate byte budget;
+    a value larger than the whole budget is returned but not stored."""
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, stale_ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._entries: OrderedDict[str, tuple[float, object, int]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self._background: set[str] = set()
+        self._bytes = 0
+        self.metrics = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "oversized": 0,
+            "refresh_errors": 0,
+        }
+
+    def _store(self, key: str, value):
+        size = _sizeof(value)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        if size > self.max_bytes:
+            # Storing it would evict everything else and then itself
+            self.metrics["oversized"] += 1
+            return
+        self._entries[key] = (time.monotonic(), value, size)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.metrics["evictions"] += 1
+
+    def _load(self, key: str, loader) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.metrics["coalesced"] += 1
+            return task
+
+        async def run():
+            try:
+                value = await loader()
+                self._store(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.create_task(run())
+        # Mark the exception retrieved even if every waiter went away
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return task
+
+    def _refresh_in_background(self, key: str, loader):
+        if key in self._inflight:
+            return
+
+        def done(task: asyncio.Task):
+            self._background.discard(key)
+            if not task.cancelled() and task.exception() is not None:
+                self.metrics["refresh_errors"] += 1
+                logger.warning("Background refresh of %s failed: %r", key, task.exception())
+
+        self._background.add(key)
+        self._load(key, loader).add_done_callback(done)
+
+    async def get_or_load(self, key: str, ttl: float, loader, wait: bool = True):
+        """Return the cached value for `key`, loading it with `await loader()`
+        when missing. With wait=False a miss starts the load and returns None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < ttl:
+                self._entries.move_to_end(key)
+                self.metrics["hits"] += 1
+                return entry[1]
+            if age < ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.metrics["stale_hits"] += 1
+                self._refresh_in_background(key, loader)
+                return entry[1]
+
+        self.metrics["misses"] += 1
+        if not wait:
+            self._refresh_in_background(key, loader)
+            return None
+        task = self._load(key, loader)
+        # Shield so one cancelled request doesn't cancel the shared load; the
+        # last waiter to leave cancels it unless it is a background refresh
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and key not in self._background:
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def invalidate(self, prefix: str = ""):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            self._bytes -= self._entries.pop(key)[2]
+
+    def stats(self) -> dict:
+        lookups = self.metrics["hits"] + self.metrics["stale_hits"] + self.metrics["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self._inflight),
+            **self.metrics,
+            "hit_ratio": (
+                round((self.metrics["hits"] + self.metrics["stale_hits"]) / lookups, 3)
+                if lookups else 0.0
+            ),
+        }
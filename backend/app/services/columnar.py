@@ -0,0 +1,85 @@
+"""Column-oriented results and their JSON encoding.
+
+Long series (over-time buckets, log pages) can be served as one array per
+column, `{"bucket": [...], "blocked": [...]}`, instead of a list of
+objects. Columns are built straight from cursor tuples, skip FastAPI's
+jsonable_encoder and are written out a chunk at a time. orjson is used
+when installed, the stdlib json module otherwise.
+"""
+from __future__ import annotations
+
+import json
+from typing import Iterator
+
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+Columns = dict[str, list]
+
+# Values encoded per write, and bytes buffered before a chunk is sent
+_SLICE = 2000
+_FLUSH_BYTES = 64 * 1024
+
+
+def from_cursor(description, rows: list) -> Columns:
+    """Transpose cursor tuples into columns named after `description`."""
+    names = [c[0] for c in description]
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, map(list, zip(*rows))))
+
+
+def from_rows(rows: list[dict], names: list[str]) -> Columns:
+    return {name: [r[name] for r in rows] for name in names}
+
+
+def to_rows(columns: Columns) -> list[dict]:
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def length(columns: Columns) -> int:
+    return len(next(iter(columns.values()), []))
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _encode(value) -> Iterator[bytes]:
+    if isinstance(value, dict):
+        yield b"{"
+        for i, (key, item) in enumerate(value.items()):
+            yield (b"," if i else b"") + dumps(str(key)) + b":"
+            yield from _encode(item)
+        yield b"}"
+    elif isinstance(value, list) and len(value) > _SLICE:
+        yield b"["
+        for start in range(0, len(value), _SLICE):
+            # Strip the brackets of each slice and join them with commas
+            yield (b"," if start else b"") + dumps(value[start:start + _SLICE])[1:-1]
+        yield b"]"
+    else:
+        yield dumps(value)
+
+
+def _chunks(value) -> Iterator[bytes]:
+    buffer = bytearray()
+    for piece in _encode(value):
+        buffer += piece
+        if len(buffer) >= _FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def response(content) -> StreamingResponse:
+    """JSON response for a payload holding columns, encoded as it streams."""
+    return StreamingResponse(_chunks(content), media_type="application/json")
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from app.config import settings
+from app.services import columnar
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "file_id", "created_at", "last_used")
+
+    def __init__(self, conn: aiosqlite.Connection, file_id: tuple | None):
+        self.conn = conn
+        self.file_id = file_id
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+def _file_id(path: str) -> tuple | None:
+    """Identity of the database file. Changes when FTL or gravity rotates the
+    file (new inode), in which case old connections still see the unlinked copy."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived aiosqlite connections to one database file.
+
+    Pragmas are applied once per connection. Connections are health-checked
+    after sitting idle, and recycled when they get too old, when the file on
+    disk is replaced, or when a statement fails with a database error."""
+
+    def __init__(self, name: str, path: str, readonly: bool = True, size: int | None = None):
+        self.name = name
+        self.path = path
+        self.readonly = readonly
+        self.size = size or settings.db_pool_size
+        self._idle: deque[_PooledConnection] = deque()
+        self._sem: asyncio.Semaphore | None = None
+        self._in_use = 0
+        self._closed = False
+
+        self.metrics = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "health_check_failures": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+        }
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.size)
+        return self._sem
+
+    async def _connect(self) -> _PooledConnection:
+        file_id = _file_id(self.path)
+        if self.readonly:
+            conn = await aiosqlite.connect(f"file:{self.path}?mode=ro", uri=True)
+        else:
+            conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute(f"PRAGMA busy_timeout = {int(settings.db_busy_timeout_ms)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(settings.db_mmap_size)}")
+        await conn.execute(f"PRAGMA cache_size = -{int(settings.db_cache_size_kb)}")
+        if self.readonly:
+            await conn.execute("PRAGMA query_only = ON")
+        else:
+            await conn.execute("PRAGMA journal_mode = WAL")
+        self.metrics["created"] += 1
+        return _PooledConnection(conn, file_id)
+
+    async def _discard(self, pc: _PooledConnection):
+        self.metrics["recycled"] += 1
+        try:
+            await pc.conn.close()
+        except Exception:
+            pass
+
+    async def _checkout(self) -> _PooledConnection:
+        now = time.monotonic()
+        current_id = _file_id(self.path)
+        while self._idle:
+            pc = self._idle.pop()
+            if (
+                pc.file_id != current_id
+                or now - pc.created_at > settings.db_pool_max_lifetime
+            ):
+                await self._discard(pc)
+                continue
+            if now - pc.last_used > settings.db_pool_health_check_interval:
+                try:
+                    await pc.conn.execute("SELECT 1")
+                except Exception:
+                    self.metrics["health_check_failures"] += 1
+                    await self._discard(pc)
+                    continue
+            return pc
+        return await self._connect()
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._closed:
+            raise RuntimeError(f"connection pool '{self.name}' is closed")
+        sem = self._semaphore()
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(sem.acquire(), settings.db_pool_timeout)
+        except asyncio.TimeoutError:
+            self.metrics["timeouts"] += 1
+            raise PoolTimeout(f"timed out waiting for a '{self.name}' connection")
+        waited_ms = (time.monotonic() - start) * 1000
+        self.metrics["checkouts"] += 1
+        self.metrics["wait_time_total_ms"] += waited_ms
+        self.metrics["wait_time_max_ms"] = max(self.metrics["wait_time_max_ms"], waited_ms)
+
+        pc = None
+        self._in_use += 1
+        try:
+            pc = await self._checkout()
+            yield pc.conn
+        except sqlite3.DatabaseError:
+            # Corrupt/rotated file or schema change: don't hand this one out again
+            if pc is not None:
+                await self._discard(pc)
+                pc = None
+            raise
+        finally:
+            if pc is not None:
+                if not self.readonly and pc.conn.in_transaction:
+                    await pc.conn.rollback()
+                if self._closed:
+                    await self._discard(pc)
+                else:
+                    pc.last_used = time.monotonic()
+                    self._idle.append(pc)
+            self._in_use -= 1
+            sem.release()
+
+    async def fetch_all(self, query: str, params: tuple = ()) -> list[dict]:
+        async with self.acquire() as db:
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(r) for r in rows]
+
+    async def fetch_one(self, query: str, params: tuple = ()) -> dict | None:
+        async with self.acquire() as db:
+            async with db.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+
+    async def fetch_columns(self, query: str, params: tuple = ()) -> dict[str, list]:
+        async with self.acquire() as db:
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+                return columnar.from_cursor(cursor.description, rows)
+
+    async def stream(self, query: str, params: tuple = (), chunk_size: int = 5000):
+        """Yield result rows in chunks from a server-side cursor, holding one
+        connection for the lifetime of the iteration."""
+        async with self.acquire() as db:
+            async with db.execute(query, params) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    async def close(self):
+        self._closed = True
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+    def stats(self) -> dict:
+        checkouts = self.metrics["checkouts"]
+        return {
+            "path": self.path,
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            **self.metrics,
+            "wait_time_avg_ms": (
+                round(self.metrics["wait_time_total_ms"] / checkouts, 3) if checkouts else 0.0
+            ),
+        }
+
+
+_pools: dict[str, ConnectionPool] = {}
+
+
+def _pool_config(name: str) -> tuple[str, bool, int]:
+    if name == "ftl":
+        return settings.ftl_db_path, True, settings.db_pool_size
+    if name == "gravity":
+        return settings.gravity_db_path, True, settings.db_pool_size
+    if name == "dashboard":
+        return settings.dashboard_db_path, False, settings.dashboard_pool_size
+    raise KeyError(f"Unknown connection pool: {name}")
+
+
+def get_pool(name: str) -> ConnectionPool:
+    """Return the shared pool for 'ftl', 'gravity' or 'dashboard', creating it on first use."""
+    pool = _pools.get(name)
+    if pool is None:
+        path, readonly, size = _pool_config(name)
+        pool = ConnectionPool(name, path, readonly=readonly, size=size)
+        _pools[name] = pool
+    return pool
+
+
+async def close_all():
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
+
+
+def get_metrics() -> dict:
+    return {name: pool.stats() for name, pool in _pools.items()}
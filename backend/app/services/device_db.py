@@ -1,7 +1,6 @@
 from __future__ import annotations
 
-import aiosqlite
-from app.config import settings
+from app.services import db_pool
 
 _initialized = False
 
@@ -10,7 +9,7 @@ async def init_db():
     global _initialized
     if _initialized:
         return
-    async with aiosqlite.connect(settings.dashboard_db_path) as db:
+    async with db_pool.get_pool("dashboard").acquire() as db:
         await db.execute(
             """
             CREATE TABLE IF NOT EXISTS device_nicknames (
@@ -37,8 +36,7 @@ async def init_db():
 
 async def get_nicknames() -> dict[str, dict]:
     await init_db()
-    async with aiosqlite.connect(settings.dashboard_db_path) as db:
-        db.row_factory = aiosqlite.Row
+    async with db_pool.get_pool("dashboard").acquire() as db:
         async with db.execute("SELECT mac, nickname, icon FROM device_nicknames") as c:
             rows = await c.fetchall()
             return {r["mac"]: {"nickname": r["nickname"], "icon": r["icon"]} for r in rows}
@@ -46,7 +44,7 @@ async def get_nicknames() -> dict[str, dict]:
 
 async def set_nickname(mac: str, nickname: str, icon: str | None = None):
     await init_db()
-    async with aiosqlite.connect(settings.dashboard_db_path) as db:
+    async with db_pool.get_pool("dashboard").acquire() as db:
         await db.execute(
             """
             INSERT INTO device_nicknames (mac, nickname, icon)
@@ -61,8 +59,7 @@ async def set_nickname(mac: str, nickname: str, icon: str | None = None):
 # Timed blocks persistence
 async def get_active_timed_blocks() -> list[dict]:
     await init_db()
-    async with aiosqlite.connect(settings.dashboard_db_path) as db:
-        db.row_factory = aiosqlite.Row
+    async with db_pool.get_pool("dashboard").acquire() as db:
         async with db.execute(
             "SELECT id, domain, created_at, expires_at FROM timed_blocks WHERE active = 1"
         ) as c:
@@ -70,20 +67,21 @@ async def get_active_timed_blocks() -> list[dict]:
             return [dict(r) for r in rows]
 
 
-async def add_timed_block(block_id: str, domain: str, created_at: int, expires_at: int):
+async def add_timed_blocks(blocks: list[dict]):
+    """Persist blocks ({id, domain, created_at, expires_at}) in one transaction."""
     await init_db()
-    async with aiosqlite.connect(settings.dashboard_db_path) as db:
-        await db.execute(
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        await db.executemany(
             "INSERT INTO timed_blocks (id, domain, created_at, expires_at, active) VALUES (?, ?, ?, ?, 1)",
-            (block_id, domain, created_at, expires_at),
+            [(b["id"], b["domain"], b["created_at"], b["expires_at"]) for b in blocks],
         )
         await db.commit()
 
 
-async def deactivate_timed_block(block_id: str):
+async def deactivate_timed_blocks(block_ids: list[str]):
     await init_db()
-    async with aiosqlite.connect(settings.dashboard_db_path) as db:
-        await db.execute(
-            "UPDATE timed_blocks SET active = 0 WHERE id = ?", (block_id,)
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        await db.executemany(
+            "UPDATE timed_blocks SET active = 0 WHERE id = ?", [(i,) for i in block_ids]
         )
         await db.commit()
@@ -0,0 +1,91 @@
+"""In-memory MAC <-> IP index over FTL's network tables.
+
+Refreshed incrementally from rows whose network.lastQuery or
+network_addresses.lastSeen moved since the last pass, with a periodic full
+reload to drop devices and addresses FTL has forgotten.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import defaultdict
+
+from app.config import settings
+from app.services import db_pool
+
+_ips_by_mac: dict[str, dict[str, int]] = defaultdict(dict)
+_mac_by_ip: dict[str, str] = {}
+_high_water = 0
+_refreshed_at: float = 0
+_full_refreshed_at: float = 0
+_lock: asyncio.Lock | None = None
+
+
+def _apply(rows: list[dict]):
+    global _high_water
+    for r in rows:
+        mac, ip = r["mac"], r["ip"]
+        _high_water = max(_high_water, r["last_query"] or 0, r["last_seen"] or 0)
+        if not ip:
+            _ips_by_mac.setdefault(mac, {})
+            continue
+        previous = _mac_by_ip.get(ip)
+        if previous and previous != mac:
+            # Address was reassigned to another device
+            _ips_by_mac[previous].pop(ip, None)
+        _mac_by_ip[ip] = mac
+        _ips_by_mac[mac][ip] = r["last_seen"] or 0
+
+
+async def _refresh(full: bool):
+    global _high_water, _refreshed_at, _full_refreshed_at
+    since = 0 if full else _high_water
+    rows = await db_pool.get_pool("ftl").fetch_all(
+        """
+        SELECT n.hwaddr as mac, na.ip, n.lastQuery as last_query, na.lastSeen as last_seen
+        FROM network n
+        LEFT JOIN network_addresses na ON na.network_id = n.id
+        WHERE n.hwaddr != '00:00:00:00:00:00'
+            AND (n.lastQuery >= ? OR na.lastSeen >= ?)
+        """,
+        (since, since),
+    )
+    if full:
+        _ips_by_mac.clear()
+        _mac_by_ip.clear()
+        _high_water = 0
+        _full_refreshed_at = time.monotonic()
+    _apply(rows)
+    _refreshed_at = time.monotonic()
+
+
+async def _ensure_fresh():
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    now = time.monotonic()
+    if now - _refreshed_at < settings.device_registry_ttl:
+        return
+    async with _lock:
+        now = time.monotonic()
+        if now - _refreshed_at < settings.device_registry_ttl:
+            return
+        full = now - _full_refreshed_at >= settings.device_registry_full_refresh
+        await _refresh(full)
+
+
+async def get_ips(mac: str) -> list[str]:
+    """All known IPs of a device (IPv4 and IPv6), most recently seen first."""
+    await _ensure_fresh()
+    ips = _ips_by_mac.get(mac, {})
+    return sorted(ips, key=ips.get, reverse=True)
+
+
+async def get_macs_by_ip() -> dict[str, str]:
+    await _ensure_fresh()
+    return dict(_mac_by_ip)
+
+
+async def get_mac(ip: str) -> str | None:
+    await _ensure_fresh()
+    return _mac_by_ip.get(ip)
@@ -0,0 +1,128 @@
+"""Trigram substring index over FTL's domain_by_id table.
+
+Kept as a contentless FTS5 table in dashboard.db whose rowids are FTL domain
+ids, so a substring search resolves to a short list of integer ids that the
+log queries can filter on instead of running `LIKE '%q%'` on every row.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+
+from app.config import settings
+from app.services import db_pool, ftl_schema
+
+logger = logging.getLogger(__name__)
+
+_available = False
+_ready = False
+# Highest domain_by_id id in the index; newer domains aren't matched by it yet
+_indexed_id = 0
+_task: asyncio.Task | None = None
+
+
+async def init_db():
+    global _available
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        try:
+            await db.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS domain_fts
+                USING fts5(domain, tokenize = 'trigram', content = '')
+                """
+            )
+            await db.commit()
+            _available = True
+        except sqlite3.OperationalError:
+            # SQLite older than 3.34 has no trigram tokenizer
+            logger.warning("FTS5 trigram tokenizer unavailable; domain search uses LIKE")
+            _available = False
+
+
+async def _sync() -> int:
+    """Index domain_by_id rows added since the last pass. Returns rows added."""
+    global _indexed_id
+    ftl = db_pool.get_pool("ftl")
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        async with db.execute("SELECT COALESCE(MAX(rowid), 0) as last_id FROM domain_fts") as c:
+            last_id = (await c.fetchone())["last_id"]
+        _indexed_id = last_id
+
+        bounds = await ftl.fetch_one("SELECT COALESCE(MAX(id), 0) as max_id FROM domain_by_id")
+        max_id = bounds["max_id"] if bounds else 0
+        if max_id < last_id:
+            # FTL's database was recreated; ids no longer line up
+            await db.execute("INSERT INTO domain_fts(domain_fts) VALUES ('delete-all')")
+            last_id = _indexed_id = 0
+
+        added = 0
+        async for chunk in ftl.stream(
+            "SELECT id, domain FROM domain_by_id WHERE id > ? ORDER BY id",
+            (last_id,),
+        ):
+            await db.executemany(
+                "INSERT INTO domain_fts (rowid, domain) VALUES (?, ?)",
+                [(r["id"], r["domain"]) for r in chunk],
+            )
+            # Commit per chunk so the initial build doesn't hold the write lock
+            await db.commit()
+            _indexed_id = chunk[-1]["id"]
+            added += len(chunk)
+        await db.commit()
+        return added
+
+
+async def _sync_loop():
+    global _ready
+    while True:
+        try:
+            await _sync()
+            _ready = True
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Domain index sync failed")
+        await asyncio.sleep(settings.domain_index_interval)
+
+
+async def start():
+    global _task
+    if not (settings.domain_index_enabled and ftl_schema.has_ids):
+        return
+    await init_db()
+    if _available:
+        _task = asyncio.create_task(_sync_loop())
+
+
+async def stop():
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+async def match_ids(q: str) -> tuple[list[int], int] | None:
+    """FTL domain ids whose domain contains `q` (case-insensitive), and the
+    highest id indexed: domains with larger ids were added since the last
+    sync and have to be matched some other way.
+
+    Returns None when the index can't answer — not built yet, query shorter
+    than a trigram, or so many matches that a plain scan is cheaper — and
+    the caller should fall back to LIKE."""
+    if not (_ready and len(q) >= 3):
+        return None
+    limit = settings.domain_index_max_ids
+    indexed_id = _indexed_id
+    phrase = '"' + q.replace('"', '""') + '"'
+    rows = await db_pool.get_pool("dashboard").fetch_all(
+        "SELECT rowid as id FROM domain_fts WHERE domain_fts MATCH ? LIMIT ?",
+        (phrase, limit + 1),
+    )
+    if len(rows) > limit:
+        return None
+    return [r["id"] for r in rows], indexed_id
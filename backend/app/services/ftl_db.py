@@ -1,367 +1,884 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import functools
+import inspect
+import json
 import time
-import aiosqlite
+from typing import AsyncIterator
 from app.config import settings
+from app.services import (
+    analytics, archive, columnar, db_pool, domain_index, ftl_schema, gravity_match, rollups, workers,
+)
+from app.services.cache import AsyncCache
 
-_cache: dict[str, tuple[float, any]] = {}
-_max_ts: int | None = None
-_max_ts_fetched: float = 0
+_cache = AsyncCache(
+    "ftl",
+    max_entries=settings.cache_max_entries,
+    max_bytes=settings.cache_max_bytes,
+    stale_ttl=settings.cache_stale_ttl,
+)
 
 
-def _get_cached(key: str, ttl: int):
-    if key in _cache:
-        ts, val = _cache[key]
-        if time.time() - ts < ttl:
-            return val
-    return None
+def _cached(prefix: str, ttl_setting: str):
+    """Cache a coroutine's result under `prefix:arg1:arg2...` for the TTL
+    named by `ttl_setting`."""
+    def decorator(fn):
+        signature = inspect.signature(fn)
 
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = ":".join([prefix, *(str(v) for v in bound.arguments.values())])
+            return await _cache.get_or_load(
+                key, getattr(settings, ttl_setting), lambda: fn(*args, **kwargs)
+            )
+        return wrapper
+    return decorator
 
-def _set_cached(key: str, val):
-    _cache[key] = (time.time(), val)
+
+def get_cache_stats() -> dict:
+    return _cache.stats()
 
 
 async def _get_max_timestamp() -> int:
     """Get the latest query timestamp from FTL, cached for 30s.
     Falls back to system time if no data exists."""
-    global _max_ts, _max_ts_fetched
-    now = time.time()
-    if _max_ts is not None and now - _max_ts_fetched < 30:
-        return _max_ts
-    row = await _fetch_one("SELECT MAX(timestamp) as max_ts FROM query_storage")
-    if row and row["max_ts"]:
-        _max_ts = int(row["max_ts"])
-    else:
-        _max_ts = int(now)
-    _max_ts_fetched = now
-    return _max_ts
+    async def load() -> int:
+        row = await _fetch_one(
+            f"SELECT MAX(timestamp) as max_ts FROM {ftl_schema.table}",
+            priority=workers.INTERACTIVE,
+        )
+        if row and row["max_ts"]:
+            return int(row["max_ts"])
+        return int(time.time())
+
+    return await _cache.get_or_load("max_ts", 30, load)
+
+
+async def _get_min_timestamp() -> int | None:
+    """The oldest query timestamp FTL still has, cached for 5 minutes."""
+    async def load() -> int | None:
+        row = await _fetch_one(
+            f"SELECT MIN(timestamp) as min_ts FROM {ftl_schema.table}",
+            priority=workers.INTERACTIVE,
+        )
+        return int(row["min_ts"]) if row and row["min_ts"] is not None else None
 
+    return await _cache.get_or_load("min_ts", 300, load)
 
-async def _now() -> int:
+
+async def now() -> int:
     """Reference timestamp for queries — uses latest FTL data timestamp
     so queries work even when system clock is ahead of DB data."""
     return await _get_max_timestamp()
 
 
-async def _fetch_all(query: str, params: tuple = ()) -> list[dict]:
-    async with aiosqlite.connect(
-        f"file:{settings.ftl_db_path}?mode=ro", uri=True
-    ) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(r) for r in rows]
+async def _fetch_all(query: str, params: tuple = (), priority: int = workers.HEAVY) -> list[dict]:
+    return await workers.fetch_all(query, params, priority)
 
 
-async def _fetch_one(query: str, params: tuple = ()) -> dict | None:
-    async with aiosqlite.connect(
-        f"file:{settings.ftl_db_path}?mode=ro", uri=True
-    ) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(query, params) as cursor:
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+async def _fetch_one(query: str, params: tuple = (), priority: int = workers.HEAVY) -> dict | None:
+    return await workers.fetch_one(query, params, priority)
 
 
-async def get_summary(hours: int = 24) -> dict:
-    cache_key = f"summary:{hours}"
-    cached = _get_cached(cache_key, settings.stats_cache_ttl)
-    if cached is not None:
-        return cached
+async def _fetch_columns(
+    query: str, params: tuple = (), priority: int = workers.HEAVY
+) -> columnar.Columns:
+    return await workers.fetch_columns(query, params, priority)
 
-    since = (await _now()) - hours * 3600
-    row = await _fetch_one(
-        """
-        SELECT
-            COUNT(*) as total_queries,
-            SUM(CASE WHEN status IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as blocked_queries,
-            COUNT(DISTINCT domain) as unique_domains,
-            COUNT(DISTINCT client) as unique_clients
-        FROM queries
-        WHERE timestamp > ?
-        """,
-        (since,),
+
+_SUMMARY_KEYS = ("total_queries", "blocked_queries", "unique_domains", "unique_clients")
+
+
+async def _archive_plan(since: int) -> dict | None:
+    """Which archive partitions to read for a window starting at `since`,
+    and where FTL takes over from them. None when FTL alone should answer:
+    the window starts after the archive ends, or before it starts while FTL
+    still has older rows (the first backfill is under way)."""
+    run = archive.coverage()
+    if not run or since >= run[-1]["day_end"]:
+        return None
+    if since < run[0]["day_start"]:
+        ftl_start = await _get_min_timestamp()
+        if ftl_start is not None and ftl_start < run[0]["day_start"]:
+            return None
+    return {
+        "partitions": [(p["path"], p["day_start"], p["day_end"]) for p in run if p["day_end"] > since],
+        "tail_start": run[-1]["day_end"],
+    }
+
+
+async def _from_archive(
+    since: int,
+    limit: int = 0,
+    resolution: int = 86400,
+    pattern_since: int | None = None,
+    detail: bool = True,
+) -> dict | None:
+    """analytics.archive_pass() over the plan for a window starting at
+    `since`, or None when _archive_plan() declines it. The archive holds
+    10-minute buckets, so finer series are left to FTL."""
+    if pattern_since is None:
+        pattern_since = since
+    if resolution < analytics.ARCHIVE_BUCKET:
+        return None
+    plan = await _archive_plan(min(since, pattern_since))
+    if plan is None:
+        return None
+    return await workers.run(
+        analytics.archive_pass,
+        ftl_schema.table, ftl_schema.has_ids, plan["partitions"], plan["tail_start"],
+        since, pattern_since, limit, rollups.BLOCKED_STATUSES,
+        resolution, rollups.bucket_offset(resolution), detail,
+        label=f"archive pass over {len(plan['partitions'])} partitions",
     )
-    if row and row["total_queries"] > 0:
+
+
+def _add_blocked_percentage(row: dict):
+    if row.get("total_queries"):
         row["blocked_percentage"] = round(
             row["blocked_queries"] / row["total_queries"] * 100, 1
         )
     else:
-        row = row or {}
         row["blocked_percentage"] = 0.0
 
-    _set_cached(cache_key, row)
-    return row
 
+@_cached("summary", "stats_cache_ttl")
+async def get_summary(hours: int = 24, approx: bool = False) -> dict:
+    """Query totals and distinct counts. With `approx`, distinct counts are
+    estimated from the rollup sketches when they cover the window, with
+    their relative error under `error`; without it (or when the rollups
+    can't answer) counts are exact and `error` is absent. Windows the
+    rollups don't cover are read from the archive where it has them."""
+    since = (await now()) - hours * 3600
+    if approx and await rollups.covers(since):
+        row = await rollups.get_sketch_summary(since)
+    elif await rollups.covers(since):
+        row = await rollups.get_summary(since)
+    elif (agg := await _from_archive(since)) is not None:
+        row = {key: agg[key] for key in _SUMMARY_KEYS}
+    else:
+        row = await _fetch_one(
+            f"""
+            SELECT
+                COUNT(*) as total_queries,
+                SUM(CASE WHEN status IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as blocked_queries,
+                COUNT(DISTINCT domain) as unique_domains,
+                json_group_array(DISTINCT client) as clients
+            FROM {ftl_schema.table}
+            WHERE timestamp > ?
+            """,
+            (since,),
+        )
+        # Several client ids can share an IP (one per host name seen)
+        clients = await ftl_schema.resolve("client", json.loads(row.pop("clients")))
+        row["unique_clients"] = len(set(clients.values()))
+    row = row or {}
+    _add_blocked_percentage(row)
+    return row
 
-async def get_top_domains(hours: int = 24, limit: int = 10) -> list[dict]:
-    cache_key = f"top_domains:{hours}:{limit}"
-    cached = _get_cached(cache_key, settings.stats_cache_ttl)
-    if cached is not None:
-        return cached
 
-    since = (await _now()) - hours * 3600
-    rows = await _fetch_all(
-        """
-        SELECT domain, COUNT(*) as count
-        FROM queries
-        WHERE timestamp > ?
-        GROUP BY domain
-        ORDER BY count DESC
-        LIMIT ?
-        """,
-        (since, limit),
-    )
-    _set_cached(cache_key, rows)
+@_cached("top_domains", "stats_cache_ttl")
+async def get_top_domains(hours: int = 24, limit: int = 10, approx: bool = False) -> list[dict]:
+    """Most queried domains. With `approx` and rollups covering the window,
+    counts come from the hourly top-K summaries and each row's `error` is
+    how far below the true count it may be."""
+    since = (await now()) - hours * 3600
+    if approx and await rollups.covers(since):
+        rows = await rollups.get_sketch_top_domains(since, limit)
+    elif await rollups.covers(since):
+        rows = await rollups.get_top_domains(since, limit)
+    elif (agg := await _from_archive(since, limit)) is not None:
+        rows = [{"domain": d, "count": c} for d, c in agg["top_domains"]]
+    else:
+        rows = await _fetch_all(
+            f"""
+            SELECT domain, COUNT(*) as count
+            FROM {ftl_schema.table}
+            WHERE timestamp > ?
+            GROUP BY domain
+            ORDER BY count DESC
+            LIMIT ?
+            """,
+            (since, limit),
+        )
+        await ftl_schema.resolve_rows(rows, "domain")
     return rows
 
 
-async def get_top_blocked(hours: int = 24, limit: int = 10) -> list[dict]:
-    cache_key = f"top_blocked:{hours}:{limit}"
-    cached = _get_cached(cache_key, settings.stats_cache_ttl)
-    if cached is not None:
-        return cached
-
-    since = (await _now()) - hours * 3600
-    rows = await _fetch_all(
-        """
-        SELECT domain, COUNT(*) as count
-        FROM queries
-        WHERE timestamp > ? AND status IN (1,4,5,6,7,8,9,10,11)
-        GROUP BY domain
-        ORDER BY count DESC
-        LIMIT ?
-        """,
-        (since, limit),
-    )
-    _set_cached(cache_key, rows)
+@_cached("top_blocked", "stats_cache_ttl")
+async def get_top_blocked(hours: int = 24, limit: int = 10, approx: bool = False) -> list[dict]:
+    """Most blocked domains; `approx` as for get_top_domains()."""
+    since = (await now()) - hours * 3600
+    if approx and await rollups.covers(since):
+        rows = await rollups.get_sketch_top_domains(since, limit, blocked_only=True)
+    elif await rollups.covers(since):
+        rows = await rollups.get_top_domains(since, limit, blocked_only=True)
+    elif (agg := await _from_archive(since, limit)) is not None:
+        rows = [{"domain": d, "count": c} for d, c in agg["top_blocked"]]
+    else:
+        rows = await _fetch_all(
+            f"""
+            SELECT domain, COUNT(*) as count
+            FROM {ftl_schema.table}
+            WHERE timestamp > ? AND status IN (1,4,5,6,7,8,9,10,11)
+            GROUP BY domain
+            ORDER BY count DESC
+            LIMIT ?
+            """,
+            (since, limit),
+        )
+        await ftl_schema.resolve_rows(rows, "domain")
     return rows
 
 
-async def get_over_time(hours: int = 24) -> list[dict]:
-    cache_key = f"over_time:{hours}"
-    cached = _get_cached(cache_key, settings.stats_cache_ttl)
-    if cached is not None:
-        return cached
-
-    since = (await _now()) - hours * 3600
-    interval = 600  # 10-minute buckets
-    rows = await _fetch_all(
-        """
+RESOLUTIONS = {"1m": 60, "10m": 600, "1h": 3600, "1d": 86400}
+DEFAULT_BUCKETS = 200
+_MAX_BUCKETS = 5000
+
+
+def pick_resolution(hours: int, resolution: str | None = None, buckets: int = DEFAULT_BUCKETS) -> int:
+    """Bucket size in seconds for a window of `hours`: `resolution` when
+    given, otherwise the finest one that keeps the series within `buckets`
+    points."""
+    span = hours * 3600
+    if resolution is not None:
+        seconds = RESOLUTIONS[resolution]
+        if span // seconds > _MAX_BUCKETS:
+            raise ValueError(f"{resolution} buckets over {hours}h exceed {_MAX_BUCKETS} points")
+        return seconds
+    for seconds in rollups.RESOLUTIONS:
+        if span // seconds <= buckets:
+            return seconds
+    return rollups.RESOLUTIONS[-1]
+
+
+async def _over_time_scan(since: int, resolution: int, clients: str | None = None) -> columnar.Columns:
+    """Blocked/allowed columns per `resolution` seconds straight from FTL,
+    optionally for the client keys in `clients`."""
+    condition, params = "", ()
+    if clients is not None:
+        condition, params = "AND client IN (SELECT value FROM json_each(?))", (clients,)
+    offset = rollups.bucket_offset(resolution)
+    return await _fetch_columns(
+        f"""
         SELECT
-            (timestamp / ?) * ? as bucket,
+            ((timestamp + ?) / ?) * ? - ? as bucket,
             SUM(CASE WHEN status IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as blocked,
             SUM(CASE WHEN status NOT IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as allowed
-        FROM queries
-        WHERE timestamp > ?
+        FROM {ftl_schema.table}
+        WHERE timestamp > ? {condition}
         GROUP BY bucket
         ORDER BY bucket
         """,
-        (interval, interval, since),
+        (offset, resolution, resolution, offset, since, *params),
     )
-    _set_cached(cache_key, rows)
-    return rows
 
 
-async def get_hourly_pattern(days: int = 7) -> list[dict]:
-    cache_key = f"hourly_pattern:{days}"
-    cached = _get_cached(cache_key, settings.heavy_cache_ttl)
-    if cached is not None:
-        return cached
+async def get_over_time(
+    hours: int = 24,
+    resolution: str | None = None,
+    buckets: int = DEFAULT_BUCKETS,
+    columns: bool = False,
+) -> list[dict] | columnar.Columns:
+    """Blocked/allowed counts over time, as rows or as bucket/blocked/allowed
+    columns. The bucket size comes from pick_resolution()."""
+    result = await _get_over_time_columns(hours, pick_resolution(hours, resolution, buckets))
+    return result if columns else columnar.to_rows(result)
 
-    since = (await _now()) - days * 86400
-    rows = await _fetch_all(
-        """
-        SELECT
-            CAST(strftime('%w', timestamp, 'unixepoch', 'localtime') AS INTEGER) as day_of_week,
-            CAST(strftime('%H', timestamp, 'unixepoch', 'localtime') AS INTEGER) as hour,
-            COUNT(*) as count
-        FROM queries
-        WHERE timestamp > ?
-        GROUP BY day_of_week, hour
-        ORDER BY day_of_week, hour
-        """,
-        (since,),
-    )
-    _set_cached(cache_key, rows)
+
+@_cached("over_time", "stats_cache_ttl")
+async def _get_over_time_columns(hours: int, resolution: int) -> columnar.Columns:
+    since = (await now()) - hours * 3600
+    if await rollups.covers(since):
+        return await rollups.get_over_time(since, resolution)
+    agg = await _from_archive(since, resolution=resolution, detail=False)
+    if agg is not None:
+        return agg["over_time"]
+    return await _over_time_scan(since, resolution)
+
+
+@_cached("hourly_pattern", "heavy_cache_ttl")
+async def get_hourly_pattern(days: int = 7) -> list[dict]:
+    since = (await now()) - days * 86400
+    # A lagging heatmap is fine, so it's served from the rollups straight after a restart
+    if await rollups.covers(since, allow_lag=True):
+        rows = await rollups.get_hourly_pattern(since)
+    elif (agg := await _from_archive(since, detail=False)) is not None:
+        rows = agg["hourly_pattern"]
+    else:
+        rows = await _fetch_all(
+            f"""
+            SELECT
+                CAST(strftime('%w', timestamp, 'unixepoch', 'localtime') AS INTEGER) as day_of_week,
+                CAST(strftime('%H', timestamp, 'unixepoch', 'localtime') AS INTEGER) as hour,
+                COUNT(*) as count
+            FROM {ftl_schema.table}
+            WHERE timestamp > ?
+            GROUP BY day_of_week, hour
+            ORDER BY day_of_week, hour
+            """,
+            (since,),
+        )
     return rows
 
 
+@_cached("blocklist_effectiveness", "heavy_cache_ttl")
 async def get_blocklist_effectiveness() -> list[dict]:
-    cache_key = "blocklist_effectiveness"
-    cached = _get_cached(cache_key, settings.heavy_cache_ttl)
-    if cached is not None:
-        return cached
-
-    # This requires joining with gravity.db, so we query FTL for blocked domains
-    # and then match against adlists. For simplicity, we get the top blocked
-    # domains and their counts.
-    since = (await _now()) - 86400
+    """Blocked queries of the last 24 hours per adlist, regex or list that
+    blocked them."""
+    since = (await now()) - 86400
     rows = await _fetch_all(
-        """
-        SELECT
-            COALESCE(additional_info, 'unknown') as source,
-            COUNT(*) as count
-        FROM queries
+        f"""
+        SELECT status, domain, additional_info, COUNT(*) as count
+        FROM {ftl_schema.table}
         WHERE timestamp > ? AND status IN (1,4,5,6,7,8,9,10,11)
-            AND additional_info IS NOT NULL AND additional_info != ''
-        GROUP BY source
-        ORDER BY count DESC
-        LIMIT 20
+        GROUP BY status, domain, additional_info
         """,
         (since,),
     )
-    _set_cached(cache_key, rows)
-    return rows
+    return await _attribute_blocked(
+        [(r["status"], r["domain"], r["additional_info"], r["count"]) for r in rows]
+    )
 
 
-async def get_queries(
-    page: int = 1,
-    per_page: int = 50,
+async def evaluate_entries(entries: list[dict], days: int = 7, samples: int = 10) -> dict:
+    """Dry run of list entries ({domain, type}) against the distinct domains
+    queried in the last `days` days: per entry and in total, how many
+    domains, queries and clients they would have matched."""
+    since = (await now()) - days * 86400
+    candidates = []
+    for e in entries:
+        if e["type"] == "wildcard":
+            candidates.append(("suffix", e["domain"].lower()))
+        elif e["type"] in ("regex_black", "regex_white"):
+            candidates.append(("regex", gravity_match.entry_expression(e["domain"], e["type"])))
+        else:
+            candidates.append(("exact", e["domain"].lower()))
+    result = await workers.run(
+        analytics.evaluate_entries, ftl_schema.table, ftl_schema.has_ids, since, candidates, samples,
+        label=f"evaluate {len(entries)} entries over {days}d",
+    )
+
+    summaries = [r for r in result["entries"] if "error" not in r] + [result["total"]]
+    names = await ftl_schema.resolve(
+        "client", {c for r in summaries for c, _ in r["top_clients"]}
+    )
+    for r in summaries:
+        r["top_clients"] = [{"client": names[c], "count": n} for c, n in r["top_clients"]]
+        r["sample_domains"] = [{"domain": d, "count": n} for d, n in r["sample_domains"]]
+    result["entries"] = [
+        {**e, "expression": gravity_match.entry_expression(e["domain"], e["type"]), **r}
+        for e, r in zip(entries, result["entries"])
+    ]
+    return {"days": days, **result}
+
+
+async def _attribute_blocked(rows: list[tuple]) -> list[dict]:
+    """Resolve (status, domain, additional_info, count) rows to the name FTL
+    matched, the CNAME target for CNAME blocks, and attribute them."""
+    cname = gravity_match.CNAME_STATUSES
+    domains = await ftl_schema.resolve("domain", {d for s, d, _, _ in rows if s not in cname})
+    targets = await ftl_schema.resolve(
+        "additional_info", {i for s, _, i, _ in rows if s in cname and i is not None}
+    )
+    blocked = [
+        (s, targets.get(i) if s in cname else domains[d], c) for s, d, i, c in rows
+    ]
+    return await gravity_match.attribute(blocked)
+
+
+async def get_dashboard(
+    hours: int = 24,
+    limit: int = 10,
+    resolution: str | None = None,
+    buckets: int = DEFAULT_BUCKETS,
+    columns: bool = False,
+    approx: bool = False,
+) -> dict:
+    """Everything the Dashboard view shows, in one payload; `columns`
+    returns over_time as columns, bucketed by pick_resolution() and with
+    the bucket size in seconds under `resolution`. `approx` is as for
+    get_summary() and get_top_domains().
+
+    Served from the rollups when they cover the window, then from the
+    archive partitions it overlaps; otherwise computed from a single
+    streamed pass over the FTL window instead of one scan per widget."""
+    result = await _get_dashboard(hours, limit, pick_resolution(hours, resolution, buckets), approx)
+    if columns:
+        return result
+    return {**result, "over_time": columnar.to_rows(result["over_time"])}
+
+
+@_cached("dashboard", "stats_cache_ttl")
+async def _get_dashboard(hours: int, limit: int, resolution: int, approx: bool) -> dict:
+    latest = await now()
+    since = latest - hours * 3600
+    pattern_since = latest - max(hours // 24, 1) * 86400
+
+    if await rollups.covers(min(since, pattern_since)):
+        if approx:
+            load_summary, load_top = rollups.get_sketch_summary, rollups.get_sketch_top_domains
+        else:
+            load_summary, load_top = rollups.get_summary, rollups.get_top_domains
+        summary, top_domains, top_blocked, over_time, hourly, effectiveness = await asyncio.gather(
+            load_summary(since),
+            load_top(since, limit),
+            load_top(since, limit, blocked_only=True),
+            rollups.get_over_time(since, resolution),
+            rollups.get_hourly_pattern(pattern_since),
+            get_blocklist_effectiveness(),
+        )
+        _add_blocked_percentage(summary)
+        result = {
+            "summary": summary,
+            "top_domains": top_domains,
+            "top_blocked": top_blocked,
+            "over_time": over_time,
+            "hourly_pattern": hourly,
+            "blocklist_effectiveness": effectiveness,
+        }
+    elif (agg := await _from_archive(since, limit, resolution, pattern_since)) is not None:
+        summary = {key: agg[key] for key in _SUMMARY_KEYS}
+        _add_blocked_percentage(summary)
+        result = {
+            "summary": summary,
+            "top_domains": [{"domain": d, "count": c} for d, c in agg["top_domains"]],
+            "top_blocked": [{"domain": d, "count": c} for d, c in agg["top_blocked"]],
+            "over_time": agg["over_time"],
+            "hourly_pattern": agg["hourly_pattern"],
+            "blocklist_effectiveness": await get_blocklist_effectiveness(),
+        }
+    else:
+        result = await _dashboard_single_pass(latest, since, pattern_since, limit, resolution)
+    result["resolution"] = resolution
+    return result
+
+
+async def _dashboard_single_pass(
+    now: int, since: int, pattern_since: int, limit: int, resolution: int
+) -> dict:
+    # Scanned and counted on raw ids in a worker; only the top entries are
+    # resolved to names here
+    agg = await workers.run(
+        analytics.dashboard_pass,
+        ftl_schema.table, now, since, pattern_since, limit, rollups.BLOCKED_STATUSES,
+        resolution, rollups.bucket_offset(resolution),
+    )
+    top_domains, top_blocked = agg["top_domains"], agg["top_blocked"]
+    names = await ftl_schema.resolve("domain", {d for d, _ in top_domains + top_blocked})
+    client_names = await ftl_schema.resolve("client", agg["clients"])
+
+    summary = {
+        "total_queries": agg["total_queries"],
+        "blocked_queries": agg["blocked_queries"],
+        "unique_domains": agg["unique_domains"],
+        "unique_clients": len(set(client_names.values())),
+    }
+    _add_blocked_percentage(summary)
+
+    return {
+        "summary": summary,
+        "top_domains": [{"domain": names[d], "count": c} for d, c in top_domains],
+        "top_blocked": [{"domain": names[d], "count": c} for d, c in top_blocked],
+        "over_time": agg["over_time"],
+        "hourly_pattern": agg["hourly_pattern"],
+        "blocklist_effectiveness": await _attribute_blocked(agg["blocked_day"]),
+    }
+
+
+async def _domain_condition(q: str) -> tuple[str, list]:
+    """Substring filter on domain. Uses the trigram index to turn `q` into FTL
+    domain ids and matches those on query_storage's integer column, with LIKE
+    only on domains added since the index last synced; falls back to LIKE
+    when the index can't answer."""
+    match = await domain_index.match_ids(q) if ftl_schema.has_ids else None
+    if match is None:
+        return ftl_schema.domain_like(), [f"%{q}%"]
+    ids, indexed_id = match
+    return (
+        "(domain IN (SELECT value FROM json_each(?))"
+        " OR domain IN (SELECT id FROM domain_by_id WHERE id > ? AND domain LIKE ?))",
+        [json.dumps(ids), indexed_id, f"%{q}%"],
+    )
+
+
+async def _query_filters(
+    from_ts: int,
+    to_ts: int,
     domain: str | None = None,
     client: str | None = None,
     status: str | None = None,
-    from_ts: int | None = None,
-    to_ts: int | None = None,
-) -> dict:
-    now = await _now()
-    if from_ts is None:
-        from_ts = now - 86400
-    if to_ts is None:
-        to_ts = now
-
+) -> tuple[list[str], list]:
     conditions = ["timestamp >= ?", "timestamp <= ?"]
     params: list = [from_ts, to_ts]
 
     if domain:
-        conditions.append("domain LIKE ?")
-        params.append(f"%{domain}%")
+        condition, condition_params = await _domain_condition(domain)
+        conditions.append(condition)
+        params.extend(condition_params)
     if client:
-        conditions.append("client = ?")
-        params.append(client)
+        conditions.append("client IN (SELECT value FROM json_each(?))")
+        params.append(await ftl_schema.client_keys([client]))
     if status:
         status_map = {
             "blocked": "(1,4,5,6,7,8,9,10,11)",
             "allowed": "(2,3,12,13,14)",
-            "cached": "(3,)",
+            "cached": "(3)",
         }
         if status in status_map:
             conditions.append(f"status IN {status_map[status]}")
+    return conditions, params
 
-    where = " AND ".join(conditions)
-    offset = (page - 1) * per_page
 
-    count_row = await _fetch_one(
-        f"SELECT COUNT(*) as total FROM queries WHERE {where}", tuple(params)
-    )
-    total = count_row["total"] if count_row else 0
+def _encode_cursor(direction: str, ts: int, row_id: int) -> str:
+    raw = f"{direction}:{ts}:{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    rows = await _fetch_all(
-        f"""
-        SELECT id, timestamp, type, status, domain, client, forward, reply_type, reply_time, dnssec
-        FROM queries
-        WHERE {where}
-        ORDER BY timestamp DESC
-        LIMIT ? OFFSET ?
-        """,
-        tuple(params + [per_page, offset]),
+
+def _decode_cursor(cursor: str) -> tuple[str, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        direction, ts, row_id = raw.split(":")
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return direction, int(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+async def _get_total(where: str, params: tuple, wait: bool) -> int | None:
+    """Row count for a log filter, cached per filter.
+
+    A stale count is returned as-is and refreshed in the background. When
+    nothing is cached yet, `wait` decides between counting inline and
+    returning None while the count runs in the background."""
+    # A page request waiting on its count is interactive; background refreshes aren't
+    priority = workers.INTERACTIVE if wait else workers.HEAVY
+
+    async def load() -> int:
+        row = await _fetch_one(
+            f"SELECT COUNT(*) as total FROM {ftl_schema.table} WHERE {where}", params, priority
+        )
+        return row["total"] if row else 0
+
+    return await _cache.get_or_load(
+        f"log_total:{where}:{params}", settings.log_count_cache_ttl, load, wait=wait
     )
 
+
+async def get_queries(
+    page: int = 1,
+    per_page: int = 50,
+    domain: str | None = None,
+    client: str | None = None,
+    status: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+    cursor: str | None = None,
+    paging: str = "offset",
+    columns: bool = False,
+) -> dict:
+    """Page through the query log, newest first.
+
+    Offset paging (`page`) is kept for jumping to arbitrary pages. Cursor
+    paging seeks on (timestamp, id) so every page costs the same however
+    deep it is; pass the `next_cursor`/`prev_cursor` of a previous response
+    to move. Totals come from a per-filter cache refreshed in the background,
+    and may be None in cursor mode until the first count finishes. With
+    `columns`, items are returned as one list per column."""
+    latest = await now()
+    if from_ts is None:
+        from_ts = latest - 86400
+    if to_ts is None:
+        to_ts = latest
+
+    conditions, params = await _query_filters(from_ts, to_ts, domain, client, status)
+    where = " AND ".join(conditions)
+    select = "id, timestamp, type, status, domain, client, forward, reply_type, reply_time, dnssec"
+
+    if cursor or paging == "cursor":
+        direction, cursor_ts, cursor_id = _decode_cursor(cursor) if cursor else ("next", None, None)
+        seek_conditions = list(conditions)
+        seek_params = list(params)
+        if cursor_ts is not None:
+            if direction == "next":
+                seek_conditions.append("timestamp <= ? AND (timestamp < ? OR id < ?)")
+            else:
+                seek_conditions.append("timestamp >= ? AND (timestamp > ? OR id > ?)")
+            seek_params.extend([cursor_ts, cursor_ts, cursor_id])
+        order = "DESC" if direction == "next" else "ASC"
+        items = await _fetch_columns(
+            f"""
+            SELECT {select}
+            FROM {ftl_schema.table}
+            WHERE {" AND ".join(seek_conditions)}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT ?
+            """,
+            tuple(seek_params + [per_page + 1]),
+            workers.INTERACTIVE,
+        )
+        has_more = columnar.length(items) > per_page
+        items = {name: values[:per_page] for name, values in items.items()}
+        if direction == "prev":
+            items = {name: values[::-1] for name, values in items.items()}
+            has_newer, has_older = has_more, True
+        else:
+            has_newer, has_older = cursor_ts is not None, has_more
+        total = await _get_total(where, tuple(params), wait=False)
+    else:
+        total = await _get_total(where, tuple(params), wait=True)
+        items = await _fetch_columns(
+            f"""
+            SELECT {select}
+            FROM {ftl_schema.table}
+            WHERE {where}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ? OFFSET ?
+            """,
+            tuple(params + [per_page, (page - 1) * per_page]),
+            workers.INTERACTIVE,
+        )
+        has_newer, has_older = page > 1, page * per_page < total
+    await ftl_schema.resolve_columns(items, "domain", "client", "forward")
+    timestamps, ids = items["timestamp"], items["id"]
+
     return {
-        "items": rows,
+        "items": items if columns else columnar.to_rows(items),
         "total": total,
         "page": page,
         "per_page": per_page,
-        "pages": (total + per_page - 1) // per_page,
+        "pages": (total + per_page - 1) // per_page if total is not None else None,
+        "next_cursor": _encode_cursor("next", timestamps[-1], ids[-1]) if ids and has_older else None,
+        "prev_cursor": _encode_cursor("prev", timestamps[0], ids[0]) if ids and has_newer else None,
     }
 
 
+EXPORT_COLUMNS = (
+    "id", "timestamp", "type", "status", "domain", "client", "forward",
+    "reply_type", "reply_time", "dnssec",
+)
+
+
+async def export_queries(
+    domain: str | None = None,
+    client: str | None = None,
+    status: str | None = None,
+    from_ts: int | None = None,
+    to_ts: int | None = None,
+) -> AsyncIterator[list[tuple]]:
+    """Yield the filtered query log oldest first, in chunks of
+    EXPORT_COLUMNS tuples with names resolved.
+
+    Rows come off a server-side cursor one chunk at a time and the next
+    chunk is only read once the caller asks for it, so memory stays flat
+    however long the range is."""
+    latest = await now()
+    if from_ts is None:
+        from_ts = latest - 86400
+    if to_ts is None:
+        to_ts = latest
+    conditions, params = await _query_filters(from_ts, to_ts, domain, client, status)
+    chunks = db_pool.get_pool("ftl").stream(
+        f"""
+        SELECT {", ".join(EXPORT_COLUMNS)}
+        FROM {ftl_schema.table}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp, id
+        """,
+        tuple(params),
+    )
+    async for chunk in chunks:
+        items = dict(zip(EXPORT_COLUMNS, map(list, zip(*chunk))))
+        await ftl_schema.resolve_columns(items, "domain", "client", "forward")
+        yield list(zip(*items.values()))
+
+
 async def search_queries(q: str, hours: int = 24, limit: int = 50) -> list[dict]:
-    since = (await _now()) - hours * 3600
-    return await _fetch_all(
-        """
+    since = (await now()) - hours * 3600
+    condition, params = await _domain_condition(q)
+    rows = await _fetch_all(
+        f"""
         SELECT id, timestamp, type, status, domain, client, forward
-        FROM queries
-        WHERE timestamp > ? AND domain LIKE ?
+        FROM {ftl_schema.table}
+        WHERE timestamp > ? AND {condition}
         ORDER BY timestamp DESC
         LIMIT ?
         """,
-        (since, f"%{q}%", limit),
+        (since, *params, limit),
+        workers.INTERACTIVE,
     )
+    return await ftl_schema.resolve_rows(rows, "domain", "client", "forward")
 
 
-# Device-specific queries
-async def get_device_stats(ip: str, hours: int = 24) -> dict:
-    since = (await _now()) - hours * 3600
+# Device-specific queries. A device may have several addresses (IPv4 and
+# IPv6), so these take every IP it is known by.
+async def get_device_stats(ips: list[str], hours: int = 24) -> dict:
+    since = (await now()) - hours * 3600
     row = await _fetch_one(
-        """
+        f"""
         SELECT
             COUNT(*) as total_queries,
             SUM(CASE WHEN status IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as blocked_queries,
             COUNT(DISTINCT domain) as unique_domains
-        FROM queries
-        WHERE timestamp > ? AND client = ?
+        FROM {ftl_schema.table}
+        WHERE timestamp > ? AND client IN (SELECT value FROM json_each(?))
         """,
-        (since, ip),
+        (since, await ftl_schema.client_keys(ips)),
     )
-    if row and row["total_queries"] > 0:
-        row["blocked_percentage"] = round(
-            row["blocked_queries"] / row["total_queries"] * 100, 1
-        )
-    else:
-        row = row or {}
-        row["blocked_percentage"] = 0.0
+    row = row or {}
+    _add_blocked_percentage(row)
     return row
 
 
-async def get_device_activity(ip: str, hours: int = 24) -> list[dict]:
-    since = (await _now()) - hours * 3600
-    interval = 600
+async def get_device_activity(
+    ips: list[str],
+    hours: int = 24,
+    resolution: str | None = None,
+    buckets: int = DEFAULT_BUCKETS,
+    columns: bool = False,
+) -> list[dict] | columnar.Columns:
+    since = (await now()) - hours * 3600
+    seconds = pick_resolution(hours, resolution, buckets)
+    # Per-client rollups go down to 10 minutes; finer series scan FTL
+    if seconds >= rollups.BUCKET and await rollups.covers(since):
+        result = await rollups.get_over_time(since, seconds, clients=ips)
+    else:
+        result = await _over_time_scan(since, seconds, await ftl_schema.client_keys(ips))
+    return result if columns else columnar.to_rows(result)
+
+
+async def get_device_hourly_pattern(ips: list[str], days: int = 7) -> list[dict]:
+    since = (await now()) - days * 86400
+    if await rollups.covers(since, allow_lag=True):
+        return await rollups.get_hourly_pattern(since, ips)
     return await _fetch_all(
-        """
+        f"""
         SELECT
-            (timestamp / ?) * ? as bucket,
-            SUM(CASE WHEN status IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as blocked,
-            SUM(CASE WHEN status NOT IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as allowed
-        FROM queries
-        WHERE timestamp > ? AND client = ?
-        GROUP BY bucket
-        ORDER BY bucket
+            CAST(strftime('%w', timestamp, 'unixepoch', 'localtime') AS INTEGER) as day_of_week,
+            CAST(strftime('%H', timestamp, 'unixepoch', 'localtime') AS INTEGER) as hour,
+            COUNT(*) as count
+        FROM {ftl_schema.table}
+        WHERE timestamp > ? AND client IN (SELECT value FROM json_each(?))
+        GROUP BY day_of_week, hour
+        ORDER BY day_of_week, hour
         """,
-        (interval, interval, since, ip),
+        (since, await ftl_schema.client_keys(ips)),
     )
 
 
-async def get_device_top_domains(ip: str, limit: int = 10) -> list[dict]:
-    since = (await _now()) - 86400
-    return await _fetch_all(
-        """
+async def get_device_top_domains(ips: list[str], limit: int = 10) -> list[dict]:
+    since = (await now()) - 86400
+    rows = await _fetch_all(
+        f"""
         SELECT domain, COUNT(*) as count
-        FROM queries
-        WHERE timestamp > ? AND client = ?
+        FROM {ftl_schema.table}
+        WHERE timestamp > ? AND client IN (SELECT value FROM json_each(?))
         GROUP BY domain
         ORDER BY count DESC
         LIMIT ?
         """,
-        (since, ip, limit),
+        (since, await ftl_schema.client_keys(ips), limit),
     )
+    return await ftl_schema.resolve_rows(rows, "domain")
 
 
-async def get_device_top_blocked(ip: str, limit: int = 10) -> list[dict]:
-    since = (await _now()) - 86400
-    return await _fetch_all(
-        """
+async def get_device_top_blocked(ips: list[str], limit: int = 10) -> list[dict]:
+    since = (await now()) - 86400
+    rows = await _fetch_all(
+        f"""
         SELECT domain, COUNT(*) as count
-        FROM queries
-        WHERE timestamp > ? AND client = ? AND status IN (1,4,5,6,7,8,9,10,11)
+        FROM {ftl_schema.table}
+        WHERE timestamp > ? AND client IN (SELECT value FROM json_each(?)) AND status IN (1,4,5,6,7,8,9,10,11)
         GROUP BY domain
         ORDER BY count DESC
         LIMIT ?
         """,
-        (since, ip, limit),
+        (since, await ftl_schema.client_keys(ips), limit),
+    )
+    return await ftl_schema.resolve_rows(rows, "domain")
+
+
+@_cached("device_counts", "stats_cache_ttl")
+async def _get_device_counts(hours: int, macs_by_ip: str) -> list[dict]:
+    """Total, blocked and distinct domain counts per MAC, for the JSON
+    object `macs_by_ip`. Grouping by MAC in SQL keeps unique domains exact
+    for devices with several IPs, and the result small."""
+    since = (await now()) - hours * 3600
+    if ftl_schema.has_ids:
+        clients = "SELECT c.id as client, d.value as mac FROM client_by_id c JOIN json_each(?) d ON c.ip = d.key"
+    else:
+        clients = "SELECT key as client, value as mac FROM json_each(?)"
+    # LIMIT -1 keeps the device list a materialized subquery and CROSS JOIN
+    # keeps the time range scan outermost, so it runs once rather than per IP
+    return await _fetch_all(
+        f"""
+        SELECT
+            d.mac,
+            COUNT(*) as total_queries,
+            SUM(CASE WHEN q.status IN (1,4,5,6,7,8,9,10,11) THEN 1 ELSE 0 END) as blocked_queries,
+            COUNT(DISTINCT q.domain) as unique_domains
+        FROM {ftl_schema.table} q
+        CROSS JOIN ({clients} LIMIT -1) d ON q.client = d.client
+        WHERE q.timestamp > ?
+        GROUP BY d.mac
+        """,
+        (macs_by_ip, since),
     )
 
 
+@_cached("client_activity", "stats_cache_ttl")
+async def _get_client_activity(hours: int, buckets: int) -> list[dict]:
+    since = (await now()) - hours * 3600
+    interval = hours * 3600 // buckets
+    if interval % rollups.BUCKET == 0 and await rollups.covers(since):
+        return await rollups.get_client_activity(since, interval)
+    rows = await _fetch_all(
+        f"""
+        SELECT client, (timestamp - ?) / ? as slot, COUNT(*) as total
+        FROM {ftl_schema.table}
+        WHERE timestamp > ?
+        GROUP BY client, slot
+        """,
+        (since, interval, since),
+    )
+    return await ftl_schema.resolve_rows(rows, "client")
+
+
+async def get_device_summaries(
+    macs_by_ip: dict[str, str], hours: int = 24, buckets: int = 24
+) -> dict[str, dict]:
+    """Total/blocked/unique-domain counts and a `buckets`-point sparkline for
+    every device at once, keyed by MAC. Counts come from one scan grouped
+    per device, so unique domains stay exact for devices with several IPs."""
+    counts, activity = await asyncio.gather(
+        _get_device_counts(hours, json.dumps(macs_by_ip, sort_keys=True)),
+        _get_client_activity(hours, buckets),
+    )
+
+    summaries: dict[str, dict] = {}
+    for r in counts:
+        summaries[r["mac"]] = {
+            "total_queries": r["total_queries"],
+            "blocked_queries": r["blocked_queries"],
+            "unique_domains": r["unique_domains"],
+            "sparkline": [0] * buckets,
+        }
+
+    for r in activity:
+        mac = macs_by_ip.get(r["client"])
+        if mac in summaries:
+            summaries[mac]["sparkline"][min(r["slot"], buckets - 1)] += r["total"]
+
+    for s in summaries.values():
+        _add_blocked_percentage(s)
+    return summaries
+
+
 async def get_network_devices() -> list[dict]:
     """Get devices from Pi-hole's network tables."""
     return await _fetch_all(
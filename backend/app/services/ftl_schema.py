@@ -0,0 +1,136 @@
+"""FTL database layout detection and id -> string resolution.
+
+Since FTL database version 10 queries live in `query_storage`, with domain,
+client, forward and additional_info stored as integer ids into the
+*_by_id tables; the `queries` view resolves all four for every row it
+returns. Aggregating on the id columns and resolving only the rows that are
+actually returned skips those lookups. Older databases keep plain strings
+in a `queries` table, where the resolvers below pass values through.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+
+from app.config import settings
+from app.services import db_pool
+
+logger = logging.getLogger(__name__)
+
+# Table holding one row per query, and whether its text columns are ids
+table = "query_storage"
+has_ids = True
+version: int | None = None
+
+_LOOKUPS = {
+    "domain": "SELECT id, domain as value FROM domain_by_id",
+    "client": "SELECT id, ip as value FROM client_by_id",
+    "forward": "SELECT id, forward as value FROM forward_by_id",
+    "additional_info": "SELECT id, content as value FROM addinfo_by_id",
+}
+_names: dict[str, dict[int, str]] = {kind: {} for kind in _LOOKUPS}
+_file_id: tuple | None = None
+
+
+async def detect():
+    """Inspect the FTL database once at startup."""
+    global table, has_ids, version
+    ftl = db_pool.get_pool("ftl")
+    try:
+        rows = await ftl.fetch_all("SELECT name FROM sqlite_master WHERE type = 'table'")
+    except sqlite3.Error:
+        logger.exception("Could not read the FTL schema; assuming query_storage")
+        return
+    tables = {r["name"] for r in rows}
+    has_ids = {"query_storage", "domain_by_id", "client_by_id"} <= tables
+    table = "query_storage" if has_ids else "queries"
+    if "ftl" in tables:
+        row = await ftl.fetch_one("SELECT value FROM ftl WHERE id = 0")
+        version = int(row["value"]) if row else None
+    if not has_ids:
+        logger.warning(
+            "FTL database version %s predates query_storage; querying the queries table", version
+        )
+
+
+def _check_file():
+    """Ids are only stable within one database file; forget them when FTL
+    recreates it."""
+    global _file_id
+    try:
+        st = os.stat(settings.ftl_db_path)
+        current = (st.st_dev, st.st_ino)
+    except OSError:
+        current = None
+    if current != _file_id:
+        for names in _names.values():
+            names.clear()
+        _file_id = current
+
+
+async def resolve(kind: str, values) -> dict:
+    """Map ids of `kind` (domain, client, forward, additional_info) to their
+    strings. Values that are already strings map to themselves, as do
+    unknown ids."""
+    _check_file()
+    names = _names[kind]
+    missing = {v for v in values if isinstance(v, int) and v not in names}
+    if missing and has_ids:
+        if len(names) + len(missing) > settings.ftl_id_cache_size:
+            names.clear()
+        rows = await db_pool.get_pool("ftl").fetch_all(
+            f"{_LOOKUPS[kind]} WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted(missing)),),
+        )
+        for r in rows:
+            names[r["id"]] = r["value"]
+    return {v: names.get(v, v) if isinstance(v, int) else v for v in values}
+
+
+async def resolve_rows(rows: list[dict], *columns: str) -> list[dict]:
+    """Replace ids in `columns` of each row with their strings, in place."""
+    for column in columns:
+        mapping = await resolve(column, {r[column] for r in rows if r[column] is not None})
+        for r in rows:
+            if r[column] is not None:
+                r[column] = mapping[r[column]]
+    return rows
+
+
+async def resolve_columns(columns: dict[str, list], *names: str) -> dict[str, list]:
+    """Replace ids in the named columns with their strings, in place."""
+    for name in names:
+        values = columns[name]
+        mapping = await resolve(name, {v for v in values if v is not None})
+        columns[name] = [mapping[v] if v is not None else None for v in values]
+    return columns
+
+
+async def client_keys(ips: list[str]) -> str:
+    """JSON list of the values the client column holds for these IPs, for
+    `client IN (SELECT value FROM json_each(?))`."""
+    keys: list = list(ips)
+    if has_ids and ips:
+        rows = await db_pool.get_pool("ftl").fetch_all(
+            "SELECT id FROM client_by_id WHERE ip IN (SELECT value FROM json_each(?))",
+            (json.dumps(ips),),
+        )
+        keys.extend(r["id"] for r in rows)
+    return json.dumps(keys)
+
+
+def domain_like() -> str:
+    """Condition matching the domain column against a LIKE pattern parameter."""
+    if has_ids:
+        return "domain IN (SELECT id FROM domain_by_id WHERE domain LIKE ?)"
+    return "domain LIKE ?"
+
+
+def stats() -> dict:
+    return {
+        "table": table,
+        "version": version,
+        "cached_names": {kind: len(names) for kind, names in _names.items()},
+    }
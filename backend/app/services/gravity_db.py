@@ -1,17 +1,102 @@
+"""gravity.db domain and adlist state.
+
+`domainlist` and `adlist` are small and change only when Pi-hole (or this
+app) edits them, so they are held in memory with indexes by id, by
+(domain, type) and by type. The file is stat'ed on every access and both
+tables are re-read only when its signature changes: a new inode when
+`pihole -g` swaps in a rebuilt gravity.db, a new mtime or size after a
+write through the CLI.
+"""
 from __future__ import annotations
 
+import asyncio
+import os
+import time
+
 import aiosqlite
 from app.config import settings
+from app.services import db_pool
+
+DOMAIN_TYPES = {
+    "whitelist": 0,
+    "blacklist": 1,
+    "regex_white": 2,
+    "regex_black": 3,
+}
+
+
+class Snapshot:
+    __slots__ = ("signature", "domains", "by_id", "by_domain", "by_type", "adlists", "loaded_at")
+
+    def __init__(self, signature: tuple | None, domains: list[dict], adlists: list[dict]):
+        self.signature = signature
+        # Already in listing order: type, then newest first
+        self.domains = domains
+        self.by_id = {d["id"]: d for d in domains}
+        self.by_domain = {(d["domain"], d["type"]): d for d in domains}
+        self.by_type: dict[int, list[dict]] = {t: [] for t in DOMAIN_TYPES.values()}
+        for d in domains:
+            self.by_type.setdefault(d["type"], []).append(d)
+        self.adlists = adlists
+        self.loaded_at = time.time()
+
+
+_state: Snapshot | None = None
+_load_lock: asyncio.Lock | None = None
+_loads = 0
+
+
+def signature() -> tuple | None:
+    """Stat signature of gravity.db and its WAL, if any."""
+    sig = []
+    for path in (settings.gravity_db_path, settings.gravity_db_path + "-wal"):
+        try:
+            st = os.stat(path)
+        except OSError:
+            sig.append(None)
+            continue
+        sig.append((st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(sig) if sig[0] else None
+
+
+async def snapshot() -> Snapshot:
+    """The current state, re-read first if gravity.db changed."""
+    global _state, _load_lock, _loads
+    sig = signature()
+    if _state is not None and _state.signature == sig:
+        return _state
+    if _load_lock is None:
+        _load_lock = asyncio.Lock()
+    async with _load_lock:
+        # Someone else may have reloaded while we waited
+        if _state is not None and _state.signature == sig:
+            return _state
+        # Taken before reading, so a write during the read forces another load
+        sig = signature()
+        pool = db_pool.get_pool("gravity")
+        domains = await pool.fetch_all(
+            """
+            SELECT id, type, domain, enabled, date_added, date_modified, comment
+            FROM domainlist
+            ORDER BY type, date_added DESC
+            """
+        )
+        adlists = await pool.fetch_all(
+            """
+            SELECT id, address, enabled, date_added, comment, number
+            FROM adlist
+            ORDER BY id
+            """
+        )
+        _state = Snapshot(sig, domains, adlists)
+        _loads += 1
+        return _state
 
 
-async def _fetch_all(query: str, params: tuple = ()) -> list[dict]:
-    async with aiosqlite.connect(
-        f"file:{settings.gravity_db_path}?mode=ro", uri=True
-    ) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(r) for r in rows]
+def invalidate():
+    """Drop the in-memory state; the next access re-reads gravity.db."""
+    global _state
+    _state = None
 
 
 async def _execute_rw(query: str, params: tuple = ()):
@@ -19,34 +104,24 @@ async def _execute_rw(query: str, params: tuple = ()):
     async with aiosqlite.connect(settings.gravity_db_path) as db:
         await db.execute(query, params)
         await db.commit()
+    invalidate()
 
 
 async def get_domains(domain_type: str | None = None) -> list[dict]:
-    type_map = {
-        "blacklist": 1,
-        "whitelist": 0,
-        "regex_black": 3,
-        "regex_white": 2,
-    }
+    state = await snapshot()
+    if domain_type and domain_type in DOMAIN_TYPES:
+        return list(state.by_type[DOMAIN_TYPES[domain_type]])
+    return list(state.domains)
 
-    if domain_type and domain_type in type_map:
-        return await _fetch_all(
-            """
-            SELECT id, type, domain, enabled, date_added, date_modified, comment
-            FROM domainlist
-            WHERE type = ?
-            ORDER BY date_added DESC
-            """,
-            (type_map[domain_type],),
-        )
 
-    return await _fetch_all(
-        """
-        SELECT id, type, domain, enabled, date_added, date_modified, comment
-        FROM domainlist
-        ORDER BY type, date_added DESC
-        """
-    )
+async def get_domain(domain_id: int) -> dict | None:
+    return (await snapshot()).by_id.get(domain_id)
+
+
+async def find_domain(domain: str, domain_type: str) -> dict | None:
+    """The domainlist entry for `domain` with type name `domain_type`, if any."""
+    type_code = DOMAIN_TYPES.get(domain_type)
+    return (await snapshot()).by_domain.get((domain, type_code))
 
 
 async def toggle_domain(domain_id: int, enabled: bool):
@@ -57,10 +132,14 @@ async def toggle_domain(domain_id: int, enabled: bool):
 
 
 async def get_adlists() -> list[dict]:
-    return await _fetch_all(
-        """
-        SELECT id, address, enabled, date_added, comment, number
-        FROM adlist
-        ORDER BY id
-        """
-    )
+    return list((await snapshot()).adlists)
+
+
+def stats() -> dict:
+    return {
+        "loaded": _state is not None,
+        "loads": _loads,
+        "loaded_at": _state.loaded_at if _state else None,
+        "domains": len(_state.domains) if _state else 0,
+        "adlists": len(_state.adlists) if _state else 0,
+    }
@@ -0,0 +1,281 @@
+"""In-process matcher over gravity.db: which list blocks a domain.
+
+The gravity table (often millions of rows) is held as one sorted array of
+64-bit keys, a stable 48-bit hash of the domain above 16 bits naming the
+adlist, built in the worker pool and searched with bisect: about 8 bytes
+per entry instead of a Python str each. It is rebuilt only when `pihole -g`
+produces a new gravity.db. Regex entries are compiled from the gravity_db
+snapshot whenever that changes; the enabled ones are joined into a single
+alternation with a named group per entry, so a batch costs one `re` call
+per domain.
+
+Verdicts follow FTL's order: an exact or regex whitelist match wins, then
+the exact blacklist, gravity and finally regex blacklist. Group
+assignments are not taken into account.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import sqlite3
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from app.config import settings
+from app.services import analytics, db_pool, gravity_db, workers
+
+logger = logging.getLogger(__name__)
+
+GRAVITY_STATUSES = frozenset((1, 9))
+REGEX_STATUSES = frozenset((4, 10))
+EXACT_STATUSES = frozenset((5, 11))
+UPSTREAM_STATUSES = frozenset((6, 7, 8))
+# Statuses where the blocked name is a CNAME target kept in additional_info
+CNAME_STATUSES = frozenset((9, 10, 11))
+
+# FTL's ;querytype= / ;reply= / ;invert extensions after the expression
+_FTL_OPTIONS = re.compile(r";(querytype|reply|invert)\b.*$")
+# Backreferences, named groups and inline global flags would break inside
+# the combined pattern
+_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?[aiLmsux]")
+_ADLIST_MASK = (1 << analytics.ADLIST_BITS) - 1
+
+
+def entry_expression(domain: str, entry_type: str) -> str | None:
+    """The regex Pi-hole matches for a list entry of `entry_type`, or None
+    for exact entries. Wildcards become `(\\.|^)domain$` like `pihole --wild`."""
+    if entry_type == "wildcard":
+        return r"(\.|^)" + domain.lower().replace(".", r"\.") + "$"
+    if entry_type in ("regex_black", "regex_white"):
+        return _FTL_OPTIONS.sub("", domain)
+    return None
+
+
+class _Regexes:
+    """Compiled regex entries of one domainlist type."""
+
+    __slots__ = ("entries", "combined", "named", "separate", "invalid")
+
+    def __init__(self, entries: list[dict]):
+        self.entries: list[tuple[dict, re.Pattern]] = []
+        self.invalid: list[dict] = []
+        combinable, self.separate = [], []
+        for entry in entries:
+            expression = entry["domain"]
+            if ";invert" in expression:
+                # Matches everything the expression doesn't; not evaluated
+                self.invalid.append(entry)
+                continue
+            expression = _FTL_OPTIONS.sub("", expression)
+            try:
+                pattern = re.compile(expression, re.IGNORECASE)
+            except re.error:
+                self.invalid.append(entry)
+                continue
+            self.entries.append((entry, pattern))
+            if not entry["enabled"]:
+                continue
+            if _NOT_COMBINABLE.search(expression):
+                self.separate.append((entry, pattern))
+            else:
+                combinable.append((entry, expression))
+        self.named = {f"r{e['id']}": e for e, _ in combinable}
+        self.combined = None
+        if combinable:
+            try:
+                self.combined = re.compile(
+                    "|".join(f"(?P<r{e['id']}>{expression})" for e, expression in combinable),
+                    re.IGNORECASE,
+                )
+            except re.error:
+                # Something valid alone that can't be joined; match each on its own
+                patterns = {e["id"]: p for e, p in self.entries}
+                self.separate = [(e, patterns[e["id"]]) for e, _ in combinable] + self.separate
+                self.named = {}
+
+    def first(self, domain: str) -> dict | None:
+        """The enabled entry matching `domain`, if any."""
+        if self.combined is not None:
+            m = self.combined.search(domain)
+            if m:
+                # The entry's own group is outermost, so it closes last
+                return self.named[m.lastgroup]
+        for entry, pattern in self.separate:
+            if pattern.search(domain):
+                return entry
+        return None
+
+    def all(self, domain: str) -> list[dict]:
+        """Every entry matching `domain`, disabled ones included."""
+        return [entry for entry, pattern in self.entries if pattern.search(domain)]
+
+
+_keys = array("Q")
+_adlist_ids: list[int] = []
+_gravity_id: tuple | None = None
+_checked_signature: tuple | None = None
+_regex_source: gravity_db.Snapshot | None = None
+_black: _Regexes = _Regexes([])
+_white: _Regexes = _Regexes([])
+_by_id: dict[int, dict] = {}
+_lock: asyncio.Lock | None = None
+_stats = {"builds": 0, "build_ms": 0.0, "built_at": None, "regex_build_ms": 0.0}
+
+
+async def _gravity_identity() -> tuple | None:
+    """(dev, inode, info.updated) of gravity.db; changes on `pihole -g`."""
+    sig = gravity_db.signature()
+    if sig is None:
+        return None
+    try:
+        row = await db_pool.get_pool("gravity").fetch_one(
+            "SELECT value FROM info WHERE property = 'updated'"
+        )
+    except sqlite3.Error:
+        row = None
+    return (*sig[0][:2], row["value"] if row else None)
+
+
+async def _refresh():
+    """Bring the gravity keys and regexes up to date with gravity.db."""
+    global _lock, _keys, _adlist_ids, _gravity_id, _checked_signature
+    global _regex_source, _black, _white, _by_id
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        state = await gravity_db.snapshot()
+        if state is not _regex_source:
+            started = time.perf_counter()
+            _by_id = {d["id"]: d for d in state.domains}
+            _black = _Regexes(state.by_type[gravity_db.DOMAIN_TYPES["regex_black"]])
+            _white = _Regexes(state.by_type[gravity_db.DOMAIN_TYPES["regex_white"]])
+            _regex_source = state
+            _stats["regex_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        # Domainlist edits also touch the file; only a gravity rebuild
+        # changes the identity
+        if state.signature == _checked_signature:
+            return
+        identity = await _gravity_identity()
+        if identity != _gravity_id:
+            started = time.perf_counter()
+            _adlist_ids, _keys = await workers.run(
+                analytics.gravity_keys,
+                path=settings.gravity_db_path,
+                label="gravity matcher build",
+            )
+            _gravity_id = identity
+            _stats["builds"] += 1
+            _stats["build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            _stats["built_at"] = int(time.time())
+            logger.info(
+                "Gravity matcher built: %d entries from %d adlists in %.0f ms",
+                len(_keys), len(_adlist_ids), _stats["build_ms"],
+            )
+        _checked_signature = state.signature
+
+
+def _adlists_of(domain: str) -> list[int]:
+    key = analytics.domain_key(domain)
+    i = bisect_left(_keys, key)
+    found = []
+    while i < len(_keys) and _keys[i] & ~_ADLIST_MASK == key:
+        found.append(_adlist_ids[_keys[i] & _ADLIST_MASK])
+        i += 1
+    return found
+
+
+async def explain(domain: str) -> dict:
+    """Every list entry that matches `domain`, and the verdict FTL would
+    reach from the enabled ones."""
+    await _refresh()
+    domain = domain.strip().lower().rstrip(".")
+    state = _regex_source
+    types = gravity_db.DOMAIN_TYPES
+    exact = [
+        state.by_domain[(domain, t)]
+        for t in (types["whitelist"], types["blacklist"])
+        if (domain, t) in state.by_domain
+    ]
+    regex_white = _white.all(domain)
+    regex_black = _black.all(domain)
+    adlists_by_id = {a["id"]: a for a in state.adlists}
+    adlists = [
+        adlists_by_id.get(i, {"id": i, "address": None, "enabled": 0})
+        for i in _adlists_of(domain)
+    ]
+
+    def active(entries, type_code=None):
+        return any(e["enabled"] and type_code in (None, e["type"]) for e in entries)
+
+    if active(exact, types["whitelist"]):
+        verdict, reason = "allowed", "exact_whitelist"
+    elif active(regex_white):
+        verdict, reason = "allowed", "regex_whitelist"
+    elif active(exact, types["blacklist"]):
+        verdict, reason = "blocked", "exact_blacklist"
+    elif any(a["enabled"] for a in adlists):
+        verdict, reason = "blocked", "gravity"
+    elif active(regex_black):
+        verdict, reason = "blocked", "regex_blacklist"
+    else:
+        verdict, reason = "not_listed", None
+
+    return {
+        "domain": domain,
+        "verdict": verdict,
+        "reason": reason,
+        "exact": exact,
+        "regex": regex_white + regex_black,
+        "adlists": adlists,
+    }
+
+
+async def attribute(blocked: list[tuple[int, str, int]], limit: int = 20) -> list[dict]:
+    """Credit blocked query counts, given as (status, domain, count), to the
+    adlist, regex or list that blocked them. A domain on several adlists
+    counts for each of them."""
+    await _refresh()
+    counts: Counter = Counter()
+    for status, domain, count in blocked:
+        if status in GRAVITY_STATUSES:
+            adlist_ids = _adlists_of(domain.lower()) if domain else []
+            for adlist_id in adlist_ids or [None]:
+                counts[("adlist", adlist_id)] += count
+        elif status in REGEX_STATUSES:
+            entry = _black.first(domain) if domain else None
+            counts[("regex", entry["id"] if entry else None)] += count
+        elif status in EXACT_STATUSES:
+            counts[("exact", None)] += count
+        elif status in UPSTREAM_STATUSES:
+            counts[("upstream", None)] += count
+
+    addresses = {a["id"]: a["address"] for a in _regex_source.adlists}
+    result = []
+    for (kind, source_id), count in counts.most_common(limit):
+        if kind == "adlist":
+            source = addresses.get(source_id) or "gravity (no longer listed)"
+        elif kind == "regex":
+            entry = _by_id.get(source_id)
+            source = entry["domain"] if entry else "regex (no longer listed)"
+        elif kind == "exact":
+            source = "exact blacklist"
+        else:
+            source = "upstream"
+        result.append({"source": source, "kind": kind, "id": source_id, "count": count})
+    return result
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "gravity_entries": len(_keys),
+        "adlists": len(_adlist_ids),
+        "memory_bytes": _keys.itemsize * len(_keys),
+        "regexes": len(_black.entries) + len(_white.entries),
+        "combined_regexes": len(_black.named) + len(_white.named),
+        "invalid_regexes": [e["domain"] for e in _black.invalid + _white.invalid],
+    }
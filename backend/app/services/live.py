@@ -0,0 +1,81 @@
+"""Fan-out of live query deltas to /api/stream subscribers.
+
+Fed by the rollup ingester's tail of query_storage, so the database work per
+update is the same whether one dashboard is open or twenty.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+
+from app.config import settings
+from app.services import ftl_db, rollups
+
+_subscribers: set[asyncio.Queue] = set()
+_last_top: dict[str, list] = {}
+
+
+def subscribe() -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.stream_queue_size)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    _subscribers.discard(queue)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+def _publish(event: dict):
+    for queue in list(_subscribers):
+        if queue.full():
+            # Slow consumer: drop its oldest event rather than stall everyone
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(event)
+
+
+async def _on_rows(rows: list[dict]):
+    if not _subscribers:
+        return
+
+    # Per-minute buckets fold into any series resolution on the client
+    buckets: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+    blocked_total = 0
+    for r in rows:
+        b = buckets[r["timestamp"] - r["timestamp"] % rollups.MINUTE_BUCKET]
+        if r["status"] in rollups.BLOCKED_STATUSES:
+            b[0] += 1
+            blocked_total += 1
+        else:
+            b[1] += 1
+
+    event = {
+        "type": "delta",
+        "total": len(rows),
+        "blocked": blocked_total,
+        "buckets": [
+            {"bucket": bucket, "blocked": b[0], "allowed": b[1]}
+            for bucket, b in sorted(buckets.items())
+        ],
+        "queries": rows[-settings.stream_recent_rows:][::-1],
+    }
+
+    # Top-N over the last 24h, only sent when the ranking changed
+    since = await ftl_db.now() - 86400
+    for key, blocked_only in (("top_domains", False), ("top_blocked", True)):
+        top = await rollups.get_top_domains(since, 10, blocked_only=blocked_only)
+        if top != _last_top.get(key):
+            _last_top[key] = top
+            event[key] = top
+
+    _publish(event)
+
+
+def init():
+    rollups.add_listener(_on_rows)
@@ -1,75 +1,96 @@
+"""Pi-hole list changes and the list reload coordinator.
+
+Changes go through the backend chosen by `pihole_backend` (see
+pihole_backends.py): the `pihole` CLI, direct gravity.db writes or the v6
+REST API.
+"""
 from __future__ import annotations
 
 import asyncio
-import shlex
+import time
+from collections import defaultdict
 from app.config import settings
-
-
-async def run_pihole(*args: str) -> tuple[int, str, str]:
-    cmd_parts = []
-    if settings.use_sudo:
-        cmd_parts.append("sudo")
-    cmd_parts.append(settings.pihole_command)
-    cmd_parts.extend(args)
-
-    cmd = " ".join(shlex.quote(p) for p in cmd_parts)
-    proc = await asyncio.create_subprocess_shell(
-        cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await proc.communicate()
-    return proc.returncode, stdout.decode().strip(), stderr.decode().strip()
-
-
-# Pi-hole v5 CLI commands:
-#   -b / blacklist      (v6 uses "deny")
-#   -w / whitelist      (v6 uses "allow")
-#   --regex             same in both
-#   --wild / wildcard   same in both
-#   -d flag for removal (not "--remove")
-#   --comment "text"    same in both
-
-async def add_blacklist(domain: str, comment: str | None = None):
-    args = ["-b", domain]
-    if comment:
-        args.extend(["--comment", comment])
-    return await run_pihole(*args)
-
-
-async def remove_blacklist(domain: str):
-    return await run_pihole("-b", "-d", domain)
-
-
-async def add_whitelist(domain: str):
-    return await run_pihole("-w", domain)
-
-
-async def remove_whitelist(domain: str):
-    return await run_pihole("-w", "-d", domain)
-
-
-async def add_regex_black(pattern: str, comment: str | None = None):
-    args = ["--regex", pattern]
-    if comment:
-        args.extend(["--comment", comment])
-    return await run_pihole(*args)
-
-
-async def remove_regex_black(pattern: str):
-    return await run_pihole("--regex", "-d", pattern)
-
-
-async def add_wildcard(domain: str, comment: str | None = None):
-    args = ["--wild", domain]
-    if comment:
-        args.extend(["--comment", comment])
-    return await run_pihole(*args)
-
-
-async def remove_wildcard(domain: str):
-    return await run_pihole("--wild", "-d", domain)
-
-
-async def reload_lists():
-    return await run_pihole("restartdns", "reload-lists")
+from app.services.pihole_backends import TYPES, get_backend
+
+
+# Reload coordinator: every caller awaits the reload that starts after its
+# request, requests within reload_debounce_ms share one, and only one
+# reload runs at a time.
+_next_reload: asyncio.Future | None = None
+_reloader: asyncio.Task | None = None
+_reload_stats = {"requested": 0, "reloads": 0, "failed": 0, "last_ms": 0.0}
+
+
+async def reload_lists() -> tuple[int, str, str]:
+    """Reload FTL's lists, covering every change made before this call."""
+    global _next_reload, _reloader
+    _reload_stats["requested"] += 1
+    if _next_reload is None:
+        _next_reload = asyncio.get_running_loop().create_future()
+    future = _next_reload
+    if _reloader is None or _reloader.done():
+        _reloader = asyncio.create_task(_reload_loop())
+    # Shielded: a caller going away mustn't cancel the reload others wait on
+    return await asyncio.shield(future)
+
+
+async def _reload_loop():
+    global _next_reload
+    while _next_reload is not None:
+        await asyncio.sleep(settings.reload_debounce_ms / 1000)
+        # Requests from here on may not be covered; they wait for the next round
+        future, _next_reload = _next_reload, None
+        started = time.monotonic()
+        try:
+            result = await get_backend().reload()
+        except Exception as e:
+            _reload_stats["failed"] += 1
+            future.set_exception(e)
+            continue
+        _reload_stats["reloads"] += 1
+        _reload_stats["last_ms"] = round((time.monotonic() - started) * 1000, 1)
+        if result[0] != 0:
+            _reload_stats["failed"] += 1
+        future.set_result(result)
+
+
+def get_reload_stats() -> dict:
+    return {**_reload_stats, "pending": _next_reload is not None, "backend": settings.pihole_backend}
+
+
+async def apply_domain_batch(operations: list[dict]) -> dict:
+    """Apply `{action: add|remove, domain, type, comment}` operations with one
+    backend call per (action, type, comment) group, none of which reloads,
+    then reload the lists once.
+
+    Every operation gets its own result; with the CLI a group that fails is
+    retried one domain at a time to find out which. Returns the results, in
+    order, and whether the reload succeeded."""
+    results = [
+        {"action": op["action"], "domain": op["domain"], "type": op["type"], "ok": False, "error": None}
+        for op in operations
+    ]
+    groups: dict[tuple, list[int]] = defaultdict(list)
+    for i, op in enumerate(operations):
+        if op["type"] not in TYPES:
+            results[i]["error"] = f"Unknown domain type: {op['type']}"
+        elif op["action"] not in ("add", "remove"):
+            results[i]["error"] = f"Unknown action: {op['action']}"
+        else:
+            comment = op.get("comment") if op["action"] == "add" else None
+            groups[(op["action"], op["type"], comment or None)].append(i)
+
+    backend = get_backend()
+    for (action, domain_type, comment), indexes in groups.items():
+        domains = list(dict.fromkeys(operations[i]["domain"] for i in indexes))
+        errors = await backend.apply(action, domain_type, domains, comment)
+        for i in indexes:
+            error = errors[operations[i]["domain"]]
+            results[i]["ok"] = error is None
+            results[i]["error"] = error
+
+    reloaded = False
+    if any(r["ok"] for r in results):
+        code, _, _ = await reload_lists()
+        reloaded = code == 0
+    return {"results": results, "reloaded": reloaded}
@@ -0,0 +1,302 @@
+"""Ways of changing Pi-hole's domain lists, picked with `pihole_backend`.
+
+- cli (default): the `pihole` command, through sudo unless use_sudo is
+  off. One process per (action, type, comment) group, and
+  `pihole restartdns reload-lists` to reload.
+- gravity: transactional writes to gravity.db's domainlist and
+  domainlist_by_group from this process, the way gravity_db already
+  toggles entries, then SIGRTMIN to pihole-FTL to reload its lists. The
+  app's user needs write access to gravity.db (the pihole group); when FTL
+  can't be signalled the CLI reload is used instead.
+- api: Pi-hole v6's REST API over one persistent HTTP session (needs
+  httpx). FTL applies API changes itself, so there is nothing to reload.
+
+Every backend's `apply` takes one group of domains sharing an action, type
+and comment and returns an error message (or None) per domain.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import shlex
+import signal
+import sqlite3
+
+import aiosqlite
+from app.config import settings
+from app.services import gravity_db
+from app.services.gravity_match import entry_expression
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - only needed for the api backend
+    httpx = None
+
+# list.sh's check for exact and wildcard entries
+_VALID_DOMAIN = re.compile(
+    r"^((-|_)*[a-z\d]((-|_)*[a-z\d])*(-|_)*)(\.(-|_)*([a-z\d]((-|_)*[a-z\d])*))*$"
+)
+
+
+async def run_pihole(*args: str) -> tuple[int, str, str]:
+    cmd_parts = []
+    if settings.use_sudo:
+        cmd_parts.append("sudo")
+    cmd_parts.append(settings.pihole_command)
+    cmd_parts.extend(args)
+
+    cmd = " ".join(shlex.quote(p) for p in cmd_parts)
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate()
+    return proc.returncode, stdout.decode().strip(), stderr.decode().strip()
+
+
+# Pi-hole v5 CLI commands:
+#   -b / blacklist      (v6 uses "deny")
+#   -w / whitelist      (v6 uses "allow")
+#   --regex             same in both
+#   --wild / wildcard   same in both
+#   -d flag for removal (not "--remove")
+#   --comment "text"    same in both
+#   -nr / --noreload    skip the reload; several domains may follow one flag
+_TYPE_FLAGS = {
+    "blacklist": "-b",
+    "whitelist": "-w",
+    "regex_black": "--regex",
+    "regex_white": "--white-regex",
+    "wildcard": "--wild",
+}
+TYPES = frozenset(_TYPE_FLAGS)
+
+
+class CliBackend:
+    name = "cli"
+
+    async def apply(
+        self, action: str, domain_type: str, domains: list[str], comment: str | None
+    ) -> dict[str, str | None]:
+        args = [_TYPE_FLAGS[domain_type], "--noreload"]
+        if action == "remove":
+            args.append("-d")
+        if comment:
+            args.extend(["--comment", comment])
+        code, out, err = await run_pihole(*args, *domains)
+        outcomes = {d: (code, err or out) for d in domains}
+        if code != 0 and len(domains) > 1:
+            # Find out which domains the group failed on
+            for d in domains:
+                code, out, err = await run_pihole(*args, d)
+                outcomes[d] = (code, err or out)
+        return {
+            d: None if code == 0 else f"pihole command failed: {message}"
+            for d, (code, message) in outcomes.items()
+        }
+
+    async def reload(self) -> tuple[int, str, str]:
+        return await run_pihole("restartdns", "reload-lists")
+
+    async def close(self):
+        pass
+
+
+def _stored_value(action: str, domain_type: str, domain: str) -> str:
+    """`domain` as domainlist stores it, validated when it is being added."""
+    if domain_type in ("regex_black", "regex_white"):
+        if action == "add":
+            try:
+                re.compile(domain)
+            except re.error as e:
+                raise ValueError(f"invalid regex: {e}") from None
+        return domain
+    domain = domain.strip().lower()
+    if action == "add" and (len(domain) > 253 or not _VALID_DOMAIN.match(domain)):
+        raise ValueError(f"{domain} is not a valid domain name")
+    return entry_expression(domain, "wildcard") if domain_type == "wildcard" else domain
+
+
+class GravityBackend:
+    name = "gravity"
+
+    async def apply(
+        self, action: str, domain_type: str, domains: list[str], comment: str | None
+    ) -> dict[str, str | None]:
+        type_code = gravity_db.DOMAIN_TYPES["regex_black" if domain_type == "wildcard" else domain_type]
+        outcomes: dict[str, str | None] = {}
+        values = []
+        for d in domains:
+            try:
+                values.append(_stored_value(action, domain_type, d))
+                outcomes[d] = None
+            except ValueError as e:
+                outcomes[d] = str(e)
+        if not values:
+            return outcomes
+
+        params = (type_code, json.dumps(values))
+        try:
+            async with aiosqlite.connect(settings.gravity_db_path) as db:
+                await db.execute(f"PRAGMA busy_timeout = {int(settings.db_busy_timeout_ms)}")
+                if action == "add":
+                    await db.executemany(
+                        """
+                        INSERT INTO domainlist (type, domain, comment) VALUES (?, ?, ?)
+                        ON CONFLICT (domain, type) DO NOTHING
+                        """,
+                        [(type_code, v, comment) for v in values],
+                    )
+                    # Pi-hole's trigger adds the default group too; this
+                    # covers databases without it
+                    await db.execute(
+                        """
+                        INSERT OR IGNORE INTO domainlist_by_group (domainlist_id, group_id)
+                        SELECT id, 0 FROM domainlist
+                        WHERE type = ? AND domain IN (SELECT value FROM json_each(?))
+                        """,
+                        params,
+                    )
+                else:
+                    await db.execute(
+                        """
+                        DELETE FROM domainlist_by_group WHERE domainlist_id IN (
+                            SELECT id FROM domainlist
+                            WHERE type = ? AND domain IN (SELECT value FROM json_each(?))
+                        )
+                        """,
+                        params,
+                    )
+                    await db.execute(
+                        "DELETE FROM domainlist WHERE type = ? AND domain IN (SELECT value FROM json_each(?))",
+                        params,
+                    )
+                await db.commit()
+        except sqlite3.Error as e:
+            return {d: error or f"gravity.db write failed: {e}" for d, error in outcomes.items()}
+        finally:
+            gravity_db.invalidate()
+        return outcomes
+
+    async def reload(self) -> tuple[int, str, str]:
+        try:
+            with open(settings.ftl_pid_file) as f:
+                pid = int(f.read().strip())
+            os.kill(pid, signal.SIGRTMIN)
+        except (OSError, ValueError):
+            # No pid file, or FTL runs as a user we can't signal
+            return await run_pihole("restartdns", "reload-lists")
+        return 0, "", ""
+
+    async def close(self):
+        pass
+
+
+# v6 list (type, kind) per domain type; wildcards are stored as regexes
+_API_KINDS = {
+    "blacklist": ("deny", "exact"),
+    "whitelist": ("allow", "exact"),
+    "regex_black": ("deny", "regex"),
+    "regex_white": ("allow", "regex"),
+    "wildcard": ("deny", "regex"),
+}
+
+
+class ApiBackend:
+    name = "api"
+
+    def __init__(self):
+        if httpx is None:
+            raise RuntimeError("pihole_backend=api needs httpx (pip install httpx)")
+        self._client = httpx.AsyncClient(base_url=settings.pihole_api_url, timeout=10.0)
+        self._sid: str | None = None
+        self._authenticated = False
+        self._auth_lock = asyncio.Lock()
+
+    async def _login(self):
+        async with self._auth_lock:
+            if self._authenticated:
+                return
+            r = await self._client.post("/api/auth", json={"password": settings.pihole_api_password})
+            r.raise_for_status()
+            session = r.json()["session"]
+            if not session.get("valid"):
+                raise RuntimeError("Pi-hole API rejected the password")
+            # No sid when the API has no password set
+            self._sid = session.get("sid")
+            self._authenticated = True
+
+    async def _request(self, method: str, path: str, **kwargs):
+        for _ in range(2):
+            if not self._authenticated:
+                await self._login()
+            headers = {"X-FTL-SID": self._sid} if self._sid else {}
+            r = await self._client.request(method, path, headers=headers, **kwargs)
+            if r.status_code != 401:
+                break
+            # Session expired; log in again once
+            self._authenticated = False
+        return r
+
+    async def apply(
+        self, action: str, domain_type: str, domains: list[str], comment: str | None
+    ) -> dict[str, str | None]:
+        list_type, kind = _API_KINDS[domain_type]
+        if domain_type == "wildcard":
+            values = {entry_expression(d, "wildcard"): d for d in domains}
+        else:
+            values = {d: d for d in domains}
+        try:
+            if action == "add":
+                r = await self._request(
+                    "POST",
+                    f"/api/domains/{list_type}/{kind}",
+                    json={"domain": list(values), "comment": comment, "groups": [0], "enabled": True},
+                )
+            else:
+                r = await self._request(
+                    "POST",
+                    "/api/domains:batchDelete",
+                    json=[{"item": v, "type": list_type, "kind": kind} for v in values],
+                )
+        except (httpx.HTTPError, RuntimeError) as e:
+            return {d: f"Pi-hole API request failed: {e}" for d in domains}
+        if r.status_code >= 400:
+            return {d: f"Pi-hole API returned {r.status_code}: {r.text[:200]}" for d in domains}
+
+        outcomes: dict[str, str | None] = {d: None for d in domains}
+        if action == "add":
+            for e in r.json().get("processed", {}).get("errors", []):
+                if e.get("item") in values:
+                    outcomes[values[e["item"]]] = e.get("error") or "rejected by the Pi-hole API"
+        return outcomes
+
+    async def reload(self) -> tuple[int, str, str]:
+        # FTL reloads its lists after every change made through the API
+        return 0, "", ""
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_BACKENDS = {"cli": CliBackend, "gravity": GravityBackend, "api": ApiBackend}
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if settings.pihole_backend not in _BACKENDS:
+            raise ValueError(f"Unknown pihole_backend: {settings.pihole_backend}")
+        _backend = _BACKENDS[settings.pihole_backend]()
+    return _backend
+
+
+async def close():
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
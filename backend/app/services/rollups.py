@@ -0,0 +1,618 @@
+"""Pre-aggregated 10-minute buckets of FTL query data, kept in dashboard.db.
+
+A background ingester tails pihole-FTL.db by query id and folds new rows into
+per-bucket totals, per-client and per-domain counts, so the dashboard stats
+answer from a few thousand rollup rows instead of rescanning `queries`.
+Totals are also kept per minute for detailed short windows; hourly and daily
+series are grouped from the 10-minute buckets. Per UTC hour, mergeable
+sketches of domains and clients back the approximate stats (sketches.py).
+Hourly heatmap counts, overall and per client, are kept by local hour with
+the timezone conversion done once per bucket.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+
+from app.config import settings
+from app.services import db_pool, ftl_schema
+from app.services.sketches import HyperLogLog, TopK
+
+logger = logging.getLogger(__name__)
+
+BUCKET = 600
+MINUTE_BUCKET = 60
+# Series resolutions in seconds; hours and days are aligned to local time
+RESOLUTIONS = (60, 600, 3600, 86400)
+# Bump when a table is added or changes meaning; rollups are rebuilt on mismatch
+VERSION = 4
+BLOCKED_STATUSES = frozenset((1, 4, 5, 6, 7, 8, 9, 10, 11))
+CACHED_STATUSES = frozenset((3,))
+
+_initialized = False
+_task: asyncio.Task | None = None
+_caught_up = False
+_last_prune: float = 0
+_listeners: list = []
+
+
+async def init_db():
+    global _initialized
+    if _initialized:
+        return
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        await db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_totals (
+                bucket INTEGER PRIMARY KEY,
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL,
+                cached INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_minutes (
+                bucket INTEGER PRIMARY KEY,
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_clients (
+                bucket INTEGER NOT NULL,
+                client TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL,
+                PRIMARY KEY (bucket, client)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rollup_domains (
+                bucket INTEGER NOT NULL,
+                domain TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL,
+                PRIMARY KEY (bucket, domain)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rollup_hours (
+                hour_start INTEGER PRIMARY KEY,
+                day_of_week INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_sketches (
+                hour_start INTEGER PRIMARY KEY,
+                domains BLOB NOT NULL,
+                clients BLOB NOT NULL,
+                top_domains TEXT NOT NULL,
+                top_blocked TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_client_hours (
+                client TEXT NOT NULL,
+                hour_start INTEGER NOT NULL,
+                day_of_week INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                blocked INTEGER NOT NULL,
+                PRIMARY KEY (client, hour_start)
+            ) WITHOUT ROWID;
+            """
+        )
+        await db.commit()
+    _initialized = True
+
+
+async def _get_state(db, key: str, default: int = 0) -> int:
+    async with db.execute("SELECT value FROM rollup_state WHERE key = ?", (key,)) as c:
+        row = await c.fetchone()
+        return row["value"] if row else default
+
+
+async def _set_state(db, key: str, value: int):
+    await db.execute(
+        """
+        INSERT INTO rollup_state (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """,
+        (key, value),
+    )
+
+
+_TABLES = {
+    "rollup_totals": "bucket",
+    "rollup_minutes": "bucket",
+    "rollup_clients": "bucket",
+    "rollup_domains": "bucket",
+    "rollup_hours": "hour_start",
+    "rollup_client_hours": "hour_start",
+    "rollup_sketches": "hour_start",
+}
+
+
+async def _reset(db, start_id: int, coverage_start: int):
+    """Drop all rollups and restart ingestion from start_id."""
+    for table in _TABLES:
+        await db.execute(f"DELETE FROM {table}")
+    await _set_state(db, "last_id", start_id)
+    await _set_state(db, "coverage_start", coverage_start)
+    await _set_state(db, "version", VERSION)
+
+
+def _local_hour(bucket: int) -> tuple[int, int, int]:
+    """(start of the local hour, day of week with Sunday = 0, hour) for a bucket."""
+    t = time.localtime(bucket)
+    return bucket - t.tm_min * 60 - t.tm_sec, (t.tm_wday + 1) % 7, t.tm_hour
+
+
+async def _ingest_batch() -> list[dict]:
+    """Fold the next batch of new FTL rows into the rollups. Returns the rows read."""
+    ftl = db_pool.get_pool("ftl")
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        last_id = await _get_state(db, "last_id", -1)
+
+        bounds = await ftl.fetch_one(f"SELECT MAX(id) as max_id FROM {ftl_schema.table}")
+        max_id = (bounds or {}).get("max_id") or 0
+
+        stale = await _get_state(db, "version") != VERSION
+        if last_id < 0 or max_id < last_id or stale:
+            # First run, FTL's database was recreated, or the rollup tables
+            # changed: backfill the retention window
+            coverage_start = int(time.time()) - settings.rollup_retention_days * 86400
+            coverage_start -= coverage_start % BUCKET
+            row = await ftl.fetch_one(
+                f"SELECT MIN(id) - 1 as start_id FROM {ftl_schema.table} WHERE timestamp >= ?",
+                (coverage_start,),
+            )
+            start_id = (row or {}).get("start_id")
+            await _reset(db, max_id if start_id is None else start_id, coverage_start)
+            await db.commit()
+            last_id = await _get_state(db, "last_id")
+
+        if max_id <= last_id:
+            return []
+
+        rows = await ftl.fetch_all(
+            """
+            SELECT id, timestamp, type, status, domain, client
+            FROM queries
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, settings.rollup_batch_size),
+        )
+        if not rows:
+            return []
+
+        totals: dict[int, list[int]] = defaultdict(lambda: [0, 0, 0])
+        minutes: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+        clients: dict[tuple, list[int]] = defaultdict(lambda: [0, 0])
+        domains: dict[tuple, list[int]] = defaultdict(lambda: [0, 0])
+        for r in rows:
+            bucket = r["timestamp"] - r["timestamp"] % BUCKET
+            blocked = 1 if r["status"] in BLOCKED_STATUSES else 0
+            t = totals[bucket]
+            t[0] += 1
+            t[1] += blocked
+            if r["status"] in CACHED_STATUSES:
+                t[2] += 1
+            m = minutes[r["timestamp"] - r["timestamp"] % MINUTE_BUCKET]
+            m[0] += 1
+            m[1] += blocked
+            c = clients[(bucket, r["client"] or "")]
+            c[0] += 1
+            c[1] += blocked
+            d = domains[(bucket, r["domain"] or "")]
+            d[0] += 1
+            d[1] += blocked
+
+        # Heatmap cells from the bucket aggregates: one localtime() per bucket
+        local = {bucket: _local_hour(bucket) for bucket in totals}
+        hours: dict[tuple, list[int]] = defaultdict(lambda: [0, 0])
+        client_hours: dict[tuple, list[int]] = defaultdict(lambda: [0, 0])
+        for bucket, t in totals.items():
+            h = hours[local[bucket]]
+            h[0] += t[0]
+            h[1] += t[1]
+        for (bucket, client), c in clients.items():
+            h = client_hours[(client, *local[bucket])]
+            h[0] += c[0]
+            h[1] += c[1]
+
+        await db.executemany(
+            """
+            INSERT INTO rollup_totals (bucket, total, blocked, cached) VALUES (?, ?, ?, ?)
+            ON CONFLICT(bucket) DO UPDATE SET
+                total = total + excluded.total,
+                blocked = blocked + excluded.blocked,
+                cached = cached + excluded.cached
+            """,
+            [(b, *v) for b, v in totals.items()],
+        )
+        await db.executemany(
+            """
+            INSERT INTO rollup_minutes (bucket, total, blocked) VALUES (?, ?, ?)
+            ON CONFLICT(bucket) DO UPDATE SET
+                total = total + excluded.total,
+                blocked = blocked + excluded.blocked
+            """,
+            [(b, *v) for b, v in minutes.items()],
+        )
+        await db.executemany(
+            """
+            INSERT INTO rollup_clients (bucket, client, total, blocked) VALUES (?, ?, ?, ?)
+            ON CONFLICT(bucket, client) DO UPDATE SET
+                total = total + excluded.total,
+                blocked = blocked + excluded.blocked
+            """,
+            [(*k, *v) for k, v in clients.items()],
+        )
+        await db.executemany(
+            """
+            INSERT INTO rollup_domains (bucket, domain, total, blocked) VALUES (?, ?, ?, ?)
+            ON CONFLICT(bucket, domain) DO UPDATE SET
+                total = total + excluded.total,
+                blocked = blocked + excluded.blocked
+            """,
+            [(*k, *v) for k, v in domains.items()],
+        )
+        await db.executemany(
+            """
+            INSERT INTO rollup_hours (hour_start, day_of_week, hour, total, blocked)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(hour_start) DO UPDATE SET
+                total = total + excluded.total,
+                blocked = blocked + excluded.blocked
+            """,
+            [(*k, *v) for k, v in hours.items()],
+        )
+        await db.executemany(
+            """
+            INSERT INTO rollup_client_hours (client, hour_start, day_of_week, hour, total, blocked)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(client, hour_start) DO UPDATE SET
+                total = total + excluded.total,
+                blocked = blocked + excluded.blocked
+            """,
+            [(*k, *v) for k, v in client_hours.items()],
+        )
+        await _update_sketches(db, clients, domains)
+        await _set_state(db, "last_id", rows[-1]["id"])
+        await db.commit()
+        return rows
+
+
+async def _update_sketches(db, clients: dict[tuple, list[int]], domains: dict[tuple, list[int]]):
+    """Fold a batch's per-bucket client and domain counts into the sketches
+    of the hours they fall in."""
+    hours: dict[int, tuple] = defaultdict(lambda: (set(), defaultdict(int), defaultdict(int)))
+    for (bucket, client) in clients:
+        hours[bucket - bucket % 3600][0].add(client)
+    for (bucket, domain), (total, blocked) in domains.items():
+        _, totals, blocked_totals = hours[bucket - bucket % 3600]
+        totals[domain] += total
+        if blocked:
+            blocked_totals[domain] += blocked
+
+    k = settings.sketch_top_k
+    for hour_start, (hour_clients, totals, blocked_totals) in hours.items():
+        async with db.execute(
+            "SELECT domains, clients, top_domains, top_blocked FROM rollup_sketches WHERE hour_start = ?",
+            (hour_start,),
+        ) as c:
+            row = await c.fetchone()
+        domain_hll = HyperLogLog(row["domains"] if row else None)
+        client_hll = HyperLogLog(row["clients"] if row else None)
+        top = TopK.from_json(k, row["top_domains"] if row else None)
+        top_blocked = TopK.from_json(k, row["top_blocked"] if row else None)
+        for domain in totals:
+            domain_hll.add(domain)
+        for client in hour_clients:
+            client_hll.add(client)
+        top.update(totals)
+        top_blocked.update(blocked_totals)
+        await db.execute(
+            """
+            INSERT OR REPLACE INTO rollup_sketches
+                (hour_start, domains, clients, top_domains, top_blocked)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                hour_start, domain_hll.to_bytes(), client_hll.to_bytes(),
+                top.to_json(), top_blocked.to_json(),
+            ),
+        )
+
+
+async def _prune():
+    cutoff = int(time.time()) - settings.rollup_retention_days * 86400
+    cutoff -= cutoff % BUCKET
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        for table, column in _TABLES.items():
+            await db.execute(f"DELETE FROM {table} WHERE {column} < ?", (cutoff,))
+        if await _get_state(db, "coverage_start") < cutoff:
+            await _set_state(db, "coverage_start", cutoff)
+        await db.commit()
+
+
+async def _ingest_loop():
+    global _caught_up, _last_prune
+    while True:
+        try:
+            rows = await _ingest_batch()
+            n = len(rows)
+            if n < settings.rollup_batch_size:
+                _caught_up = True
+            if rows and _caught_up:
+                for listener in _listeners:
+                    try:
+                        await listener(rows)
+                    except Exception:
+                        logger.exception("Rollup listener failed")
+            if time.time() - _last_prune > 3600:
+                await _prune()
+                _last_prune = time.time()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Rollup ingest failed")
+            n = 0
+        # Keep going without delay while backfilling
+        await asyncio.sleep(0 if n >= settings.rollup_batch_size else settings.rollup_poll_interval)
+
+
+def add_listener(callback):
+    """Register `async callback(rows)` to receive each batch of new FTL rows
+    once the ingester has caught up, making it the one shared tail of
+    query_storage."""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+async def start():
+    global _task
+    if not settings.rollups_enabled:
+        return
+    await init_db()
+    _task = asyncio.create_task(_ingest_loop())
+
+
+async def stop():
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+def status() -> dict:
+    return {"running": _task is not None and not _task.done(), "caught_up": _caught_up}
+
+
+async def _coverage_start() -> int | None:
+    async with db_pool.get_pool("dashboard").acquire() as db:
+        value = await _get_state(db, "coverage_start", -1)
+        return value if value >= 0 else None
+
+
+async def covers(since: int, allow_lag: bool = False) -> bool:
+    """True when the rollups are caught up and reach back to `since`. With
+    allow_lag, a running ingester that is still catching up (e.g. right
+    after a restart) is good enough."""
+    if not (_task and (_caught_up or allow_lag)):
+        return False
+    start = await _coverage_start()
+    return start is not None and start <= since
+
+
+def _first_bucket(since: int) -> int:
+    return since - since % BUCKET
+
+
+def bucket_offset(resolution: int) -> int:
+    """Shift that aligns buckets of `resolution` seconds to local time: hours
+    and days start on local boundaries (at the current UTC offset)."""
+    return time.localtime().tm_gmtoff if resolution >= 3600 else 0
+
+
+def align(ts: int, resolution: int) -> int:
+    """Start of the `resolution` bucket holding `ts`."""
+    offset = bucket_offset(resolution)
+    return (ts + offset) // resolution * resolution - offset
+
+
+async def _fetch_all(query: str, params: tuple = ()) -> list[dict]:
+    return await db_pool.get_pool("dashboard").fetch_all(query, params)
+
+
+async def _fetch_one(query: str, params: tuple = ()) -> dict | None:
+    return await db_pool.get_pool("dashboard").fetch_one(query, params)
+
+
+async def get_summary(since: int) -> dict:
+    bucket = _first_bucket(since)
+    row = await _fetch_one(
+        """
+        SELECT
+            COALESCE(SUM(total), 0) as total_queries,
+            COALESCE(SUM(blocked), 0) as blocked_queries
+        FROM rollup_totals
+        WHERE bucket >= ?
+        """,
+        (bucket,),
+    )
+    distinct = await _fetch_one(
+        """
+        SELECT
+            (SELECT COUNT(DISTINCT domain) FROM rollup_domains WHERE bucket >= ?) as unique_domains,
+            (SELECT COUNT(DISTINCT client) FROM rollup_clients WHERE bucket >= ?) as unique_clients
+        """,
+        (bucket, bucket),
+    )
+    return {**row, **distinct}
+
+
+async def get_top_domains(since: int, limit: int, blocked_only: bool = False) -> list[dict]:
+    column = "blocked" if blocked_only else "total"
+    return await _fetch_all(
+        f"""
+        SELECT domain, SUM({column}) as count
+        FROM rollup_domains
+        WHERE bucket >= ?{" AND blocked > 0" if blocked_only else ""}
+        GROUP BY domain
+        ORDER BY count DESC
+        LIMIT ?
+        """,
+        (_first_bucket(since), limit),
+    )
+
+
+def _sketch_hours(since: int) -> tuple[int, int]:
+    """Start of the first whole hour in the window, and of the bucket the
+    window starts in: the sketches cover the hours, the buckets in between
+    are read exactly."""
+    return since + -since % 3600, _first_bucket(since)
+
+
+async def get_sketch_summary(since: int) -> dict:
+    """Query totals since `since`, with distinct domains and clients estimated
+    from the hourly sketches and their relative standard error under `error`.
+    Any part hour at the start of the window is added from the buckets."""
+    first_hour, bucket = _sketch_hours(since)
+    totals = await _fetch_one(
+        """
+        SELECT
+            COALESCE(SUM(total), 0) as total_queries,
+            COALESCE(SUM(blocked), 0) as blocked_queries
+        FROM rollup_totals
+        WHERE bucket >= ?
+        """,
+        (bucket,),
+    )
+    rows = await _fetch_all(
+        "SELECT domains, clients FROM rollup_sketches WHERE hour_start >= ?",
+        (first_hour,),
+    )
+    domains = HyperLogLog.union([HyperLogLog(r["domains"]) for r in rows])
+    clients = HyperLogLog.union([HyperLogLog(r["clients"]) for r in rows])
+    if bucket < first_hour:
+        for r in await _fetch_all(
+            "SELECT DISTINCT domain FROM rollup_domains WHERE bucket >= ? AND bucket < ?",
+            (bucket, first_hour),
+        ):
+            domains.add(r["domain"])
+        for r in await _fetch_all(
+            "SELECT DISTINCT client FROM rollup_clients WHERE bucket >= ? AND bucket < ?",
+            (bucket, first_hour),
+        ):
+            clients.add(r["client"])
+    error = HyperLogLog.relative_error()
+    return {
+        **totals,
+        "unique_domains": domains.count(),
+        "unique_clients": clients.count(),
+        "error": {"unique_domains": error, "unique_clients": error},
+    }
+
+
+async def get_sketch_top_domains(since: int, limit: int, blocked_only: bool = False) -> list[dict]:
+    """Top domains since `since` from the hourly summaries, plus exact counts
+    for any part hour at the start of the window. Each count is at most
+    `error` below the true count."""
+    first_hour, bucket = _sketch_hours(since)
+    column = "top_blocked" if blocked_only else "top_domains"
+    rows = await _fetch_all(
+        f"SELECT {column} as top FROM rollup_sketches WHERE hour_start >= ?",
+        (first_hour,),
+    )
+    k = settings.sketch_top_k
+    merged = TopK.union(k, [TopK.from_json(k, r["top"]) for r in rows])
+    if bucket < first_hour:
+        count = "blocked" if blocked_only else "total"
+        edge = await _fetch_all(
+            f"""
+            SELECT domain, SUM({count}) as count
+            FROM rollup_domains
+            WHERE bucket >= ? AND bucket < ?{" AND blocked > 0" if blocked_only else ""}
+            GROUP BY domain
+            """,
+            (bucket, first_hour),
+        )
+        merged.update({r["domain"]: r["count"] for r in edge})
+    return [
+        {"domain": domain, "count": count, "error": merged.error}
+        for domain, count in merged.top(limit)
+    ]
+
+
+async def get_client_activity(since: int, interval: int) -> list[dict]:
+    """Per-client query counts in `interval`-second slots counted from `since`."""
+    return await _fetch_all(
+        """
+        SELECT client, MAX(bucket - ?, 0) / ? as slot, SUM(total) as total
+        FROM rollup_clients
+        WHERE bucket >= ?
+        GROUP BY client, slot
+        """,
+        (since, interval, _first_bucket(since)),
+    )
+
+
+async def get_over_time(
+    since: int, resolution: int = BUCKET, clients: list[str] | None = None
+) -> dict[str, list]:
+    """Totals per `resolution` seconds since `since` (from the start of its
+    10-minute bucket, or minute at 1-minute resolution), as
+    bucket/blocked/allowed columns, for all clients or only the given IPs.
+    Per-client series start at 10 minutes."""
+    if resolution == MINUTE_BUCKET:
+        if clients is not None:
+            raise ValueError("per-client rollups have no 1-minute resolution")
+        source, first = "rollup_minutes", since - since % MINUTE_BUCKET
+    else:
+        source = "rollup_totals" if clients is None else "rollup_clients"
+        first = _first_bucket(since)
+    condition, params = "", ()
+    if clients is not None:
+        condition = "AND client IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(clients),)
+    offset = bucket_offset(resolution)
+    return await db_pool.get_pool("dashboard").fetch_columns(
+        f"""
+        SELECT
+            ((bucket + ?) / ?) * ? - ? as bucket,
+            SUM(blocked) as blocked,
+            SUM(total - blocked) as allowed
+        FROM {source}
+        WHERE bucket >= ? {condition}
+        GROUP BY 1
+        ORDER BY 1
+        """,
+        (offset, resolution, resolution, offset, first, *params),
+    )
+
+
+async def get_hourly_pattern(since: int, clients: list[str] | None = None) -> list[dict]:
+    """Query counts by local day of week and hour since `since` (from the
+    start of its hour), for all clients or only the given IPs."""
+    if clients is None:
+        source, condition, params = "rollup_hours", "", ()
+    else:
+        source = "rollup_client_hours"
+        condition = "AND client IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(clients),)
+    return await _fetch_all(
+        f"""
+        SELECT day_of_week, hour, SUM(total) as count
+        FROM {source}
+        WHERE hour_start > ? {condition}
+        GROUP BY day_of_week, hour
+        ORDER BY day_of_week, hour
+        """,
+        (since - 3600, *params),
+    )
@@ -1,28 +1,43 @@
+"""Timed block expiry.
+
+Active blocks sit in a min-heap keyed on `expires_at`. The expiry task
+sleeps until the earliest one is due and is woken early whenever a block is
+added or cancelled. Everything due at that point is unblocked together, with
+one pihole call and one list reload. Cancelled blocks are left in the heap
+and skipped when they reach the top.
+"""
 from __future__ import annotations
 
 import asyncio
+import heapq
+import logging
 import time
 import uuid
 from app.services import device_db, pihole
 
+logger = logging.getLogger(__name__)
+
+# Longest sleep between wall-clock checks; a Pi without an RTC can jump
+# forward when NTP syncs after boot
+_MAX_SLEEP = 60
+
 # In-memory tracking of active timed blocks
 _active_blocks: dict[str, dict] = {}
+_heap: list[tuple[int, str]] = []
+_wakeup = asyncio.Event()
+# Serializes block/unblock calls so an expiry can't undo a newer block of the same domain
+_lock = asyncio.Lock()
 _task: asyncio.Task | None = None
 
 
 async def init():
-    """Load persisted timed blocks and start the checker task."""
-    blocks = await device_db.get_active_timed_blocks()
-    now = int(time.time())
-    for b in blocks:
-        if b["expires_at"] > now:
-            _active_blocks[b["id"]] = b
-        else:
-            # Expired while app was down — clean up
-            await _expire_block(b)
+    """Load persisted timed blocks and start the expiry task."""
+    for b in await device_db.get_active_timed_blocks():
+        _schedule(b)
+    # Blocks that expired while the app was down go on the first pass
 
     global _task
-    _task = asyncio.create_task(_check_loop())
+    _task = asyncio.create_task(_expiry_loop())
 
 
 async def shutdown():
@@ -36,46 +51,115 @@ async def shutdown():
         _task = None
 
 
-async def _expire_block(block: dict):
-    """Remove a domain from the blacklist and deactivate the record."""
-    await pihole.remove_wildcard(block["domain"])
-    await device_db.deactivate_timed_block(block["id"])
-    _active_blocks.pop(block["id"], None)
+def _schedule(block: dict):
+    _active_blocks[block["id"]] = block
+    heapq.heappush(_heap, (block["expires_at"], block["id"]))
+
+
+def _pop_due(now: int) -> list[dict]:
+    due = []
+    while _heap and _heap[0][0] <= now:
+        _, block_id = heapq.heappop(_heap)
+        block = _active_blocks.get(block_id)
+        if block is not None:
+            due.append(block)
+    return due
+
 
+async def _expire_blocks(blocks: list[dict]):
+    """Unblock the domains of `blocks` and deactivate their records.
 
-async def _check_loop():
+    A domain that another active block still covers stays blocked. Blocks
+    stay active until both calls succeed, so a failed pass is retried."""
+    async with _lock:
+        # A cancel may have expired some of them while we waited for the lock
+        blocks = list({b["id"]: b for b in blocks if b["id"] in _active_blocks}.values())
+        if not blocks:
+            return
+        ids = {b["id"] for b in blocks}
+        still_blocked = {b["domain"] for b in _active_blocks.values() if b["id"] not in ids}
+        domains = sorted({b["domain"] for b in blocks} - still_blocked)
+        try:
+            if domains:
+                batch = await pihole.apply_domain_batch(
+                    [{"action": "remove", "domain": d, "type": "wildcard"} for d in domains]
+                )
+                for r in batch["results"]:
+                    if not r["ok"]:
+                        logger.error("Could not unblock %s: %s", r["domain"], r["error"])
+            await device_db.deactivate_timed_blocks(list(ids))
+        except Exception:
+            # Back on the heap for the next pass
+            for b in blocks:
+                _schedule(b)
+            raise
+        for block_id in ids:
+            del _active_blocks[block_id]
+
+
+async def _expiry_loop():
     while True:
-        await asyncio.sleep(30)
-        now = int(time.time())
-        expired = [b for b in _active_blocks.values() if b["expires_at"] <= now]
-        for b in expired:
-            await _expire_block(b)
+        try:
+            due = _pop_due(int(time.time()))
+            if due:
+                await _expire_blocks(due)
+                continue
+            # Skip cancelled entries so the sleep targets a live block
+            while _heap and _heap[0][1] not in _active_blocks:
+                heapq.heappop(_heap)
+            timeout = _MAX_SLEEP
+            if _heap:
+                timeout = min(max(_heap[0][0] - time.time(), 0), _MAX_SLEEP)
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Timed block expiry failed")
+            await asyncio.sleep(5)
 
 
-async def create_timed_block(domain: str, duration_minutes: int) -> dict:
+async def create_timed_blocks(domains: list[str], duration_minutes: int) -> list[dict]:
+    """Wildcard-block `domains` until the same expiry, with one pihole call
+    and one list reload. Domains pihole rejected come back with an `error`
+    instead of a block."""
     now = int(time.time())
-    block_id = str(uuid.uuid4())
     expires_at = now + duration_minutes * 60
-    comment = f"timed-block {block_id} expires {expires_at}"
-
-    await pihole.add_wildcard(domain, comment=comment)
-    await device_db.add_timed_block(block_id, domain, now, expires_at)
-
-    block = {
-        "id": block_id,
-        "domain": domain,
-        "created_at": now,
-        "expires_at": expires_at,
-    }
-    _active_blocks[block_id] = block
-    return block
+    comment = f"timed-block expires {expires_at}"
+    async with _lock:
+        batch = await pihole.apply_domain_batch(
+            [{"action": "add", "domain": d, "type": "wildcard", "comment": comment} for d in domains]
+        )
+        results, blocks = [], []
+        for result in batch["results"]:
+            if not result["ok"]:
+                results.append({"domain": result["domain"], "error": result["error"]})
+                continue
+            block = {
+                "id": str(uuid.uuid4()),
+                "domain": result["domain"],
+                "created_at": now,
+                "expires_at": expires_at,
+            }
+            blocks.append(block)
+            results.append(block)
+        if blocks:
+            await device_db.add_timed_blocks(blocks)
+            for block in blocks:
+                _schedule(block)
+            _wakeup.set()
+    return results
 
 
 async def cancel_timed_block(block_id: str) -> bool:
     block = _active_blocks.get(block_id)
     if not block:
         return False
-    await _expire_block(block)
+    await _expire_blocks([block])
+    _wakeup.set()
     return True
 
 
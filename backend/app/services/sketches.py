@@ -0,0 +1,110 @@
+"""Mergeable streaming sketches behind the approximate (`approx=true`) stats.
+
+HyperLogLog estimates a distinct count in a fixed 2**PRECISION bytes, with a
+relative standard error of 1.04/sqrt(2**PRECISION). A Misra-Gries summary
+(the mergeable form of Space-Saving) keeps the k heaviest items; every count
+it reports is at most `error` below the true count, and anything it dropped
+occurred at most `error` times. Both merge across time buckets without
+losing those guarantees, so a window is answered by merging the sketches of
+its buckets.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import math
+from operator import itemgetter
+
+PRECISION = 12
+_POWERS = [2.0 ** -r for r in range(65)]
+
+
+def _hash64(value: str) -> int:
+    # Stable across processes, unlike hash(); sketches are stored
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: bytes | None = None):
+        self.registers = bytearray(registers) if registers else bytearray(1 << PRECISION)
+
+    def add(self, value: str):
+        h = _hash64(value)
+        index = h >> (64 - PRECISION)
+        rest = h & ((1 << (64 - PRECISION)) - 1)
+        rank = 64 - PRECISION - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    @classmethod
+    def union(cls, sketches: list[HyperLogLog]) -> HyperLogLog:
+        if len(sketches) < 2:
+            return cls(sketches[0].registers if sketches else None)
+        return cls(bytes(map(max, *(s.registers for s in sketches))))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(map(_POWERS.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    @staticmethod
+    def relative_error() -> float:
+        return round(1.04 / math.sqrt(1 << PRECISION), 4)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class TopK:
+    """Misra-Gries summary of at most `k` items."""
+
+    __slots__ = ("k", "counts", "error")
+
+    def __init__(self, k: int, counts: dict[str, int] | None = None, error: int = 0):
+        self.k = k
+        self.counts = counts or {}
+        self.error = error
+
+    def update(self, counts: dict[str, int]):
+        """Add exact counts for a batch of items."""
+        for item, count in counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+        self._truncate()
+
+    @classmethod
+    def union(cls, k: int, summaries: list[TopK]) -> TopK:
+        merged = cls(k)
+        for s in summaries:
+            for item, count in s.counts.items():
+                merged.counts[item] = merged.counts.get(item, 0) + count
+            merged.error += s.error
+        merged._truncate()
+        return merged
+
+    def _truncate(self):
+        if len(self.counts) <= self.k:
+            return
+        # Take the (k+1)-th largest count off every item; what's left fits in k
+        cut = heapq.nlargest(self.k + 1, self.counts.values())[-1]
+        self.error += cut
+        self.counts = {item: count - cut for item, count in self.counts.items() if count > cut}
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+    def to_json(self) -> str:
+        return json.dumps([self.error, self.counts])
+
+    @classmethod
+    def from_json(cls, k: int, data: str | None) -> TopK:
+        if not data:
+            return cls(k)
+        error, counts = json.loads(data)
+        return cls(k, counts, error)
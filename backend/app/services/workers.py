@@ -0,0 +1,211 @@
+"""Worker pool for heavy FTL queries and aggregation.
+
+Jobs are queued by priority, so interactive log paging starts before heavy
+stats. With more than one worker, one is kept free for interactive jobs.
+Work runs in separate processes by default (threads with
+worker_processes=false), so neither the SQLite scan, the Python-side
+aggregation nor the row-to-dict conversion holds up the event loop. A
+caller that goes away takes its job with it: queued jobs are dropped and
+running statements interrupted through a shared per-slot flag.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.config import settings
+from app.services import analytics
+
+INTERACTIVE = 0
+HEAVY = 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", HEAVY: "heavy"}
+
+
+class _Job:
+    __slots__ = ("priority", "path", "fn", "args", "label", "future", "enqueued_at", "slot")
+
+    def __init__(self, priority: int, path: str, fn, args: tuple, label: str):
+        self.priority = priority
+        self.path = path
+        self.fn = fn
+        self.args = args
+        self.label = label
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.slot: int | None = None
+
+
+_executor: Executor | None = None
+_flags = None
+_free_slots: list[int] = []
+_queue: list[tuple[int, int, _Job]] = []
+_seq = itertools.count()
+_running: set[asyncio.Task] = set()
+_metrics: dict[str, dict] = {}
+_slowest: deque = deque(maxlen=10)
+
+
+def _new_metrics() -> dict:
+    return {
+        "jobs": 0,
+        "errors": 0,
+        "cancelled": 0,
+        "wait_ms_total": 0.0,
+        "wait_ms_max": 0.0,
+        "run_ms_total": 0.0,
+        "run_ms_max": 0.0,
+    }
+
+
+def start():
+    global _executor, _flags, _free_slots
+    if _executor is not None:
+        return
+    size = max(settings.worker_pool_size, 1)
+    _flags = multiprocessing.Array("b", size, lock=False)
+    pragmas = {
+        "busy_timeout": settings.db_busy_timeout_ms,
+        "mmap_size": settings.db_mmap_size,
+        "cache_size_kb": settings.db_cache_size_kb,
+    }
+    if settings.worker_processes:
+        _executor = ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=analytics.init,
+            initargs=(_flags, pragmas),
+        )
+    else:
+        analytics.init(_flags, pragmas)
+        _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ftl-worker")
+    _free_slots = list(range(size))
+    _metrics.update({name: _new_metrics() for name in _PRIORITY_NAMES.values()})
+
+
+async def stop():
+    global _executor
+    for _, _, job in _queue:
+        job.future.cancel()
+    _queue.clear()
+    for slot in range(len(_flags or [])):
+        _flags[slot] = 1
+    if _running:
+        await asyncio.gather(*_running, return_exceptions=True)
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _reserved() -> int:
+    return 1 if settings.worker_pool_size > 1 else 0
+
+
+def _dispatch():
+    while _queue and _free_slots:
+        _, _, job = _queue[0]
+        if job.future.done():
+            # Caller went away while queued
+            heapq.heappop(_queue)
+            continue
+        if job.priority > INTERACTIVE and len(_free_slots) <= _reserved():
+            # The head is the most urgent job, so nothing interactive is waiting
+            break
+        heapq.heappop(_queue)
+        job.slot = _free_slots.pop()
+        task = asyncio.create_task(_execute(job))
+        _running.add(task)
+        task.add_done_callback(_running.discard)
+
+
+async def _execute(job: _Job):
+    metrics = _metrics[_PRIORITY_NAMES[job.priority]]
+    started = time.monotonic()
+    wait_ms = (started - job.enqueued_at) * 1000
+    metrics["wait_ms_total"] += wait_ms
+    metrics["wait_ms_max"] = max(metrics["wait_ms_max"], wait_ms)
+    _flags[job.slot] = 0
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            _executor, analytics.run, job.slot, job.path, job.fn, *job.args
+        )
+        if not job.future.done():
+            job.future.set_result(result)
+    except Exception as e:
+        if job.future.done():
+            # Interrupted after its caller cancelled
+            metrics["cancelled"] += 1
+        else:
+            metrics["errors"] += 1
+            job.future.set_exception(e)
+    finally:
+        run_ms = (time.monotonic() - started) * 1000
+        metrics["jobs"] += 1
+        metrics["run_ms_total"] += run_ms
+        metrics["run_ms_max"] = max(metrics["run_ms_max"], run_ms)
+        if run_ms >= 1000:
+            _slowest.append({"label": job.label, "ms": round(run_ms, 1), "at": int(time.time())})
+        if not job.future.done():
+            job.future.cancel()
+        _free_slots.append(job.slot)
+        _dispatch()
+
+
+async def run(fn, *args, priority: int = HEAVY, path: str | None = None, label: str = ""):
+    """Run `analytics.<fn>(conn, *args)` against `path` (default: the FTL
+    database) in the pool and return its result."""
+    if _executor is None:
+        start()
+    job = _Job(priority, path or settings.ftl_db_path, fn, args, label or fn.__name__)
+    heapq.heappush(_queue, (priority, next(_seq), job))
+    _dispatch()
+    try:
+        # Shielded so the future is still pending below and the slot can be told
+        return await asyncio.shield(job.future)
+    except asyncio.CancelledError:
+        metrics = _metrics[_PRIORITY_NAMES[priority]]
+        if job.slot is None:
+            metrics["cancelled"] += 1
+        elif not job.future.done():
+            _flags[job.slot] = 1
+        job.future.cancel()
+        raise
+
+
+async def fetch_all(query: str, params: tuple = (), priority: int = HEAVY) -> list[dict]:
+    return await run(analytics.fetch_all, query, params, priority=priority, label=_label(query))
+
+
+async def fetch_one(query: str, params: tuple = (), priority: int = HEAVY) -> dict | None:
+    return await run(analytics.fetch_one, query, params, priority=priority, label=_label(query))
+
+
+async def fetch_columns(query: str, params: tuple = (), priority: int = HEAVY) -> dict[str, list]:
+    return await run(analytics.fetch_columns, query, params, priority=priority, label=_label(query))
+
+
+def _label(query: str) -> str:
+    return " ".join(query.split())[:120]
+
+
+def get_metrics() -> dict:
+    jobs = {}
+    for name, m in _metrics.items():
+        jobs[name] = {
+            **m,
+            "wait_ms_avg": round(m["wait_ms_total"] / m["jobs"], 2) if m["jobs"] else 0.0,
+            "run_ms_avg": round(m["run_ms_total"] / m["jobs"], 2) if m["jobs"] else 0.0,
+        }
+    return {
+        "size": settings.worker_pool_size,
+        "processes": settings.worker_processes,
+        "busy": len(_running),
+        "queued": sum(1 for _, _, job in _queue if not job.future.done()),
+        "jobs": jobs,
+        "slowest": list(_slowest),
+    }
@@ -0,0 +1,57 @@
+"""Compare two benchmark result files written by `bench.run`.
+
+    python -m bench.compare bench/results/before.json bench/results/after.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+
+def _change(before: float | None, after: float | None) -> str:
+    if not before or after is None:
+        return "     n/a"
+    return f"{(after - before) / before * 100:+7.1f}%"
+
+
+def print_diff(before: dict, after: dict):
+    print(f"\n{before.get('commit')} ({before.get('label') or '-'}) -> "
+          f"{after.get('commit')} ({after.get('label') or '-'})")
+    if before.get("dataset", {}).get("args") != after.get("dataset", {}).get("args"):
+        print("warning: results come from different datasets")
+    if before.get("options") != after.get("options"):
+        print("warning: results were run with different options")
+
+    header = "".join(f"{m:>22}" for m in METRICS)
+    print(f"{'endpoint':32}{header}")
+    for name, new in after["endpoints"].items():
+        old = before["endpoints"].get(name)
+        if old is None:
+            print(f"{name:32}{'(new)':>22}")
+            continue
+        cells = "".join(f"{new[m]:>12.1f} {_change(old[m], new[m])}" for m in METRICS)
+        print(f"{name:32}{cells}")
+
+    print(f"{'peak RSS (MB)':32}{after.get('peak_rss_mb') or 0:>12.1f} "
+          f"{_change(before.get('peak_rss_mb'), after.get('peak_rss_mb'))}")
+    startup_before = before.get("startup", {}).get("ready_s")
+    startup_after = after.get("startup", {}).get("ready_s")
+    print(f"{'ready (s)':32}{startup_after or 0:>12.1f} {_change(startup_before, startup_after)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print_diff(before, after)
+
+
+if __name__ == "__main__":
+    main()
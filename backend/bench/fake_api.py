@@ -0,0 +1,112 @@
+"""Stub of the Pi-hole v6 REST API endpoints the `api` backend uses, over a
+gravity.db such as the one bench.generate writes.
+
+Covers POST /api/auth, POST /api/domains/{type}/{kind} and
+POST /api/domains:batchDelete, with the same request and response shapes
+as FTL. Sessions never expire unless --session-ttl is given.
+
+    python -m bench.fake_api --gravity bench/data/gravity.db --password secret --port 8081
+    PIHOLE_DASH_PIHOLE_BACKEND=api PIHOLE_DASH_PIHOLE_API_URL=http://127.0.0.1:8081 \\
+        PIHOLE_DASH_PIHOLE_API_PASSWORD=secret uvicorn app.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import secrets
+import sqlite3
+import time
+
+import uvicorn
+from fastapi import Body, FastAPI, Header, HTTPException
+
+# (type, kind) -> domainlist type code
+_TYPES = {("allow", "exact"): 0, ("deny", "exact"): 1, ("allow", "regex"): 2, ("deny", "regex"): 3}
+_VALID_DOMAIN = re.compile(r"^[a-z\d_-]+(\.[a-z\d_-]+)*$")
+
+
+def create_app(gravity_path: str, password: str, session_ttl: float | None = None) -> FastAPI:
+    app = FastAPI()
+    sessions: dict[str, float] = {}
+    stats = {"requests": 0}
+
+    def check(sid: str | None):
+        stats["requests"] += 1
+        if not password:
+            return
+        expires = sessions.get(sid or "")
+        if expires is None or expires < time.time():
+            raise HTTPException(401, {"error": {"key": "unauthorized", "message": "Unauthorized"}})
+
+    @app.post("/api/auth")
+    def auth(body: dict = Body(...)):
+        if password and body.get("password") != password:
+            raise HTTPException(401, {"session": {"valid": False, "sid": None}})
+        if not password:
+            return {"session": {"valid": True, "sid": None, "validity": -1}}
+        sid = secrets.token_urlsafe(16)
+        sessions[sid] = time.time() + session_ttl if session_ttl else float("inf")
+        return {"session": {"valid": True, "sid": sid, "validity": session_ttl or -1}}
+
+    @app.post("/api/domains/{list_type}/{kind}", status_code=201)
+    def add(list_type: str, kind: str, body: dict = Body(...), x_ftl_sid: str | None = Header(None)):
+        check(x_ftl_sid)
+        type_code = _TYPES.get((list_type, kind))
+        if type_code is None:
+            raise HTTPException(400, "Invalid type or kind")
+        items = body["domain"] if isinstance(body["domain"], list) else [body["domain"]]
+        success, errors = [], []
+        with sqlite3.connect(gravity_path) as db:
+            for item in items:
+                if kind == "exact" and not _VALID_DOMAIN.match(item):
+                    errors.append({"item": item, "error": "Invalid domain"})
+                    continue
+                if kind == "regex":
+                    try:
+                        re.compile(item)
+                    except re.error as e:
+                        errors.append({"item": item, "error": f"Invalid regex: {e}"})
+                        continue
+                cur = db.execute(
+                    "INSERT INTO domainlist (type, domain, comment, enabled) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (domain, type) DO NOTHING",
+                    (type_code, item, body.get("comment"), int(body.get("enabled", True))),
+                )
+                if cur.rowcount:
+                    success.append({"item": item})
+                else:
+                    errors.append({"item": item, "error": "UNIQUE constraint failed: domainlist.domain, domainlist.type"})
+        return {"domains": [], "processed": {"success": success, "errors": errors}, "took": 0.0}
+
+    @app.post("/api/domains:batchDelete", status_code=204)
+    def batch_delete(body: list[dict] = Body(...), x_ftl_sid: str | None = Header(None)):
+        check(x_ftl_sid)
+        with sqlite3.connect(gravity_path) as db:
+            for entry in body:
+                type_code = _TYPES.get((entry["type"], entry["kind"]))
+                db.execute(
+                    "DELETE FROM domainlist_by_group WHERE domainlist_id IN "
+                    "(SELECT id FROM domainlist WHERE domain = ? AND type = ?)",
+                    (entry["item"], type_code),
+                )
+                db.execute("DELETE FROM domainlist WHERE domain = ? AND type = ?", (entry["item"], type_code))
+
+    @app.get("/stats")
+    def get_stats():
+        return {**stats, "sessions": len(sessions)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gravity", required=True, help="gravity.db to edit")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--session-ttl", type=float, default=None, help="Seconds before a session expires")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.gravity, args.password, args.session_ttl), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""Generate synthetic pihole-FTL.db and gravity.db files for benchmarking.
+
+The FTL database uses the v5 schema (query_storage with integer ids into
+domain_by_id/client_by_id/forward_by_id/addinfo_by_id, the `queries` view,
+network tables), with a Zipf-skewed domain and client distribution and a
+day/night traffic curve. Output is deterministic for a given seed.
+
+    python -m bench.generate --queries 5000000 --out bench/data
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+
+FTL_SCHEMA = """
+CREATE TABLE ftl (id INTEGER PRIMARY KEY NOT NULL, value BLOB NOT NULL);
+CREATE TABLE counters (id INTEGER PRIMARY KEY NOT NULL, value INTEGER NOT NULL);
+CREATE TABLE message (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp INTEGER NOT NULL, type TEXT NOT NULL,
+    message TEXT NOT NULL, blob1 BLOB, blob2 BLOB, blob3 BLOB, blob4 BLOB, blob5 BLOB
+);
+CREATE TABLE query_storage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp INTEGER NOT NULL, type INTEGER NOT NULL,
+    status INTEGER NOT NULL, domain INTEGER NOT NULL, client INTEGER NOT NULL,
+    forward INTEGER, additional_info INTEGER, reply_type INTEGER, reply_time REAL,
+    dnssec INTEGER
+);
+CREATE TABLE domain_by_id (id INTEGER PRIMARY KEY, domain TEXT NOT NULL);
+CREATE TABLE client_by_id (id INTEGER PRIMARY KEY, ip TEXT NOT NULL, name TEXT);
+CREATE TABLE forward_by_id (id INTEGER PRIMARY KEY, forward TEXT NOT NULL);
+CREATE TABLE addinfo_by_id (id INTEGER PRIMARY KEY, type INTEGER NOT NULL, content NOT NULL);
+CREATE UNIQUE INDEX domain_by_id_domain_idx ON domain_by_id(domain);
+CREATE UNIQUE INDEX client_by_id_client_idx ON client_by_id(ip, name);
+CREATE UNIQUE INDEX forward_by_id_forward_idx ON forward_by_id(forward);
+CREATE UNIQUE INDEX addinfo_by_id_idx ON addinfo_by_id(type, content);
+CREATE VIEW queries AS
+    SELECT id, timestamp, type, status,
+        CASE typeof(domain) WHEN 'integer' THEN (SELECT domain FROM domain_by_id d WHERE d.id = q.domain) ELSE domain END domain,
+        CASE typeof(client) WHEN 'integer' THEN (SELECT ip FROM client_by_id c WHERE c.id = q.client) ELSE client END client,
+        CASE typeof(forward) WHEN 'integer' THEN (SELECT forward FROM forward_by_id f WHERE f.id = q.forward) ELSE forward END forward,
+        CASE typeof(additional_info) WHEN 'integer' THEN (SELECT content FROM addinfo_by_id a WHERE a.id = q.additional_info) ELSE additional_info END additional_info,
+        reply_type, reply_time, dnssec
+    FROM query_storage q;
+CREATE TABLE network (
+    id INTEGER PRIMARY KEY NOT NULL, hwaddr TEXT UNIQUE NOT NULL, interface TEXT NOT NULL,
+    firstSeen INTEGER NOT NULL, lastQuery INTEGER NOT NULL, numQueries INTEGER NOT NULL,
+    macVendor TEXT, aliasclient_id INTEGER
+);
+CREATE TABLE network_addresses (
+    network_id INTEGER NOT NULL, ip TEXT UNIQUE NOT NULL,
+    lastSeen INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    name TEXT, nameUpdated INTEGER,
+    FOREIGN KEY(network_id) REFERENCES network(id)
+);
+CREATE TABLE aliasclient (id INTEGER PRIMARY KEY NOT NULL, name TEXT NOT NULL, comment TEXT);
+INSERT INTO ftl (id, value) VALUES (0, 12);
+"""
+
+GRAVITY_SCHEMA = """
+CREATE TABLE "group" (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, enabled BOOLEAN NOT NULL DEFAULT 1,
+    name TEXT UNIQUE NOT NULL,
+    date_added INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    date_modified INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    description TEXT
+);
+INSERT INTO "group" (id, enabled, name, description) VALUES (0, 1, 'Default', 'The default group');
+CREATE TABLE domainlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, type INTEGER NOT NULL DEFAULT 0,
+    domain TEXT NOT NULL, enabled BOOLEAN NOT NULL DEFAULT 1,
+    date_added INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    date_modified INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    comment TEXT, UNIQUE(domain, type)
+);
+CREATE TABLE adlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, address TEXT UNIQUE NOT NULL,
+    enabled BOOLEAN NOT NULL DEFAULT 1,
+    date_added INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    date_modified INTEGER NOT NULL DEFAULT (cast(strftime('%s', 'now') as int)),
+    comment TEXT, date_updated INTEGER, number INTEGER NOT NULL DEFAULT 0,
+    invalid_domains INTEGER NOT NULL DEFAULT 0, status INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE adlist_by_group (
+    adlist_id INTEGER NOT NULL REFERENCES adlist (id),
+    group_id INTEGER NOT NULL REFERENCES "group" (id),
+    PRIMARY KEY (adlist_id, group_id)
+);
+CREATE TABLE domainlist_by_group (
+    domainlist_id INTEGER NOT NULL REFERENCES domainlist (id),
+    group_id INTEGER NOT NULL REFERENCES "group" (id),
+    PRIMARY KEY (domainlist_id, group_id)
+);
+CREATE TABLE gravity (domain TEXT NOT NULL, adlist_id INTEGER NOT NULL REFERENCES adlist (id));
+CREATE TABLE info (property TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TRIGGER tr_domainlist_add AFTER INSERT ON domainlist
+    BEGIN INSERT INTO domainlist_by_group (domainlist_id, group_id) VALUES (NEW.id, 0); END;
+CREATE TRIGGER tr_adlist_add AFTER INSERT ON adlist
+    BEGIN INSERT INTO adlist_by_group (adlist_id, group_id) VALUES (NEW.id, 0); END;
+INSERT INTO info (property, value) VALUES ('version', 15);
+"""
+
+ADLISTS = [
+    "https://raw.githubusercontent.com/StevenBlack/hosts/master/hosts",
+    "https://s3.amazonaws.com/lists.disconnect.me/simple_tracking.txt",
+    "https://s3.amazonaws.com/lists.disconnect.me/simple_ad.txt",
+    "https://adaway.org/hosts.txt",
+    "https://v.firebog.net/hosts/AdguardDNS.txt",
+]
+UPSTREAMS = ["1.1.1.1#53", "1.0.0.1#53", "9.9.9.9#53"]
+VENDORS = ["Apple, Inc.", "Samsung Electronics", "Google, Inc.", "Amazon Technologies", "Raspberry Pi", "Sonos", None]
+SUBDOMAINS = ["www", "api", "cdn", "static", "img", "m", "mail", "edge", "assets", "app"]
+TLDS = ["com", "net", "org", "io", "co.uk", "de", "tv"]
+
+# Per-query status mix by domain class (FTL status codes)
+STATUS_MIX = {
+    "allowed": ([2, 3, 12, 14], [52, 45, 1, 2]),
+    "gravity": ([1, 9, 2], [93, 5, 2]),
+    "blacklist": ([5], [1]),
+    "regex": ([4], [1]),
+}
+QUERY_TYPES = ([1, 2, 5, 6, 16], [58, 32, 3, 5, 2])
+
+
+def _weights(n: int, skew: float) -> list[float]:
+    """Cumulative Zipf weights for ranks 1..n."""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def _domain_names(rnd: random.Random, count: int) -> list[tuple[str, str]]:
+    """(name, class) pairs; the class decides how queries for it are answered."""
+    domains = []
+    for i in range(count):
+        roll = rnd.random()
+        if roll < 0.08:
+            name = f"ads{i}.adserver{i % 997}.{rnd.choice(TLDS)}"
+            kind = "gravity"
+        elif roll < 0.085:
+            name = f"track{i}.metrics{i % 97}.net"
+            kind = "regex"
+        elif roll < 0.087:
+            name = f"{rnd.choice(SUBDOMAINS)}.blocked{i}.com"
+            kind = "blacklist"
+        else:
+            name = f"{rnd.choice(SUBDOMAINS)}.site{i}.{rnd.choice(TLDS)}"
+            kind = "allowed"
+        domains.append((name, kind))
+    return domains
+
+
+def _hour_counts(queries: int, hours: int, start: int) -> list[int]:
+    """Split `queries` across hours following a day/night curve peaking in the evening."""
+    weights = []
+    for h in range(hours):
+        hour_of_day = time.localtime(start + h * 3600).tm_hour
+        weights.append(1.15 + math.sin((hour_of_day - 14) / 24 * 2 * math.pi))
+    total = sum(weights)
+    counts = [int(queries * w / total) for w in weights]
+    counts[-1] += queries - sum(counts)
+    return counts
+
+
+def generate_ftl(path: str, rnd: random.Random, queries: int, clients: int, domains: list,
+                 days: int, end: int, skew: float) -> dict:
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    db.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + FTL_SCHEMA)
+    start = end - days * 86400
+
+    db.executemany(
+        "INSERT INTO domain_by_id (id, domain) VALUES (?, ?)",
+        ((i, name) for i, (name, _) in enumerate(domains, 1)),
+    )
+    db.executemany("INSERT INTO forward_by_id (id, forward) VALUES (?, ?)", list(enumerate(UPSTREAMS, 1)))
+    cname_targets = [i for i, (_, kind) in enumerate(domains, 1) if kind == "gravity"][:200]
+    db.executemany(
+        "INSERT INTO addinfo_by_id (id, type, content) VALUES (?, 1, ?)",
+        [(i, domains[d - 1][0]) for i, d in enumerate(cname_targets, 1)],
+    )
+
+    # Devices: one network row per client, a quarter also talk over IPv6
+    client_ips: list[tuple[int, str]] = []
+    for c in range(1, clients + 1):
+        ipv4 = f"10.{c // 65536 % 256}.{c // 256 % 256}.{c % 256}"
+        mac = ":".join(f"{b:02x}" for b in (0x02, c >> 24 & 255, c >> 16 & 255, c >> 8 & 255, c & 255, 0x01))
+        db.execute(
+            "INSERT INTO network VALUES (?, ?, 'eth0', ?, ?, 0, ?, NULL)",
+            (c, mac, start, end, rnd.choice(VENDORS)),
+        )
+        db.execute(
+            "INSERT INTO network_addresses VALUES (?, ?, ?, ?, ?)",
+            (c, ipv4, end, f"device-{c}.lan", end),
+        )
+        client_ips.append((c, ipv4))
+        if c % 4 == 0:
+            ipv6 = f"fd00::{c:x}"
+            db.execute("INSERT INTO network_addresses VALUES (?, ?, ?, NULL, NULL)", (c, ipv6, end))
+            client_ips.append((c, ipv6))
+    db.executemany(
+        "INSERT INTO client_by_id (id, ip, name) VALUES (?, ?, ?)",
+        ((i, ip, f"device-{c}.lan") for i, (c, ip) in enumerate(client_ips, 1)),
+    )
+
+    domain_weights = _weights(len(domains), skew)
+    client_weights = _weights(len(client_ips), 0.8)
+    domain_ids = range(1, len(domains) + 1)
+    client_ids = range(1, len(client_ips) + 1)
+    per_client = [0] * (len(client_ips) + 1)
+    status_counts: dict[int, int] = {}
+
+    def rows():
+        for h, count in enumerate(_hour_counts(queries, days * 24, start)):
+            if not count:
+                continue
+            hour_start = start + h * 3600
+            picked_domains = rnd.choices(domain_ids, cum_weights=domain_weights, k=count)
+            picked_clients = rnd.choices(client_ids, cum_weights=client_weights, k=count)
+            picked_types = rnd.choices(*QUERY_TYPES, k=count)
+            for j in range(count):
+                domain = picked_domains[j]
+                client = picked_clients[j]
+                statuses, weights = STATUS_MIX[domains[domain - 1][1]]
+                status = statuses[0] if len(statuses) == 1 else rnd.choices(statuses, weights)[0]
+                forward = rnd.randint(1, len(UPSTREAMS)) if status == 2 else None
+                addinfo = rnd.randint(1, len(cname_targets)) if status == 9 and cname_targets else None
+                reply_time = round(rnd.uniform(0.005, 0.08), 6) if status == 2 else 0.0001
+                per_client[client] += 1
+                status_counts[status] = status_counts.get(status, 0) + 1
+                yield (
+                    hour_start + j * 3600 // count, picked_types[j], status, domain, client,
+                    forward, addinfo, 4 if status in (2, 3) else 1, reply_time, 0,
+                )
+
+    it = rows()
+    inserted = 0
+    while True:
+        chunk = list(itertools.islice(it, 200_000))
+        if not chunk:
+            break
+        db.executemany(
+            """
+            INSERT INTO query_storage
+                (timestamp, type, status, domain, client, forward, additional_info,
+                 reply_type, reply_time, dnssec)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            chunk,
+        )
+        inserted += len(chunk)
+        print(f"\r  queries: {inserted:,}/{queries:,}", end="", flush=True)
+    print()
+    db.execute("CREATE INDEX idx_queries_timestamps ON query_storage (timestamp)")
+
+    # network.numQueries summed over each device's addresses
+    by_network: dict[int, int] = {}
+    for i, (c, _) in enumerate(client_ips, 1):
+        by_network[c] = by_network.get(c, 0) + per_client[i]
+    db.executemany("UPDATE network SET numQueries = ? WHERE id = ?", [(n, c) for c, n in by_network.items()])
+    blocked = sum(n for s, n in status_counts.items() if s in (1, 4, 5, 6, 7, 8, 9, 10, 11))
+    db.executemany("INSERT INTO counters VALUES (?, ?)", [(0, inserted), (1, blocked)])
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+    return {"queries": inserted, "blocked": blocked, "clients": len(client_ips), "devices": clients}
+
+
+def generate_gravity(path: str, rnd: random.Random, domains: list, extra: int) -> dict:
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    db.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + GRAVITY_SCHEMA)
+    db.executemany("INSERT INTO adlist (address) VALUES (?)", [(a,) for a in ADLISTS])
+
+    def rows():
+        for name, kind in domains:
+            if kind == "gravity":
+                for adlist_id in rnd.sample(range(1, len(ADLISTS) + 1), rnd.randint(1, 3)):
+                    yield name, adlist_id
+        # Bulk of every real blocklist: domains this network never queries
+        for i in range(extra):
+            yield f"tracker{i}.ad-network{i % 4999}.com", rnd.randint(1, len(ADLISTS))
+
+    total = 0
+    it = rows()
+    while True:
+        chunk = list(itertools.islice(it, 200_000))
+        if not chunk:
+            break
+        db.executemany("INSERT INTO gravity (domain, adlist_id) VALUES (?, ?)", chunk)
+        total += len(chunk)
+    db.execute("CREATE INDEX idx_gravity ON gravity (domain, adlist_id)")
+    db.execute(
+        "UPDATE adlist SET number = (SELECT COUNT(*) FROM gravity g WHERE g.adlist_id = adlist.id), "
+        "date_updated = cast(strftime('%s', 'now') as int)"
+    )
+
+    entries = [(1, name, None) for name, kind in domains if kind == "blacklist"]
+    entries += [
+        (0, name, "Allowed for benchmarking")
+        for name, kind in rnd.sample(domains, min(50, len(domains))) if kind == "allowed"
+    ]
+    entries.append((3, r"^track[0-9]+\.metrics[0-9]+\.net$", "Trackers"))
+    entries.append((3, r"(\.|^)doubleclick\.net$", None))
+    db.executemany("INSERT OR IGNORE INTO domainlist (type, domain, comment) VALUES (?, ?, ?)", entries)
+    db.execute("INSERT INTO info (property, value) VALUES ('gravity_count', ?)", (total,))
+    db.commit()
+    db.close()
+    return {"gravity_rows": total, "domainlist": len(entries)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=1_000_000)
+    parser.add_argument("--clients", type=int, default=200, help="Number of devices")
+    parser.add_argument("--domains", type=int, default=50_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of domain popularity")
+    parser.add_argument("--gravity-extra", type=int, default=500_000,
+                        help="Blocklist domains that never show up in queries")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "data"))
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    rnd = random.Random(args.seed)
+    end = int(time.time())
+    started = time.monotonic()
+    domains = _domain_names(rnd, args.domains)
+
+    print(f"Generating pihole-FTL.db ({args.queries:,} queries over {args.days} days)")
+    ftl = generate_ftl(
+        os.path.join(args.out, "pihole-FTL.db"), rnd, args.queries, args.clients,
+        domains, args.days, end, args.skew,
+    )
+    print("Generating gravity.db")
+    gravity = generate_gravity(os.path.join(args.out, "gravity.db"), rnd, domains, args.gravity_extra)
+
+    meta = {
+        "generated_at": end,
+        "seconds": round(time.monotonic() - started, 1),
+        "args": {k: v for k, v in vars(args).items() if k != "out"},
+        "ftl": ftl,
+        "gravity": gravity,
+    }
+    with open(os.path.join(args.out, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    print(json.dumps(meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
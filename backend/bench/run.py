@@ -0,0 +1,304 @@
+"""Drive every read endpoint of a live server against a generated dataset.
+
+Starts uvicorn on the databases written by `bench.generate`, waits for the
+rollup ingester to catch up (unless --no-rollups), then runs each endpoint
+for --duration seconds with --concurrency closed-loop clients and records
+p50/p95/p99 latency, throughput and the server's RSS. Results are written
+to bench/results/ and can be diffed with `bench.compare`.
+
+    python -m bench.run --data bench/data --compare bench/results/<baseline>.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench import compare
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _endpoints(mac: str, domain: str, client: str) -> list[tuple[str, str]]:
+    return [
+        ("stats.dashboard", "/api/stats/dashboard?hours=24&limit=10"),
+        ("stats.summary", "/api/stats/summary?hours=24"),
+        ("stats.top_domains", "/api/stats/top-domains?hours=24&limit=10"),
+        ("stats.top_blocked", "/api/stats/top-blocked?hours=24&limit=10"),
+        ("stats.over_time", "/api/stats/over-time?hours=24"),
+        ("stats.hourly_pattern", "/api/stats/hourly-pattern?days=7"),
+        ("stats.blocklist_effectiveness", "/api/stats/blocklist-effectiveness"),
+        ("stats.summary_7d", "/api/stats/summary?hours=168"),
+        ("devices.list", "/api/devices"),
+        ("devices.list_stats", "/api/devices?include_stats=true"),
+        ("devices.stats", f"/api/devices/{mac}/stats?hours=24"),
+        ("devices.activity", f"/api/devices/{mac}/activity?hours=24"),
+        ("devices.top_domains", f"/api/devices/{mac}/top-domains?hours=24"),
+        ("devices.top_blocked", f"/api/devices/{mac}/top-blocked?hours=24"),
+        ("domains.list", "/api/domains"),
+        ("domains.presets", "/api/domains/presets"),
+        ("timed_blocks.list", "/api/timed-blocks"),
+        ("logs.page1", "/api/logs?page=1&per_page=50"),
+        ("logs.page_deep", "/api/logs?page=200&per_page=50"),
+        ("logs.cursor", "/api/logs?paging=cursor&per_page=50"),
+        ("logs.blocked", "/api/logs?page=1&per_page=50&status=blocked"),
+        ("logs.client", f"/api/logs?page=1&per_page=50&client={client}"),
+        ("logs.domain", f"/api/logs?page=1&per_page=50&domain={domain}"),
+        ("logs.search", f"/api/logs/search?q={domain}"),
+        ("system.metrics", "/api/system/metrics"),
+    ]
+
+
+def _read_rss(pid: int) -> dict:
+    """VmRSS and VmHWM (peak) of `pid` in MB; empty where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            status = f.read()
+    except OSError:
+        return {}
+    values = {}
+    for key in ("VmRSS", "VmHWM"):
+        m = re.search(rf"^{key}:\s+(\d+) kB", status, re.M)
+        if m:
+            values[key] = round(int(m.group(1)) / 1024, 1)
+    return values
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def _run_endpoint(client: httpx.AsyncClient, path: str, pid: int,
+                        concurrency: int, duration: float) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    peak_rss = 0.0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(path)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if not ok:
+                errors += 1
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, _read_rss(pid).get("VmRSS", 0.0))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "peak_rss_mb": peak_rss or None,
+    }
+
+
+async def _wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, rollups: bool,
+                      timeout: float) -> dict:
+    started = time.monotonic()
+    timings = {}
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        if time.monotonic() - started > timeout:
+            raise RuntimeError("Timed out waiting for the server")
+        try:
+            r = await client.get("/api/system/metrics")
+            if r.status_code == 200:
+                timings.setdefault("startup_s", round(time.monotonic() - started, 2))
+                if not rollups or r.json().get("rollups", {}).get("caught_up"):
+                    timings["ready_s"] = round(time.monotonic() - started, 2)
+                    return timings
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+
+
+async def _sample_values(client: httpx.AsyncClient) -> tuple[str, str, str]:
+    """A real device MAC, a popular domain and a client IP to parameterise paths."""
+    devices = (await client.get("/api/devices")).json()
+    device = max(devices, key=lambda d: d.get("num_queries") or 0)
+    top = (await client.get("/api/stats/top-domains?hours=24&limit=1")).json()
+    domain = top[0]["domain"] if top else "example.com"
+    # A substring shared by many domains is the expensive case for search
+    domain = domain.split(".", 1)[-1][:8] if "." in domain else domain
+    return device["mac"], domain, device.get("ip") or ""
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    meta_path = os.path.join(args.data, "meta.json")
+    dataset = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            dataset = json.load(f)
+        age_h = (time.time() - dataset.get("generated_at", time.time())) / 3600
+        if age_h > 12:
+            print(f"warning: dataset is {age_h:.0f}h old; 24h windows will be mostly empty")
+
+    workdir = tempfile.mkdtemp(prefix="pihole-dash-bench-")
+    env = {
+        **os.environ,
+        "PIHOLE_DASH_FTL_DB_PATH": os.path.abspath(os.path.join(args.data, "pihole-FTL.db")),
+        "PIHOLE_DASH_GRAVITY_DB_PATH": os.path.abspath(os.path.join(args.data, "gravity.db")),
+        "PIHOLE_DASH_DASHBOARD_DB_PATH": os.path.join(workdir, "dashboard.db"),
+        "PIHOLE_DASH_STATIC_DIR": os.path.join(workdir, "no-static"),
+        # Read-only benchmark: never touch a real Pi-hole
+        "PIHOLE_DASH_PIHOLE_COMMAND": "true",
+        "PIHOLE_DASH_USE_SUDO": "false",
+        "PIHOLE_DASH_ROLLUPS_ENABLED": "true" if args.rollups else "false",
+    }
+    if args.cold:
+        # Every request misses the stats cache (concurrent misses still coalesce)
+        env.update({
+            "PIHOLE_DASH_STATS_CACHE_TTL": "0",
+            "PIHOLE_DASH_HEAVY_CACHE_TTL": "0",
+            "PIHOLE_DASH_LOG_COUNT_CACHE_TTL": "0",
+            "PIHOLE_DASH_CACHE_STALE_TTL": "0",
+        })
+
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            print(f"Starting server (rollups {'on' if args.rollups else 'off'})")
+            startup = await _wait_ready(client, proc, args.rollups, args.ready_timeout)
+            startup["idle_rss_mb"] = _read_rss(proc.pid).get("VmRSS")
+            print(f"  ready in {startup['ready_s']}s")
+
+            endpoints = _endpoints(*await _sample_values(client))
+            if args.only:
+                endpoints = [(name, path) for name, path in endpoints if re.search(args.only, name)]
+
+            results = {}
+            for name, path in endpoints:
+                if args.warmup:
+                    await client.get(path)
+                result = await _run_endpoint(client, path, proc.pid, args.concurrency, args.duration)
+                results[name] = result
+                print(
+                    f"  {name:32} {result['throughput_rps']:>8.1f} req/s  "
+                    f"p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  "
+                    f"p99 {result['p99_ms']:>8.2f} ms"
+                    + (f"  {result['errors']} errors" if result["errors"] else "")
+                )
+            rss = _read_rss(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    return {
+        "created_at": int(time.time()),
+        "commit": _git_commit(),
+        "label": args.label,
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "options": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "rollups": args.rollups,
+            "cold": args.cold,
+            "warmup": args.warmup,
+        },
+        "dataset": dataset,
+        "startup": startup,
+        "peak_rss_mb": rss.get("VmHWM"),
+        "endpoints": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(os.path.dirname(__file__), "data"))
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per endpoint")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument("--ready-timeout", type=float, default=1800.0,
+                        help="Seconds to wait for startup and rollup backfill")
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false")
+    parser.add_argument("--cold", action="store_true", help="Disable stats caching")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false")
+    parser.add_argument("--only", help="Regex over endpoint names, e.g. '^logs\\.'")
+    parser.add_argument("--label", help="Free-form note stored with the results")
+    parser.add_argument("--out", help="Results file (default: bench/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(result["created_at"]))
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit'] or 'nogit'}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Peak RSS {result['peak_rss_mb']} MB; results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare.print_diff(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import asyncio
+
+from app.services.cache import AsyncCache, _sizeof
+
+
+def _rows(n):
+    return [{"domain": f"d{i}.example", "count": i} for i in range(n)]
+
+
+def test_oversized_value_is_not_stored():
+    cache = AsyncCache("test", max_entries=100, max_bytes=10_000, stale_ttl=0)
+
+    async def run():
+        for i in range(5):
+            await cache.get_or_load(f"small:{i}", 60, lambda: asyncio.sleep(0, _rows(3)))
+        value = await cache.get_or_load("big", 60, lambda: asyncio.sleep(0, _rows(500)))
+        assert len(value) == 500
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["entries"] == 5
+    assert stats["evictions"] == 0
+    assert stats["oversized"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_sizeof_scales_a_sample():
+    small, large = _sizeof(_rows(100)), _sizeof(_rows(10_000))
+    assert 90 < large / small < 110
@@ -0,0 +1,28 @@
+import re
+
+from app.services import gravity_match
+from app.services.gravity_match import _Regexes
+
+
+def _entries():
+    return [
+        {"id": 2, "domain": "bar", "enabled": 1},
+        {"id": 1, "domain": "(?i)foo", "enabled": 1},
+    ]
+
+
+def test_inline_flags_are_matched_separately():
+    regexes = _Regexes(_entries())
+    assert [e["id"] for e, _ in regexes.separate] == [1]
+    assert regexes.first("FOO.example")["id"] == 1
+    assert regexes.first("bar.example")["id"] == 2
+    assert regexes.first("baz.example") is None
+
+
+def test_combined_compile_failure_falls_back(monkeypatch):
+    monkeypatch.setattr(gravity_match, "_NOT_COMBINABLE", re.compile(r"(?!)"))
+    regexes = _Regexes(_entries())
+    assert regexes.combined is None
+    assert regexes.first("foo.example")["id"] == 1
+    assert regexes.first("bar.example")["id"] == 2
+    assert [e["id"] for e in regexes.all("foobar")] == [2, 1]
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from app.services import scheduler
+
+
+def _block(block_id, domain, expires_at=100):
+    return {"id": block_id, "domain": domain, "created_at": 0, "expires_at": expires_at}
+
+
+@pytest.fixture(autouse=True)
+def _clean(monkeypatch):
+    monkeypatch.setattr(scheduler, "_active_blocks", {})
+    monkeypatch.setattr(scheduler, "_heap", [])
+    monkeypatch.setattr(scheduler, "_lock", asyncio.Lock())
+
+
+def test_failed_expiry_is_retried(monkeypatch):
+    removed, deactivated = [], []
+
+    async def apply_domain_batch(changes):
+        removed.extend(c["domain"] for c in changes)
+        return {"results": [{"domain": c["domain"], "ok": True} for c in changes]}
+
+    async def failing_deactivate(ids):
+        raise OSError("database is locked")
+
+    async def deactivate(ids):
+        deactivated.extend(ids)
+
+    monkeypatch.setattr(scheduler.pihole, "apply_domain_batch", apply_domain_batch)
+    monkeypatch.setattr(scheduler.device_db, "deactivate_timed_blocks", failing_deactivate)
+    scheduler._schedule(_block("a", "ads.example"))
+
+    with pytest.raises(OSError):
+        asyncio.run(scheduler._expire_blocks(scheduler._pop_due(100)))
+    assert "a" in scheduler._active_blocks
+
+    monkeypatch.setattr(scheduler.device_db, "deactivate_timed_blocks", deactivate)
+    asyncio.run(scheduler._expire_blocks(scheduler._pop_due(100)))
+    assert scheduler._active_blocks == {}
+    assert removed == ["ads.example", "ads.example"]
+    assert deactivated == ["a"]
+
+
+def test_domain_still_covered_stays_blocked(monkeypatch):
+    removed = []
+
+    async def apply_domain_batch(changes):
+        removed.extend(c["domain"] for c in changes)
+        return {"results": []}
+
+    async def deactivate(ids):
+        pass
+
+    monkeypatch.setattr(scheduler.pihole, "apply_domain_batch", apply_domain_batch)
+    monkeypatch.setattr(scheduler.device_db, "deactivate_timed_blocks", deactivate)
+    scheduler._schedule(_block("a", "ads.example"))
+    scheduler._schedule(_block("b", "ads.example", expires_at=200))
+
+    asyncio.run(scheduler._expire_blocks(scheduler._pop_due(100)))
+    assert removed == []
+    assert list(scheduler._active_blocks) == ["b"]
@@ -14,18 +14,22 @@ async function request(path, options = {}) {
 
 export const api = {
   // Dashboard
+  // Series come back as columns ({ bucket: [...], blocked: [...], allowed: [...] })
+  getDashboard: (hours = 24, limit = 10) => request(`/api/stats/dashboard?hours=${hours}&limit=${limit}&format=columns`),
   getSummary: (hours = 24) => request(`/api/stats/summary?hours=${hours}`),
   getTopDomains: (limit = 10, hours = 24) => request(`/api/stats/top-domains?limit=${limit}&hours=${hours}`),
   getTopBlocked: (limit = 10, hours = 24) => request(`/api/stats/top-blocked?limit=${limit}&hours=${hours}`),
-  getOverTime: (hours = 24) => request(`/api/stats/over-time?hours=${hours}`),
+  getOverTime: (hours = 24) => request(`/api/stats/over-time?hours=${hours}&format=columns`),
   getHourlyPattern: (days = 7) => request(`/api/stats/hourly-pattern?days=${days}`),
   getBlocklistEffectiveness: () => request('/api/stats/blocklist-effectiveness'),
+  openStream: () => new EventSource(`${BASE}/api/stream`),
 
   // Devices
-  getDevices: () => request('/api/devices'),
+  getDevices: (includeStats = false) => request(`/api/devices${includeStats ? '?include_stats=true' : ''}`),
   updateDevice: (mac, data) => request(`/api/devices/${mac}`, { method: 'PATCH', body: JSON.stringify(data) }),
   getDeviceStats: (mac, hours = 24) => request(`/api/devices/${mac}/stats?hours=${hours}`),
-  getDeviceActivity: (mac, hours = 24) => request(`/api/devices/${mac}/activity?hours=${hours}`),
+  getDeviceActivity: (mac, hours = 24) => request(`/api/devices/${mac}/activity?hours=${hours}&format=columns`),
+  getDeviceHourlyPattern: (mac, days = 7) => request(`/api/devices/${mac}/hourly-pattern?days=${days}`),
   getDeviceTopDomains: (mac, limit = 10) => request(`/api/devices/${mac}/top-domains?limit=${limit}`),
   getDeviceTopBlocked: (mac, limit = 10) => request(`/api/devices/${mac}/top-blocked?limit=${limit}`),
 
@@ -33,8 +37,12 @@ export const api = {
   getDomains: (type) => request(`/api/domains${type ? `?type=${type}` : ''}`),
   addDomain: (data) => request('/api/domains', { method: 'POST', body: JSON.stringify(data) }),
   deleteDomain: (id) => request(`/api/domains/${id}`, { method: 'DELETE' }),
+  // operations: [{ action: 'add' | 'remove', domain, type, comment }]
+  batchDomains: (operations) => request('/api/domains/batch', { method: 'POST', body: JSON.stringify({ operations }) }),
   toggleDomain: (id, enabled) => request(`/api/domains/${id}`, { method: 'PATCH', body: JSON.stringify({ enabled }) }),
   getPresets: () => request('/api/domains/presets'),
+  explainDomain: (domain) => request(`/api/domains/explain?domain=${encodeURIComponent(domain)}`),
+  evaluateDomains: (entries, days = 7) => request('/api/domains/evaluate', { method: 'POST', body: JSON.stringify({ entries, days }) }),
 
   // Timed Blocks
   getTimedBlocks: () => request('/api/timed-blocks'),